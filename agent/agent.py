@@ -1,7 +1,29 @@
-import psutil, requests, time, glob, os
+import psutil, requests, time, glob, os, socket, json, gzip, threading
+from collections import deque
+from itertools import islice
+from requests.adapters import HTTPAdapter
 from gpiozero import PWMOutputDevice
 
 MASTER_URL = "http://192.168.0.10:5000/report"
+# Identifica este Pi no Master (vários agentes podem reportar ao mesmo tempo)
+NODE_ID = os.environ.get("NODE_ID") or socket.gethostname()
+
+# Leitura a cada SAMPLE_INTERVAL s; cada janela de WINDOW s vira um report com mín/média/máx
+SAMPLE_INTERVAL, WINDOW = 1.0, 5.0
+# A ventoinha reage a cada FAN_INTERVAL s, sem esperar pela rede; leitura mais velha que FAN_STALE = falha
+FAN_INTERVAL, FAN_STALE = 1.0, 10.0
+
+# Janelas ainda não aceites pelo Master (12 h a cada 5 s); cheia, descarta as mais antigas
+SPOOL_MAX = 8640
+# Janelas por pedido ao reenviar o atraso (o Master aceita até 2000)
+BATCH_MAX = 500
+# (seq, payload): o seq diz ao uploader o que já foi aceite mesmo que o sampler descarte entretanto
+spool, spool_lock, spool_seq = deque(maxlen=SPOOL_MAX), threading.Lock(), 0
+window_ready = threading.Event()
+
+# Uma só conexão keep-alive para o Master em vez de um TCP novo a cada 5 s
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
 
 def get_fan_device():
     """Inicialização resiliente para RPi 5."""
@@ -45,8 +67,9 @@ def get_temp_sensor():
 active_sensor_path = get_temp_sensor()
 # -------------------------------------------------
 
-fan_temp_min, fan_temp_max = 35.0, 50.0
-node_permission = "none"
+# Estado partilhado entre as threads: cada um é um tuplo trocado inteiro, nunca alterado no lugar
+policy = ("none", 35.0, 50.0)      # (fan_node, fan_temp_min, fan_temp_max) vindos do Master
+last_rack = (None, 0.0)            # (temperatura do rack, time.time() da leitura)
 
 def get_core_temp():
     """Extrai a temperatura interna do SoC do Slave."""
@@ -68,8 +91,7 @@ def get_rack_temp():
             return float(lines[1][lines[1].find('t=')+2:]) / 1000.0
     except: return None
 
-def update_fan_speed(current_temp):
-    global fan_temp_min, fan_temp_max
+def update_fan_speed(current_temp, fan_temp_min, fan_temp_max):
     if not fan: return
     
     # Se a leitura do sensor falhar (None ou 0.0), gira em 100% por segurança
@@ -89,52 +111,95 @@ def update_fan_speed(current_temp):
         ramp = (current_temp - fan_temp_min) / (fan_temp_max - fan_temp_min)
         fan.value = 0.2 + (0.8 * ramp)
 
+def post_samples(batch):
+    """Uma amostra vai em JSON simples; o atraso vai num só pedido {"node", "samples"} em gzip."""
+    if len(batch) == 1:
+        return session.post(MASTER_URL, json=dict(batch[0], node=NODE_ID), timeout=5)
+    body = gzip.compress(json.dumps({"node": NODE_ID, "samples": batch}, separators=(',', ':')).encode('utf-8'))
+    return session.post(MASTER_URL, data=body, timeout=15,
+                        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+def upload_spool():
+    """Envia o spool em ordem; devolve a última resposta do Master ou None se ele não respondeu."""
+    conf = None
+    while True:
+        with spool_lock: batch = list(islice(spool, BATCH_MAX))
+        if not batch: return conf
+        try: r = post_samples([p for _, p in batch])
+        except Exception as e:
+            print(f"✗ Falha na comunicação ({len(spool)} janelas em espera): {e}"); return conf
+        if r.status_code == 400:
+            # Lote recusado não se corrige reenviando: descarta para não travar o spool
+            print(f"✗ Lote recusado pelo Master: {r.text[:200]}")
+        elif r.status_code != 200:
+            print(f"✗ Master respondeu {r.status_code} ({len(spool)} janelas em espera)"); return conf
+        else: conf = r.json()
+        with spool_lock:
+            while spool and spool[0][0] <= batch[-1][0]: spool.popleft()
+        if len(batch) > 1: print(f"✓ Reenviadas {len(batch)} janelas atrasadas")
+
+def summarize(acc, start, end):
+    """Fecha a janela: campos de sempre com a média (o Master antigo continua a entender) + agg."""
+    agg = {k: [round(min(v), 2), round(sum(v) / len(v), 2), round(max(v), 2)] for k, v in acc.items() if v}
+    avg = lambda k, default=0.0: agg[k][1] if k in agg else default
+    return {"ts": end, "window": round(end - start, 2), "cpu": avg("cpu"), "ram": avg("ram"), "temp": avg("temp"),
+            "core_temp": avg("core_temp"), "fan": int(fan.value * 100) if fan else 0,
+            "net_down": avg("net_down"), "net_up": avg("net_up"), "agg": agg}
+
+def sampler():
+    """Lê tudo a cada SAMPLE_INTERVAL e fecha uma janela a cada WINDOW segundos."""
+    global last_rack, spool_seq
+    last_io, last_t = psutil.net_io_counters(), time.monotonic()
+    psutil.cpu_percent()  # a primeira chamada só marca o início da medição
+    acc, start, next_tick = {}, time.time(), time.monotonic()
+    while True:
+        next_tick += SAMPLE_INTERVAL
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+        try:
+            rack = get_rack_temp()
+            last_rack = (rack, time.time())
+            io_now, t_now = psutil.net_io_counters(), time.monotonic()
+            dt = t_now - last_t
+            values = {"cpu": psutil.cpu_percent(), "ram": psutil.virtual_memory().percent, "temp": rack, "core_temp": get_core_temp(),
+                      "net_down": (io_now.bytes_recv - last_io.bytes_recv) / dt / 1024 if dt > 0 else None,
+                      "net_up": (io_now.bytes_sent - last_io.bytes_sent) / dt / 1024 if dt > 0 else None}
+            last_io, last_t = io_now, t_now
+            for k, v in values.items():
+                if v is not None: acc.setdefault(k, []).append(v)
+        except Exception as e: print(f"✗ Falha na leitura: {e}")
+        now = time.time()
+        if now - start >= WINDOW:
+            with spool_lock:
+                spool_seq += 1; spool.append((spool_seq, summarize(acc, start, now)))
+            acc, start = {}, now
+            window_ready.set()
+
+def fan_loop():
+    """Controle local a partir da última permissão do Master; sem Master mantém a última recebida."""
+    while True:
+        permission, t_min, t_max = policy
+        temp, ts = last_rack
+        if permission == "slave":
+            # Leitura velha conta como falha do sensor: update_fan_speed põe 100%
+            update_fan_speed(temp if time.time() - ts < FAN_STALE else None, t_min, t_max)
+        elif fan: fan.value = 0.0
+        time.sleep(FAN_INTERVAL)
+
+def uploader():
+    """Envia cada janela fechada; a rede lenta ou em baixo não atrasa o sampler nem a ventoinha."""
+    global policy
+    while True:
+        window_ready.wait(); window_ready.clear()
+        conf = upload_spool()
+        if conf:
+            policy = (conf.get('fan_node', 'none'), float(conf.get('fan_temp_min', 35.0)), float(conf.get('fan_temp_max', 50.0)))
+
 print(f"Agente V4.7.1 iniciado. Pino Ativo: {active_pin}")
 
-last_net_io = psutil.net_io_counters()
-last_net_time = time.time()
+for target in (sampler, fan_loop, uploader):
+    threading.Thread(target=target, name=target.__name__, daemon=True).start()
 
 try:
-    while True:
-        temp_rack = get_rack_temp()
-        temp_core = get_core_temp()
-        report_temp_rack = temp_rack if temp_rack is not None else 0.0
-
-        now = time.time()
-        io_now = psutil.net_io_counters()
-        dt = now - last_net_time
-        if dt > 0:
-            net_down = (io_now.bytes_recv - last_net_io.bytes_recv) / dt / 1024
-            net_up = (io_now.bytes_sent - last_net_io.bytes_sent) / dt / 1024
-        else: net_down, net_up = 0.0, 0.0
-        last_net_io, last_net_time = io_now, now
-
-        payload = {
-            "cpu": psutil.cpu_percent(), 
-            "ram": psutil.virtual_memory().percent, 
-            "temp": report_temp_rack, 
-            "core_temp": temp_core,
-            "fan": int(fan.value * 100) if fan else 0,
-            "net_down": net_down,
-            "net_up": net_up
-        }
-        
-        try:
-            r = requests.post(MASTER_URL, json=payload, timeout=2)
-            if r.status_code == 200:
-                conf = r.json()
-                fan_temp_min = float(conf.get('fan_temp_min', 35.0))
-                fan_temp_max = float(conf.get('fan_temp_max', 50.0))
-                node_permission = conf.get('fan_node', 'none')
-        except Exception as e:
-            print(f"✗ Falha na comunicação: {e}"); node_permission = "none"
-
-        # Controle local baseado na permissão do Master
-        if node_permission == "slave":
-            update_fan_speed(temp_rack)
-        else:
-            if fan: fan.value = 0.0
-        
-        time.sleep(5)
+    while True: time.sleep(3600)
 except KeyboardInterrupt:
-    if fan: fan.value = 1.0 # Garante ventilação ao encerrar o script
\ No newline at end of file
+    if fan: fan.value = 1.0 # Garante ventilação ao encerrar o script
@@ -7,12 +7,25 @@ FBINK="/mnt/us/extensions/kindleberry/fbink"
 
 # Definição de URLs baseadas na estrutura do repositório
 URL_BASE="http://$IP_RPI:$PORT"
-IMG_URL="$URL_BASE/dashboard.png"
-STATUS_URL="$URL_BASE/check_status"
+# Long-poll: o servidor segura o pedido até o frame mudar, o STOP ser ativado ou passar WAIT_TIMEOUT
+WAIT_URL="$URL_BASE/wait"
+WAIT_TIMEOUT=120
 
 OUTPUT="/tmp/dashboard.png"
 HEADERS="/tmp/dash.headers"
 
+# Identificador do cliente para o refresh parcial (o servidor guarda o último frame enviado a cada um)
+CID=$(cat /proc/usid 2>/dev/null || hostname)
+# Codificação: png4 (16 cinzas do painel, ~30% menor), png ou pgm (cru, sem descompressão; bom para regiões parciais em rede rápida)
+# Vazio = usa o formato do perfil deste Kindle no servidor (config "devices", ver /api/devices)
+FORMAT=""
+# Intervalo entre atualizações; o servidor pode mudá-lo por perfil (header X-Refresh)
+INTERVAL=10
+# Última versão de frame recebida (-1 = nenhuma; o servidor responde logo)
+VERSION_SEEN=-1
+# 1 = pede o frame inteiro (primeiro contacto e depois de uma falha, o ecrã pode estar dessincronizado)
+FORCE_FULL=1
+
 # --- Inicialização ---
 echo "Iniciando integração Kindleberry..."
 lipc-set-prop com.lab126.powerd preventScreenSaver 1
@@ -22,41 +35,67 @@ lipc-set-prop com.lab126.cmd wirelessEnable 1
 $FBINK -c -f -m -q "Kindleberry $VERSION: Ligando ao Servidor..."
 
 while true; do
-    # 1. Verifica Status (Integração com a rota /check_status do projeto)
-    STATUS=$(wget -q -T 5 -t 1 -O - "$STATUS_URL")
-
-    if [ "$STATUS" == "STOP" ]; then
-        echo "Comando STOP recebido. Desligando sistema..."
-        $FBINK -c -f -m -q "Encerrando Kindleberry..."
-        sleep 2
-        lipc-set-prop com.lab126.powerd preventScreenSaver 0
-        lipc-set-prop com.lab126.powerd powerOff 1
-        exit 0
-    fi
-
-    # 2. Coleta de Bateria (Ajustado para o firmware: battLevel)
+    # 1. Coleta de Bateria (Ajustado para o firmware: battLevel)
     BAT=$(lipc-get-prop com.lab126.powerd battLevel)
     if [ -z "$BAT" ]; then BAT=0; fi
 
-    # 3. Download da Imagem (Compatível com o parâmetro ?kbat esperado pelo server)
-    if curl -s -L -D "$HEADERS" -o "$OUTPUT" "$IMG_URL?kbat=$BAT"; then
-        
-        # 4. Renderização (FBInk é mais rápido que o eips padrão do repo)
-        $FBINK -g file="$OUTPUT" -c -q
+    # 2. Espera pela próxima mudança e recebe só o que mudou, num só pedido
+    #    (X-Status: RUN | STOP, X-Frame-Mode: full | partial | none, X-Region: x,y,w,h)
+    HTTP_CODE=$(curl -s -L -m $((WAIT_TIMEOUT + 15)) -D "$HEADERS" -o "$OUTPUT" -w "%{http_code}" \
+        "$WAIT_URL?v=$VERSION_SEEN&timeout=$WAIT_TIMEOUT&frame=1&kbat=$BAT&cid=$CID&full=$FORCE_FULL${FORMAT:+&format=$FORMAT}")
+    if [ "$HTTP_CODE" = "200" ] || [ "$HTTP_CODE" = "204" ]; then
+        FORCE_FULL=0
+        STATUS=$(grep -i "X-Status:" "$HEADERS" | awk '{print $2}' | tr -d '\r' | tr -d '[:space:]')
+        if [ "$STATUS" = "STOP" ]; then
+            echo "Comando STOP recebido. Desligando sistema..."
+            $FBINK -c -f -m -q "Encerrando Kindleberry..."
+            sleep 2
+            lipc-set-prop com.lab126.powerd preventScreenSaver 0
+            lipc-set-prop com.lab126.powerd powerOff 1
+            exit 0
+        fi
+        NEW_VERSION=$(grep -i "X-Frame-Version:" "$HEADERS" | awk '{print $2}' | tr -d '\r' | tr -d '[:space:]')
+        if [ -n "$NEW_VERSION" ]; then VERSION_SEEN="$NEW_VERSION"; fi
+        MODE=$(grep -i "X-Frame-Mode:" "$HEADERS" | awk '{print $2}' | tr -d '\r' | tr -d '[:space:]')
+        REGION=$(grep -i "X-Region:" "$HEADERS" | awk '{print $2}' | tr -d '\r' | tr -d '[:space:]')
+        RX=$(echo "$REGION" | cut -d, -f1)
+        RY=$(echo "$REGION" | cut -d, -f2)
+
+        # 3. Renderização (FBInk é mais rápido que o eips padrão do repo)
+        if [ "$MODE" = "partial" ]; then
+            # Blit da região no offset certo, sem limpar o ecrã (refresh parcial)
+            $FBINK -g file="$OUTPUT",x="$RX",y="$RY" -q
+        elif [ "$HTTP_CODE" = "200" ]; then
+            $FBINK -g file="$OUTPUT" -c -q
+        fi
         
-        # 5. Sincronização de Brilho (Opcional - via Header HTTP)
+        # 4. Sincronização de Brilho (Opcional - via Header HTTP)
         NEW_BRIGHT=$(grep -i "X-Brightness:" "$HEADERS" | awk '{print $2}' | tr -d '\r' | tr -d '[:space:]')
         if [ "$NEW_BRIGHT" != "" ]; then
             lipc-set-prop com.lab126.powerd flIntensity "$NEW_BRIGHT"
         fi
+        NEW_REFRESH=$(grep -i "X-Refresh:" "$HEADERS" | awk '{print $2}' | tr -d '\r' | tr -d '[:space:]')
+        if [ "$NEW_REFRESH" -gt 0 ] 2>/dev/null; then INTERVAL="$NEW_REFRESH"; fi
 
-        echo "[$(date +%H:%M:%S)] Dashboard Atualizado (Bat: $BAT%)"
+        echo "[$(date +%H:%M:%S)] Dashboard Atualizado (${MODE:-full} $REGION, Bat: $BAT%)"
+        # Sem mudanças não há o que esperar: o próximo long-poll já fica estacionado no servidor
+        if [ "$MODE" = "none" ]; then continue; fi
+    elif [ "$HTTP_CODE" = "503" ]; then
+        # Servidor com o limite de Kindles em espera: volta só depois do Retry-After
+        RETRY=$(grep -i "Retry-After:" "$HEADERS" | awk '{print $2}' | tr -d '\r' | tr -d '[:space:]')
+        if ! [ "$RETRY" -gt 0 ] 2>/dev/null; then RETRY="$INTERVAL"; fi
+        echo "[$(date +%H:%M:%S)] Servidor ocupado. Nova tentativa em ${RETRY}s."
+        sleep "$RETRY"
+        continue
     else
+        # Qualquer outra resposta (000 = sem rede, 500...) cai no sleep do fim do ciclo
+        FORCE_FULL=1
         echo "[$(date +%H:%M:%S)] Falha de rede. Servidor $IP_RPI inacessível."
         $FBINK -m -q "Erro: Sem ligação ao servidor"
         lipc-set-prop com.lab126.cmd wirelessEnable 1
+        VERSION_SEEN=-1
     fi
 
-    # O projeto zanivann sugere intervalos de 10s a 60s
-    sleep 10
+    # Intervalo mínimo entre redesenhos do e-ink (o projeto zanivann sugere 10s a 60s)
+    sleep "$INTERVAL"
 done
\ No newline at end of file
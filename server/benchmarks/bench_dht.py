@@ -0,0 +1,61 @@
+"""Leituras do DHT22 nos modos edge e poll do DHTReader: taxa de sucesso, tempo e CPU por leitura.
+
+Uso: python benchmarks/bench_dht.py [--reads 20] [--jitter 5] [--replay tramas.json]
+     python benchmarks/bench_dht.py --chip /dev/gpiochip4 --line 17 [--reads 20] [--record tramas.json]
+
+Sem --chip usa a FakeDHTLine de benchmarks/fakes.py com tramas sintéticas (ruído de --jitter µs
+em cada pulso) ou gravadas (--replay); a trama corre em tempo real, então o busy-wait do modo poll
+sofre o jitter do interpretador como no Pi. Com --chip lê o sensor de verdade (respeitando os 2 s
+entre leituras; pare o servidor antes) e --record guarda as tramas do modo edge para --replay."""
+import argparse, json, os, sys, time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dht_reader import DHTReader
+from fakes import FakeDHTLine, dht22_frame
+
+def frames(args):
+    if args.replay:
+        with open(args.replay) as f: return [[(bool(r), int(t)) for r, t in fr] for fr in json.load(f)]
+    return [dht22_frame(45 + i % 20, 18 + (i % 50) / 10, args.jitter, seed=i) for i in range(args.reads)]
+
+def run(mode, args, recorded):
+    results, wall, cpu = Counter(), [], []
+    fake = None if args.chip else frames(args)
+    for i in range(args.reads):
+        factory = FakeDHTLine(fake[i % len(fake)], offset=args.line) if fake else None
+        reader = DHTReader('DHT22', args.chip or '/dev/null', args.line, mode=mode, request_factory=factory)
+        if fake: reader._last_called = 0
+        else: time.sleep(DHTReader._SENSOR_MIN_DELAY['DHT22'])
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            reader.read_data(); results['ok'] += 1
+            if mode == 'edge' and reader.last_edges:
+                first = reader.last_edges[0][1]
+                recorded.append([(r, t - first + 30_000) for r, t in reader.last_edges])
+        except Exception as e: results[type(e).__name__] += 1
+        wall.append(time.perf_counter() - t0); cpu.append(time.process_time() - c0)
+    n = args.reads
+    print(f"{mode:5}: {results['ok']}/{n} ok ({results['ok'] / n:.0%}), "
+          f"{sum(wall) / n * 1000:.1f} ms/leitura, CPU {sum(cpu) / n * 1000:.2f} ms/leitura, "
+          f"erros {dict((k, v) for k, v in results.items() if k != 'ok') or '-'}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--reads', type=int, default=20)
+    ap.add_argument('--jitter', type=float, default=5.0, help="µs de ruído por pulso nas tramas sintéticas")
+    ap.add_argument('--replay', help="JSON com tramas [[subida?, ns], ...] gravadas com --record")
+    ap.add_argument('--chip', help="chip GPIO para ler o sensor de verdade (ex.: /dev/gpiochip4)")
+    ap.add_argument('--line', type=int, default=17)
+    ap.add_argument('--record', help="com --chip, grava as tramas do modo edge neste JSON")
+    ap.add_argument('--modes', default="edge,poll")
+    args = ap.parse_args()
+    recorded = []
+    for mode in args.modes.split(","): run(mode, args, recorded)
+    if args.record and recorded:
+        with open(args.record, 'w') as f: json.dump(recorded, f)
+        print(f"{len(recorded)} tramas gravadas em {args.record}")
+
+if __name__ == '__main__':
+    main()
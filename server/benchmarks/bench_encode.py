@@ -0,0 +1,58 @@
+"""Benchmark das codificações do /dashboard.png: bytes, tempo de codificação e latência estimada.
+
+Uso: python benchmarks/bench_encode.py [--repeat 5] [--kbps 2000] [--decode-factor 8]
+
+A latência ponta a ponta estimada soma: codificação no servidor + transferência ao débito
+dado + descodificação. A descodificação é medida aqui e multiplicada por --decode-factor
+para aproximar o ARM do Kindle; o PGM não tem descompressão (só lê o cabeçalho)."""
+import argparse, io, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image
+import renderer
+
+SAMPLE = {
+    "theme": "light", "font_size": 120, "rotation": 1, "clock": "12:34", "date": "Sábado, 18/10", "city": "Sao Paulo",
+    "label_main": "Int", "label_ext": "Ext", "sensor_ext": "ds18", "v1": "23.4", "v2": "19.0", "hum": "55.0",
+    "cond": "Parcialmente nublado", "icon": None, "ip": "192.168.0.10", "rack_t": "31.0", "fan_p": "40", "s_act": True,
+    "m_cpu": 37, "m_ram": 52, "m_net": tuple((i * 3.0, i * 1.5) for i in range(120)),
+    "s_cpu": 12, "s_ram": 33, "s_net": tuple((i * 2.0, 50.0) for i in range(120)), "nodes": (1, 1, "slave"),
+    "moon_icon": "moon_full", "moon_label": "Cheia",
+}
+
+def best_ms(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn()
+        dt = (time.perf_counter() - t0) * 1000
+        best = dt if best is None else min(best, dt)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--kbps', type=float, default=2000, help="débito efetivo do Wi-Fi do Kindle em kbit/s")
+    ap.add_argument('--decode-factor', type=float, default=8, help="quantas vezes o Kindle é mais lento a descodificar")
+    args = ap.parse_args()
+
+    frame, box, _ = renderer.LayeredRenderer().render(SAMPLE)
+    renderer.draw_overlay(frame, box, SAMPLE['theme'], "88")
+    angle = {1: 90, 2: 180, 3: 270}.get(SAMPLE['rotation'], 0)
+    rot_old = best_ms(lambda: frame.rotate(angle, expand=True), args.repeat)
+    rot_new = best_ms(lambda: renderer.rotate_frame(frame, SAMPLE['rotation']), args.repeat)
+    print(f"rotação: rotate(expand=True) {rot_old:.2f} ms  ->  transpose {rot_new:.2f} ms")
+
+    rotated = renderer.rotate_frame(frame, SAMPLE['rotation'])
+    print(f"{'formato':<14}{'bytes':>10}{'codif. ms':>11}{'decod. ms':>11}{'rede ms':>10}{'total ms':>10}")
+    for fmt, dither in [('png', False), ('png4', False), ('png4', True), ('pgm', False)]:
+        data = renderer.encode_frame(rotated, fmt, dither)
+        enc = best_ms(lambda: renderer.encode_frame(rotated, fmt, dither), args.repeat)
+        if fmt == 'pgm': dec = best_ms(lambda: Image.frombuffer('L', rotated.size, data[-rotated.size[0] * rotated.size[1]:], 'raw', 'L', 0, 1), args.repeat)
+        else: dec = best_ms(lambda: Image.open(io.BytesIO(data)).load(), args.repeat)
+        net = len(data) * 8 / args.kbps
+        total = rot_new + enc + net + dec * args.decode_factor
+        name = fmt + (" +dither" if dither else "")
+        print(f"{name:<14}{len(data):>10}{enc:>11.1f}{dec:>11.2f}{net:>10.1f}{total:>10.1f}")
+
+if __name__ == '__main__':
+    main()
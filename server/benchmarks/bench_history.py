@@ -0,0 +1,87 @@
+"""Benchmark da preparação das séries do /history: linhas sqlite3.Row vs colunas vetorizadas.
+
+Uso: python benchmarks/bench_history.py [--rows 259200] [--repeat 3]
+(259200 linhas = 30 dias a uma leitura a cada 10 s)"""
+import argparse, datetime, os, random, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import history
+from telemetry import TELEMETRY_COLUMNS
+
+def build_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE telemetry (id INTEGER PRIMARY KEY AUTOINCREMENT, ts DATETIME, " + ", ".join(f"{c} REAL" for c in TELEMETRY_COLUMNS) + ")")
+    conn.execute("CREATE INDEX idx_telemetry_ts ON telemetry(ts)")
+    t0, rnd, temp = datetime.datetime(2026, 1, 1), random.Random(42), 30.0
+    def row(i):
+        nonlocal temp
+        temp += rnd.uniform(-0.3, 0.3)
+        vals = [rnd.uniform(0, 100) for _ in TELEMETRY_COLUMNS]
+        for j, c in enumerate(TELEMETRY_COLUMNS):
+            if c in history.TEMP_COLUMNS: vals[j] = -127.0 if rnd.random() < 0.002 else temp
+        return ((t0 + datetime.timedelta(seconds=10 * i)).strftime("%Y-%m-%d %H:%M:%S"), *vals)
+    conn.executemany(f"INSERT INTO telemetry (ts, {', '.join(TELEMETRY_COLUMNS)}) VALUES ({', '.join('?' * (len(TELEMETRY_COLUMNS) + 1))})",
+                     (row(i) for i in range(rows)))
+    conn.commit()
+    return conn, t0.strftime("%Y-%m-%d %H:%M:%S"), (t0 + datetime.timedelta(seconds=10 * rows)).strftime("%Y-%m-%d %H:%M:%S")
+
+def legacy_fetch(conn, start, end):
+    conn.row_factory = sqlite3.Row
+    try: return conn.execute("SELECT * FROM telemetry WHERE ts BETWEEN ? AND ? ORDER BY ts ASC", (start, end)).fetchall()
+    finally: conn.row_factory = None
+
+def legacy_prepare(c_data):
+    """Caminho anterior do history_page: um laço Python por série sobre sqlite3.Row, com r.keys()."""
+    def filter_series(key, is_temp=False):
+        result, last_val = [], None
+        for r in c_data:
+            v = r[key] if key in r.keys() else None
+            try:
+                vf = float(v)
+                if is_temp:
+                    if not (-20 <= vf <= 120) or (last_val is not None and abs(vf - last_val) > 10.0): vf = None
+                elif not (0 <= vf <= 100): vf = None
+            except (ValueError, TypeError): vf = None
+            if vf is not None: last_val = vf
+            result.append(vf)
+        return result
+
+    out = {'c_labels': [r['ts'].split(' ')[1] for r in c_data]}
+    for name, col, kind in history.CHART_SERIES:
+        out[name] = filter_series(col, kind == 'temp') if kind else [r[col] if col in r.keys() else 0 for r in c_data]
+    return out
+
+def columnar_prepare(xs, data):
+    return {name: history.filter_column(data[col], kind) for name, col, kind in history.CHART_SERIES}
+
+def timed(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter(); result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best * 1000, result
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--rows', type=int, default=259200)
+    ap.add_argument('--repeat', type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        conn, start, end = build_db(os.path.join(d, "bench.db"), args.rows)
+        print(f"{args.rows} linhas, numpy={'sim' if history.np is not None else 'não'}")
+        l_fetch, rows = timed(lambda: legacy_fetch(conn, start, end), args.repeat)
+        l_prep, _ = timed(lambda: legacy_prepare(rows), args.repeat)
+        c_fetch, (xs, data) = timed(lambda: history.fetch_columns(conn, start, end, None), args.repeat)
+        c_prep, _ = timed(lambda: columnar_prepare(xs, data), args.repeat)
+        c_lttb, _ = timed(lambda: history.prepare_series(xs, data, 1000), args.repeat)
+        print("                      leitura     preparação     total")
+        print(f"  legado (Row)     {l_fetch:9.1f} ms {l_prep:11.1f} ms {l_fetch + l_prep:9.1f} ms")
+        print(f"  colunar          {c_fetch:9.1f} ms {c_prep:11.1f} ms {c_fetch + c_prep:9.1f} ms")
+        print(f"  ganho            {l_fetch / c_fetch:9.1f}x {l_prep / c_prep:11.1f}x {(l_fetch + l_prep) / (c_fetch + c_prep):9.1f}x")
+        print(f"  colunar + LTTB 1000 pontos/série: {c_fetch + c_lttb:.1f} ms")
+        conn.close()
+
+if __name__ == '__main__':
+    main()
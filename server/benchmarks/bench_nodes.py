@@ -0,0 +1,64 @@
+"""Teste de carga do /report: vários agentes a reportar em paralelo no NodeRegistry.
+
+Uso: python benchmarks/bench_nodes.py [--nodes 8] [--threads 16] [--reports 20000] [--http]
+
+Sem --http mede só o registo (o caminho quente do /report); com --http passa pelo Flask
+(app.test_client, sem rede). No fim confere que nenhum report se perdeu, que os buffers
+circulares não passaram do tamanho fixo e que todos os nós ficaram online."""
+import argparse, os, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nodes import NodeRegistry
+from renderer import MAX_HISTORY
+
+def payload(node, i):
+    return {"node": node, "cpu": i % 100, "ram": 50.0, "temp": 30.0 + (i % 10) / 10, "core_temp": 45.0,
+            "fan": i % 101, "net_down": float(i), "net_up": float(i) / 2}
+
+def run(send, nodes, threads, reports):
+    per_thread = reports // threads
+    start = threading.Barrier(threads + 1)
+    def worker(t):
+        node = f"node-{t % nodes}"
+        start.wait()
+        for i in range(per_thread): send(payload(node, t * per_thread + i))
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for th in pool: th.start()
+    start.wait(); t0 = time.perf_counter()
+    for th in pool: th.join()
+    return per_thread * threads, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--nodes', type=int, default=8)
+    ap.add_argument('--threads', type=int, default=16)
+    ap.add_argument('--reports', type=int, default=20000)
+    ap.add_argument('--http', action='store_true', help="passa pelo Flask (importa main.py)")
+    args = ap.parse_args()
+
+    if args.http:
+        os.environ.setdefault("W1THERMSENSOR_NO_KERNEL_MODULE", "1")
+        import main as server
+        registry, local = server.nodes, threading.local()
+        def send(p):
+            # test_client não é thread-safe: um por thread
+            if not hasattr(local, 'client'): local.client = server.app.test_client()
+            assert local.client.post("/report", json=p).status_code == 200
+    else:
+        registry = NodeRegistry()
+        send = lambda p: registry.report(p)
+
+    before = {n.node_id: n.reports for n in registry.nodes()}
+    sent, dt = run(send, args.nodes, args.threads, args.reports)
+    got = sum(n.reports - before.get(n.node_id, 0) for n in registry.nodes())
+    longest = max(max(len(n.net_history), len(n.metrics)) for n in registry.nodes())
+    print(f"{'http' if args.http else 'registo'}: {sent} reports de {args.nodes} nós em {args.threads} threads: "
+          f"{dt * 1000:.0f} ms, {sent / dt:,.0f} reports/s, {dt / sent * 1e6:.1f} µs/report")
+    print(f"  recebidos {got}/{sent}, maior buffer {longest}/{MAX_HISTORY}, nós {len(registry.nodes())}")
+    assert got == sent, "reports perdidos"
+    assert longest <= MAX_HISTORY, "buffer passou do tamanho fixo"
+    for s in registry.summary():
+        if s['node'].startswith("node-"): assert s['online'] and s['reports'] > 0
+
+if __name__ == '__main__':
+    main()
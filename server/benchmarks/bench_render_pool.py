@@ -0,0 +1,56 @@
+"""Latência do /report com o dashboard a ser redesenhado sem parar, com e sem o pool de render.
+
+Uso: python benchmarks/bench_render_pool.py [--workers 2] [--seconds 10] [--readers 4] [--interval 0.1]
+
+Uma thread muda o snapshot e chama refresh() a cada --interval s, --readers threads esperam
+cada versão nova e pedem o frame com kbat diferentes (como Kindles no /wait) e a thread
+principal mede o NodeRegistry.ingest, que é o caminho quente do /report. Corre duas vezes:
+workers=0 (tudo neste processo, a disputar o GIL) e workers=--workers; no fim mostra
+p50/p99/máx do /report e os contadores do motor."""
+import argparse, os, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nodes import NodeRegistry
+from renderer import RenderEngine
+from bench_encode import SAMPLE
+
+def run(workers, seconds, readers, interval):
+    version = [0]
+    engine = RenderEngine(lambda: dict(SAMPLE, clock=f"{version[0] // 60 % 24:02d}:{version[0] % 60:02d}"), workers=workers)
+    engine.start_workers()
+    engine.refresh()
+    stop = threading.Event()
+    def redraw():
+        while not stop.wait(interval): version[0] += 1; engine.refresh()
+    def reader(r):
+        # Como um Kindle no /wait: espera a versão nova e pede o frame
+        seen = 0
+        while not stop.is_set():
+            seen = engine.wait(seen, 1.0); engine.encoded(str(r * 10 % 100))
+    threads = [threading.Thread(target=redraw)] + [threading.Thread(target=reader, args=(r,)) for r in range(readers)]
+    for th in threads: th.start()
+    registry, lat, end = NodeRegistry(), [], time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        t0 = time.perf_counter()
+        registry.ingest({"node": "bench", "cpu": 10.0, "temp": 30.0, "fan": 20})
+        lat.append(time.perf_counter() - t0)
+        time.sleep(0.001)
+    stop.set()
+    for th in threads: th.join()
+    lat.sort()
+    pct = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))] * 1e6
+    print(f"workers={workers}: {len(lat)} reports, p50 {pct(0.5):.0f} µs, p99 {pct(0.99):.0f} µs, máx {lat[-1] * 1e6:.0f} µs, "
+          f"{version[0]} redesenhos")
+    print(f"  {engine.stats()}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--workers', type=int, default=2)
+    ap.add_argument('--seconds', type=float, default=10)
+    ap.add_argument('--readers', type=int, default=4)
+    ap.add_argument('--interval', type=float, default=0.1)
+    args = ap.parse_args()
+    for workers in (0, args.workers): run(workers, args.seconds, args.readers, args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Suite de benchmarks sem hardware: render do dashboard, telemetria, histórico e /report, em JSON.
+
+Uso: python benchmarks/bench_suite.py [--only render,telemetry,history,report] [--rows 10000,1000000,10000000]
+                                      [--repeat 5] [--workers 0] [--data-dir DIR] [--out FICHEIRO.json]
+                                      [--compare ANTERIOR.json]
+
+Importa o main.py com os fakes de benchmarks/fakes.py (DHT, DS18B20, ventoinha, psutil e clima),
+então corre igual no Pi e num x86 sem GPIO nem rede. Mede:
+  render     /dashboard.png por tema x rotação x formato: redesenho, primeiro pedido, kbat novo e cache
+  telemetry  log_telemetry() até as linhas estarem na base (TelemetryWriter em lotes)
+  history    /history, /api/history e get_records_from_db em bases sintéticas de --rows linhas
+  report     POST /report pelo Flask (test_client, sem rede)
+As bases sintéticas (uma leitura a cada 10 s) ficam em --data-dir e são reaproveitadas se já
+existirem; 10M linhas ocupam ~1.5 GB e levam minutos a gerar no Pi. Os resultados vão para --out
+com a versão, a máquina e o Python; --compare mostra a razão novo/anterior de cada métrica."""
+import argparse, datetime, json, os, platform, shutil, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes
+
+VERSION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'VERSION')
+SYNTH_START = datetime.datetime(2026, 1, 1)
+
+def summary(samples):
+    """Tempos em segundos -> {min, p50, p95, max} em ms."""
+    s = sorted(samples)
+    pct = lambda p: s[min(len(s) - 1, int(round(p * (len(s) - 1))))]
+    return {k: round(v * 1000, 3) for k, v in (("min_ms", s[0]), ("p50_ms", pct(0.5)), ("p95_ms", pct(0.95)), ("max_ms", s[-1]))}
+
+def timed(fn, repeat):
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); out.append(time.perf_counter() - t0)
+    return out
+
+def get_ok(client, url):
+    r = client.get(url)
+    assert r.status_code in (200, 204), f"{url}: {r.status_code}"
+    return r
+
+# --- RENDER ---
+def bench_render(server, args):
+    client, results = server.app.test_client(), []
+    for theme in ('light', 'dark'):
+        for rotation in (0, 1, 2, 3):
+            server.save_config(dict(server.load_config(), theme_mode=theme, rotation=rotation))
+            for fmt in ('png', 'png4', 'pgm'):
+                url = f"/dashboard.png?format={fmt}&kbat="
+                redraw, first, kbat, cached, size = [], [], [], [], 0
+                for i in range(args.repeat):
+                    # Sem snapshot nem variantes: redesenho completo, como no arranque ou ao mudar o tema
+                    server.render_engine._snap = None; server.render_engine._variants.clear()
+                    t0 = time.perf_counter(); server.render_engine.refresh(); redraw.append(time.perf_counter() - t0)
+                    first += timed(lambda: get_ok(client, url + "50"), 1)
+                    kbat += timed(lambda: get_ok(client, url + str(60 + i)), 1)
+                    cached += timed(lambda: get_ok(client, url + "50"), 1)
+                    size = len(get_ok(client, url + "50").data)
+                results.append({"bench": "render", "case": {"theme": theme, "rotation": rotation, "format": fmt},
+                                "metrics": {"bytes": size, "redraw": summary(redraw), "first_request": summary(first),
+                                            "kbat_change": summary(kbat), "cached": summary(cached)}})
+                print(f"  render {theme:5} rot={rotation} {fmt:4}: redesenho {results[-1]['metrics']['redraw']['p50_ms']:.1f} ms, "
+                      f"1º pedido {results[-1]['metrics']['first_request']['p50_ms']:.1f} ms, {size} bytes")
+    return results
+
+# --- TELEMETRIA ---
+def bench_telemetry(server, args):
+    writer, n = server.telemetry_writer, args.telemetry_rows
+    before = dict(writer.counters)
+    t0 = time.perf_counter(); submit = 0.0
+    for i in range(n):
+        s = time.perf_counter(); server.log_telemetry(); submit += time.perf_counter() - s
+        # Não deixa a fila (max_queue) encher: mede o escritor, não os descartes
+        if i % 200 == 199:
+            while writer.stats()["queue_depth"] > 200: time.sleep(0.001)
+    writer.flush()
+    while writer.counters["rows_written"] + writer.counters["rows_dropped"] - before["rows_written"] - before["rows_dropped"] < n:
+        writer.flush(); time.sleep(0.005)
+    dt = time.perf_counter() - t0
+    st = writer.stats()
+    batches = st["batches"] - before["batches"]
+    m = {"rows": n, "rows_per_s": round(n / dt, 1), "submit_us": round(submit / n * 1e6, 2),
+         "dropped": st["rows_dropped"] - before["rows_dropped"], "batches": batches,
+         "avg_batch_write_ms": round((st["total_write_ms"] - before["total_write_ms"]) / batches, 3) if batches else None}
+    print(f"  telemetry: {m['rows_per_s']:,.0f} linhas/s, log_telemetry {m['submit_us']:.1f} µs, lote {m['avg_batch_write_ms']} ms")
+    return [{"bench": "telemetry", "case": {"batch_size": writer.batch_size}, "metrics": m}]
+
+# --- HISTÓRICO ---
+def build_synthetic(server, path, rows):
+    """Base com rows leituras a cada 10 s a partir de SYNTH_START, agregados e recordes."""
+    if os.path.exists(path):
+        with sqlite3.connect(path) as conn:
+            if conn.execute("SELECT count(*) FROM telemetry").fetchone()[0] == rows: return
+        os.unlink(path)
+    t0 = time.perf_counter()
+    server.DB_PATH = path
+    server.init_db()
+    cols = server.TELEMETRY_COLUMNS
+    # Valores pseudo-aleatórios gerados no próprio SQLite: 10M linhas sem passar pelo Python
+    noise = lambda base, span: f"{base} + (abs(random()) % {span * 100}) / 100.0"
+    expr = {c: noise(20, 10) for c in cols}
+    expr.update(int_h=noise(40, 30), s_f=noise(0, 100), s_c=noise(0, 100), s_r=noise(0, 100), m_c=noise(0, 100), m_r=noise(0, 100))
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"""INSERT INTO telemetry (ts, {', '.join(cols)})
+            WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < ?)
+            SELECT datetime(?, '+' || (i * 10) || ' seconds'), {', '.join(expr[c] for c in cols)} FROM seq""",
+            (rows - 1, SYNTH_START.strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+        server.rollups.rebuild(conn); conn.commit()
+        server.records_book.rebuild(conn)
+    print(f"  base sintética de {rows:,} linhas criada em {time.perf_counter() - t0:.1f} s")
+
+def bench_history(server, args):
+    client, results = server.app.test_client(), []
+    for rows in args.rows:
+        path = os.path.join(args.data_dir, f"synthetic_{rows}.db")
+        build_synthetic(server, path, rows)
+        server.DB_PATH = path
+        with sqlite3.connect(path) as conn: server.records_book.load(conn)
+        end = SYNTH_START + datetime.timedelta(seconds=10 * (rows - 1))
+        spans = {"1d": datetime.timedelta(days=1), "30d": datetime.timedelta(days=30), "all": end - SYNTH_START}
+        for span, delta in spans.items():
+            if delta > end - SYNTH_START and span != "all": continue
+            start = max(SYNTH_START, end - delta)
+            q = f"start_date={start:%Y-%m-%d}&end_date={end:%Y-%m-%d}"
+            cases = {"history_page": f"/history?{q}", "api_history": f"/api/history?{q}",
+                     "api_history_sorted": f"/api/history?{q}&sort=int_t&dir=ASC"}
+            for name, url in cases.items():
+                get_ok(client, url)  # aquece a cache de páginas do SQLite
+                results.append({"bench": "history", "case": {"rows": rows, "query": name, "span": span},
+                                "metrics": summary(timed(lambda: get_ok(client, url), args.repeat))})
+                print(f"  {name:18} {rows:>10,} linhas, {span:>3}: p50 {results[-1]['metrics']['p50_ms']:.1f} ms")
+        results.append({"bench": "history", "case": {"rows": rows, "query": "records", "span": "all"},
+                        "metrics": summary(timed(server.get_records_from_db, args.repeat))})
+        print(f"  {'records':18} {rows:>10,} linhas: p50 {results[-1]['metrics']['p50_ms']:.3f} ms")
+    return results
+
+# --- /report ---
+def bench_report(server, args):
+    client, n, lat = server.app.test_client(), args.reports, []
+    t0 = time.perf_counter()
+    for i in range(n):
+        p = {"node": f"bench-{i % 4}", "cpu": i % 100, "ram": 40.0, "temp": 30.0, "core_temp": 45.0, "fan": 30,
+             "net_down": 1.0, "net_up": 0.5, "agg": {"cpu": [1.0, 5.0, 9.0]}}
+        s = time.perf_counter()
+        assert client.post("/report", json=p).status_code == 200
+        lat.append(time.perf_counter() - s)
+    dt = time.perf_counter() - t0
+    m = dict(summary(lat), reports=n, reports_per_s=round(n / dt, 1))
+    print(f"  report: {m['reports_per_s']:,.0f} reports/s, p50 {m['p50_ms']:.3f} ms, p95 {m['p95_ms']:.3f} ms")
+    return [{"bench": "report", "case": {"nodes": 4}, "metrics": m}]
+
+BENCHES = {"render": bench_render, "telemetry": bench_telemetry, "history": bench_history, "report": bench_report}
+
+# --- RESULTADOS ---
+def metadata(args):
+    import PIL
+    try:
+        with open(VERSION_FILE) as f: version = f.read().strip()
+    except OSError: version = None
+    return {"version": version, "date": datetime.datetime.now().isoformat(timespec='seconds'),
+            "host": platform.node(), "machine": platform.machine(), "platform": platform.platform(),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "pillow": PIL.__version__,
+            "cpus": os.cpu_count(), "render_workers": args.workers, "repeat": args.repeat}
+
+def flatten(metrics, prefix=""):
+    out = {}
+    for k, v in metrics.items():
+        if isinstance(v, dict): out.update(flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)): out[prefix + k] = v
+    return out
+
+def compare(current, path, threshold=0.10, verbose=False):
+    """Razão novo/anterior por métrica; tempos (p50, _us) pior se sobem, débitos (_per_s) se descem."""
+    with open(path) as f: old = json.load(f)
+    key = lambda r: (r["bench"], json.dumps(r["case"], sort_keys=True))
+    before = {key(r): flatten(r["metrics"]) for r in old["results"]}
+    print(f"\nComparação com {path} (versão {old['meta'].get('version')}, {old['meta'].get('host')}):")
+    worse = 0
+    for r in current:
+        prev = before.get(key(r))
+        if prev is None: continue
+        for name, v in flatten(r["metrics"]).items():
+            p = prev.get(name)
+            # min/máx/p95 com poucas repetições são ruído: compara medianas, médias e débitos
+            if not p or name.endswith(("min_ms", "max_ms", "p95_ms")) or not name.endswith(("_ms", "_us", "_per_s")): continue
+            ratio = v / p
+            bad = ratio > 1 + threshold if not name.endswith("_per_s") else ratio < 1 - threshold
+            if bad or verbose:
+                worse += bad
+                print(f"  {'PIOR ' if bad else '     '}{r['bench']} {r['case']} {name}: {p} -> {v} ({ratio:.2f}x)")
+    print(f"  {worse} métricas pioraram mais de {threshold:.0%}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--only', default=",".join(BENCHES), help="benchmarks separados por vírgula")
+    ap.add_argument('--rows', default="10000,1000000,10000000", help="tamanhos das bases sintéticas")
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--telemetry-rows', type=int, default=5000)
+    ap.add_argument('--reports', type=int, default=5000)
+    ap.add_argument('--workers', type=int, default=0, help="processos do pool de render (0 = no processo)")
+    ap.add_argument('--data-dir', help="pasta das bases (reaproveitadas entre execuções); padrão: temporária")
+    ap.add_argument('--out', help="ficheiro JSON; padrão: bench-<host>-<versão>-<data>.json")
+    ap.add_argument('--compare', help="JSON de uma execução anterior")
+    ap.add_argument('--verbose', action='store_true', help="com --compare, mostra também as métricas que não pioraram")
+    args = ap.parse_args()
+    args.rows = [int(r) for r in args.rows.split(",") if r]
+    only = [b for b in args.only.split(",") if b]
+    for b in only:
+        if b not in BENCHES: ap.error(f"benchmark desconhecido: {b}")
+
+    tmp = None
+    if not args.data_dir: args.data_dir = tmp = tempfile.mkdtemp(prefix="kindleberry-bench-")
+    os.environ["RENDER_WORKERS"] = str(args.workers)
+    try:
+        server = fakes.load_server(args.data_dir)
+        server.render_engine.start_workers()
+        meta, results = metadata(args), []
+        print(f"Kindleberry {meta['version']} em {meta['host']} ({meta['machine']}, Python {meta['python']})")
+        for b in only:
+            print(f"[{b}]")
+            results += BENCHES[b](server, args)
+        server.telemetry_writer.close()
+    finally:
+        if tmp: shutil.rmtree(tmp, ignore_errors=True)
+
+    out = args.out or f"bench-{meta['host']}-{meta['version']}-{datetime.date.today():%Y%m%d}.json"
+    with open(out, 'w') as f: json.dump({"meta": meta, "results": results}, f, indent=1, ensure_ascii=False)
+    print(f"Resultados em {out}")
+    if args.compare: compare(results, args.compare, verbose=args.verbose)
+
+if __name__ == '__main__':
+    main()
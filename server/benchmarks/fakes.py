@@ -0,0 +1,175 @@
+"""Substitutos do hardware, do psutil e da API do clima para correr o main.py fora do Pi.
+
+install() põe os módulos falsos em sys.modules antes de o main.py ser importado, então nem no
+próprio Pi o benchmark toca em GPIO, 1-Wire ou na ventoinha do servidor que está a correr;
+load_server() importa o main.py com DATA_DIR e CONFIG_PATH numa pasta temporária.
+Todas as leituras são determinísticas (mesma sequência a cada execução).
+
+FakeDHTLine é diferente: substitui só a linha GPIO (request_factory do DHTReader verdadeiro)
+e reproduz tramas gravadas ou sintéticas (dht22_frame), para testar a descodificação."""
+import itertools, math, os, sys, time, types
+from collections import namedtuple
+
+class FakeDHTReader:
+    """Mesma interface do dht_reader.DHTReader: read_data() -> (humidade, °C, °F)."""
+
+    _SENSOR_MIN_DELAY = {'DHT11': 1, 'DHT22': 2}
+    mode = 'edge'
+
+    def __init__(self, dht_type='DHT22', chip_path=None, line_offset=None, mode='auto', request_factory=None):
+        self._dht_type, self._n = dht_type.upper(), itertools.count()
+
+    @property
+    def min_delay(self): return self._SENSOR_MIN_DELAY[self._dht_type]
+
+    def read_data(self):
+        i = next(self._n)
+        t = round(24.0 + 2.0 * math.sin(i / 60), 1)
+        return round(55.0 + 5.0 * math.cos(i / 90), 1), t, t * 1.8 + 32
+
+class DHTChecksumError(RuntimeError): pass
+class DHTPulseTimeoutError(RuntimeError): pass
+
+class FakeW1ThermSensor:
+    def __init__(self, *args, **kwargs): self._n = itertools.count()
+    def get_temperature(self): return round(19.0 + 3.0 * math.sin(next(self._n) / 120), 2)
+
+class FakePWMOutputDevice:
+    def __init__(self, pin, frequency=100): self.pin, self.frequency, self.value = pin, frequency, 0.0
+
+class FakeWeatherSource:
+    """fetch() sem rede; o ícone aponta para um PNG que já está em server/icons (sem download)."""
+
+    def __init__(self): self.calls = 0
+
+    def fetch(self, lat, lon):
+        self.calls += 1
+        return {"temp": 21.5, "cond": "Parcialmente nublado", "icon_url": "https://fake.invalid/moon_full.png"}
+
+def fake_psutil():
+    """Módulo com as funções do psutil que o sysmon usa; o débito cresce a ritmo constante."""
+    m = types.ModuleType('psutil')
+    io = namedtuple('snetio', 'bytes_sent bytes_recv')
+    mem = namedtuple('svmem', 'percent')
+    temp = namedtuple('shwtemp', 'label current high critical')
+    n = itertools.count()
+    def net_io_counters():
+        i = next(n); return io(i * 40_000, i * 250_000)
+    m.net_io_counters = net_io_counters
+    m.cpu_percent = lambda interval=None: 23.5
+    m.virtual_memory = lambda: mem(41.2)
+    m.sensors_temperatures = lambda: {'cpu_thermal': [temp('', 47.3, None, None)]}
+    return m
+
+def install():
+    """Substitui gpiozero, w1thermsensor, dht_reader (gpiod) e psutil em sys.modules."""
+    if 'main' in sys.modules: raise RuntimeError("install() tem de correr antes de importar o main.py")
+    modules = {
+        'gpiozero': {'PWMOutputDevice': FakePWMOutputDevice},
+        'w1thermsensor': {'W1ThermSensor': FakeW1ThermSensor},
+        'dht_reader': {'DHTReader': FakeDHTReader, 'DHTChecksumError': DHTChecksumError,
+                       'DHTPulseTimeoutError': DHTPulseTimeoutError},
+    }
+    for name, attrs in modules.items():
+        m = types.ModuleType(name); m.__dict__.update(attrs); sys.modules[name] = m
+    sys.modules['psutil'] = fake_psutil()
+
+def load_server(data_dir):
+    """Importa o main.py com os fakes, a base em data_dir e o clima, o sysmon e os sensores já preenchidos."""
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["CONFIG_PATH"] = os.path.join(data_dir, "config.json")
+    install()
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main
+    main.init_db()
+    main.weather.source = FakeWeatherSource()
+    main.weather.set_location(*(main.load_config()[k] for k in ('lat', 'lon')))
+    main.weather.refresh()
+    for _ in range(main.sysmon.history): main.sysmon.sample()
+    for w in main.sensors.workers.values(): w.poll()
+    return main
+
+# --- LINHA GPIO FALSA PARA O DHTReader ---
+def dht22_frame(humidity, temperature, jitter_us=0.0, seed=0):
+    """Trama DHT22 como se gravada de um sensor: [(subida?, ns desde que a linha foi libertada)].
+
+    Resposta de 80 µs em baixo e 80 µs em alto, 40 bits (50 µs em baixo + 27 µs para 0 ou
+    70 µs para 1) e o fim em baixo; jitter_us soma ruído uniforme a cada duração."""
+    import random
+    rnd = random.Random(seed)
+    h, t = round(humidity * 10), round(abs(temperature) * 10) | (0x8000 if temperature < 0 else 0)
+    data = [h >> 8, h & 0xFF, t >> 8, t & 0xFF]
+    data.append(sum(data) & 0xFF)
+    bits = [(b >> (7 - i)) & 1 for b in data for i in range(8)]
+    durations = [(False, 30), (True, 80), (False, 80)]
+    for bit in bits: durations += [(True, 50), (False, 70 if bit else 27)]
+    durations.append((True, 50))
+    # (nível que começa, duração do nível anterior): a borda chega ao fim de cada duração
+    edges, t_ns = [], 0
+    for rising, us in durations:
+        t_ns += int((us + rnd.uniform(-jitter_us, jitter_us)) * 1000)
+        edges.append((rising, t_ns))
+    return edges
+
+class FakeDHTLine:
+    """request_factory do DHTReader que reproduz uma trama gravada [(subida?, ns desde a libertação)].
+
+    A trama "acontece" em tempo real a partir do reconfigure_lines para entrada: no modo edge os
+    eventos chegam com timestamp_ns quando o relógio passa por eles; no modo poll get_value()
+    devolve o nível da trama nesse instante, então o busy-wait corre contra o relógio de verdade.
+    Com lose=k a k-ésima borda perde-se, como num buffer de eventos do kernel cheio."""
+
+    def __init__(self, edges, offset=17, lose=None):
+        self.edges, self.offset, self.lose = list(edges), offset, lose
+        self.requests, self.edge_requests = 0, 0
+
+    def __call__(self, path, config, consumer=None, event_buffer_size=None, output_values=None):
+        self.requests += 1
+        self._t0, self._edge_mode, self._next, self._seqno = None, False, 0, 0
+        return self
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+    def set_value(self, offset, value): pass
+
+    def reconfigure_lines(self, config):
+        from gpiod.line import Direction, Edge
+        settings = config[self.offset]
+        if settings.direction == Direction.INPUT:
+            self._t0, self._edge_mode = time.monotonic_ns(), settings.edge_detection == Edge.BOTH
+            self.edge_requests += self._edge_mode
+            # No modo poll a linha é libertada antes do reconfigure (set_value ACTIVE) e, no Pi, o
+            # reconfigure demora mais que os 20-40 µs até à resposta: o _receive_data já a apanha em baixo
+            if not self._edge_mode: self._t0 -= self.edges[0][1]
+
+    def get_value(self, offset):
+        from gpiod.line import Value
+        if self._t0 is None: return Value.ACTIVE
+        elapsed = time.monotonic_ns() - self._t0
+        level = True
+        for rising, t in self.edges:
+            if t > elapsed: break
+            level = rising
+        return Value.ACTIVE if level else Value.INACTIVE
+
+    def wait_edge_events(self, timeout=None):
+        if self._next >= len(self.edges):
+            time.sleep(timeout or 0); return False
+        wait = (self._t0 + self.edges[self._next][1] - time.monotonic_ns()) / 1e9
+        if timeout is not None and wait > timeout:
+            time.sleep(timeout); return False
+        if wait > 0: time.sleep(wait)
+        return True
+
+    def read_edge_events(self, max_events=None):
+        from gpiod.edge_event import EdgeEvent
+        now, out = time.monotonic_ns(), []
+        while self._next < len(self.edges) and self._t0 + self.edges[self._next][1] <= now:
+            rising, t = self.edges[self._next]
+            self._next += 1; self._seqno += 1
+            if self._next - 1 == self.lose: continue
+            kind = EdgeEvent.Type.RISING_EDGE if rising else EdgeEvent.Type.FALLING_EDGE
+            out.append(EdgeEvent(kind.value, self._t0 + t, self.offset, self._seqno, self._seqno))
+        return out
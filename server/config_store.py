@@ -0,0 +1,96 @@
+import json, os, tempfile, threading, time, traceback
+
+class ConfigStore:
+    """Configuração em memória, lida do disco uma vez e recarregada só quando o ficheiro muda.
+
+    get() devolve uma cópia rasa do dict em cache; a mudança no disco é detetada por mtime,
+    verificado no máximo uma vez por check_interval. save() grava de forma atómica
+    (ficheiro temporário + rename) e os subscritores recebem callback(novo, antigo)."""
+
+    def __init__(self, path, defaults, check_interval=1.0):
+        self.path, self.defaults, self.check_interval = path, defaults, check_interval
+        self._lock = threading.Lock()
+        self._data, self._stamp, self._checked = None, None, 0
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path); return (st.st_mtime_ns, st.st_size)
+        except OSError: return None
+
+    def _read(self):
+        data = dict(self.defaults)
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f: data.update(json.load(f))
+        return data
+
+    def get(self):
+        changed = None
+        with self._lock:
+            now = time.monotonic()
+            if self._data is None or now - self._checked >= self.check_interval:
+                self._checked = now
+                stamp = self._file_stamp()
+                if self._data is None or stamp != self._stamp:
+                    old = self._data
+                    try: self._data = self._read()
+                    except Exception:
+                        # Ficheiro ilegível: mantém o último estado bom (ou os padrões)
+                        traceback.print_exc()
+                        if self._data is None: self._data = dict(self.defaults)
+                    self._stamp = stamp
+                    if old is not None and old != self._data: changed = (self._data, old)
+            data = dict(self._data)
+        if changed: self._notify(*changed)
+        return data
+
+    def save(self, data):
+        d = os.path.dirname(self.path) or '.'
+        fd, tmp = tempfile.mkstemp(prefix='.config.', suffix='.tmp', dir=d)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4); f.flush(); os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except Exception:
+            if os.path.exists(tmp): os.unlink(tmp)
+            raise
+        with self._lock:
+            old = self._data
+            self._data = dict(self.defaults); self._data.update(data)
+            self._stamp, self._checked = self._file_stamp(), time.monotonic()
+            new = dict(self._data)
+        if old != new: self._notify(new, old or {})
+
+    def invalidate(self):
+        """Força a releitura do disco no próximo get()."""
+        with self._lock: self._stamp, self._checked = None, 0
+
+    def _notify(self, new, old):
+        for cb in self._subscribers:
+            try: cb(new, old)
+            except Exception: traceback.print_exc()
+
+class LocaleStore:
+    """Dicionários de tradução em cache por idioma, recarregados se o JSON mudar no disco."""
+
+    def __init__(self, locale_dir, check_interval=5.0):
+        self.locale_dir, self.check_interval = locale_dir, check_interval
+        self._cache = {}
+
+    def get(self, lang):
+        now = time.monotonic()
+        entry = self._cache.get(lang)
+        if entry and now - entry[2] < self.check_interval: return entry[0]
+        path = os.path.join(self.locale_dir, f"{lang}.json")
+        try: stamp = os.stat(path).st_mtime_ns
+        except OSError: stamp = None
+        if entry and entry[1] == stamp:
+            self._cache[lang] = (entry[0], stamp, now); return entry[0]
+        try:
+            with open(path, 'r', encoding='utf-8') as f: data = json.load(f)
+        except Exception: data = {}
+        self._cache[lang] = (data, stamp, now)
+        return data
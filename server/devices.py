@@ -0,0 +1,73 @@
+import threading, time
+from collections import namedtuple
+from renderer import W, H, FORMATS, FONT_SIZE_MIN, FONT_SIZE_MAX
+
+# Só os campos que mudam os pixels: Kindles com o mesmo Profile partilham frames e caches
+Profile = namedtuple('Profile', 'width height rotation theme font_size')
+
+# Resoluções (largura x altura do canvas deitado, antes da rotação) dos modelos mais comuns
+KINDLE_MODELS = {
+    'k4': (800, 600), 'pw1': (1024, 758), 'pw2': (1024, 758),
+    'pw3': (1448, 1072), 'voyage': (1448, 1072), 'pw4': (1448, 1072), 'oasis': (1680, 1264),
+}
+
+# campo do perfil -> conversor; valores inválidos caem no padrão
+DEVICE_FIELDS = {
+    'name': str, 'model': str, 'width': int, 'height': int, 'rotation': int, 'theme_mode': str, 'font_size': int,
+    'brightness': int, 'format': str, 'dither': lambda v: v in (True, 1, '1', 'true', 'yes'), 'refresh_interval': int, 'partial_limit': int,
+}
+
+class DeviceRegistry:
+    """Perfis por Kindle, lidos de config['devices'][cid] por cima das opções globais.
+
+    Um cid desconhecido recebe o perfil global (o comportamento de antes). seen() guarda
+    a última visita de cada cliente para a UI e para /api/devices."""
+
+    MAX_SEEN = 32
+
+    def __init__(self, config_fn):
+        self.config_fn = config_fn
+        self._seen, self._lock = {}, threading.Lock()
+
+    def settings(self, cid=None):
+        c = self.config_fn()
+        s = {
+            'name': cid or 'default', 'model': None, 'width': W, 'height': H,
+            'rotation': c.get('rotation', 1), 'theme_mode': c.get('theme_mode', 'auto'), 'font_size': c.get('font_size', 120),
+            'brightness': c.get('brightness', 10), 'format': 'png', 'dither': False, 'refresh_interval': 10, 'partial_limit': 30,
+        }
+        own = (c.get('devices') or {}).get(cid) or {} if cid else {}
+        if own.get('model') in KINDLE_MODELS: s['width'], s['height'] = KINDLE_MODELS[own['model']]
+        for k, conv in DEVICE_FIELDS.items():
+            if k in own:
+                try: s[k] = conv(own[k])
+                except (TypeError, ValueError): pass
+        if s['format'] not in FORMATS: s['format'] = 'png'
+        s['width'], s['height'] = max(100, min(s['width'], 4096)), max(100, min(s['height'], 4096))
+        s['font_size'] = max(FONT_SIZE_MIN, min(int(s['font_size']), FONT_SIZE_MAX))
+        return s
+
+    @staticmethod
+    def profile(settings):
+        return Profile(settings['width'], settings['height'], int(settings['rotation']), settings['theme_mode'], int(settings['font_size']))
+
+    def seen(self, cid, **info):
+        with self._lock:
+            self._seen[cid] = dict(info, last_seen=time.time())
+            if len(self._seen) > self.MAX_SEEN:
+                del self._seen[min(self._seen, key=lambda k: self._seen[k]['last_seen'])]
+
+    def last(self, cid):
+        """Última visita de cid ({} se nunca foi visto)."""
+        with self._lock: return dict(self._seen.get(cid) or {})
+
+    def list(self):
+        """Clientes vistos recentemente, com o perfil efetivo de cada um."""
+        with self._lock: seen = {k: dict(v) for k, v in self._seen.items()}
+        configured = self.config_fn().get('devices') or {}
+        out = []
+        for cid in sorted(set(seen) | set(configured)):
+            s = self.settings(cid)
+            info = seen.get(cid, {})
+            out.append(dict(s, cid=cid, configured=cid in configured, last_seen=info.get('last_seen'), kbat=info.get('kbat'), mode=info.get('mode')))
+        return out
@@ -1,19 +1,45 @@
 import array
 import time
+from typing import Callable, Optional
+
 import gpiod
-from gpiod.line import Direction, Value
+from gpiod.edge_event import EdgeEvent
+from gpiod.line import Direction, Edge, Value
+
+
+class DHTChecksumError(RuntimeError):
+    """Raised when the received data does not match its checksum byte."""
+
+
+class DHTPulseTimeoutError(RuntimeError):
+    """Raised when the sensor stops toggling the line while data is being received."""
 
 
 class DHTReader:
     """
     A class to read data from a DHT sensor using GPIO.
 
+    Two decoding modes are available:
+        - 'edge': the line is requested with both-edge detection and the bits are decoded
+          from the kernel timestamps of the edge events, so interpreter jitter does not
+          affect the measured pulse widths and no CPU is burnt while waiting.
+        - 'poll': the original busy-wait on get_value(), for drivers without edge detection.
+    'auto' (the default) uses 'edge' and switches to 'poll' for good if the line cannot
+    be set up for edge detection.
+
     Attributes:
         _PULSE_TIMEOUT_THRESHOLD (float): Timeout threshold for pulse reception (100 μs)
         _EXPECTED_PULSES (int): Expected number of pulses during data reception from DHT sensor
         _PULSE_DURATION_THRESHOLD (int): Threshold for pulse duration for binary conversion (50 μs)
         _SUPPORTED_SENSOR_TYPES (set[str]): List of supported DHT sensor types.
         _SENSOR_MIN_DELAY (dict[str, int]): Minimum required delay between readings (seconds).
+        _DATA_BITS (int): Number of data bits sent by the sensor (4 data bytes + checksum).
+        _EDGE_READ_TIMEOUT (float): Time limit for a whole frame in edge mode (the frame takes ~5 ms).
+        _EDGE_IDLE_TIMEOUT (float): Silence after which the frame is considered finished (1 ms).
+        _EDGE_BUFFER_SIZE (int): Kernel edge event buffer size; a frame has up to 85 edges.
+        _SUPPORTED_MODES (set[str]): Accepted decoding modes.
+        last_edges (list[tuple[bool, int]]): (is rising, timestamp in ns) of the last frame read
+            in edge mode, so a real frame can be recorded and replayed against a fake line.
     """
     _PULSE_TIMEOUT_THRESHOLD = 0.0001
     _EXPECTED_PULSES = 83
@@ -23,8 +49,14 @@ class DHTReader:
         'DHT11': 1,
         'DHT22': 2,
     }
-
-    def __init__(self, dht_type: str, chip_path: str, line_offset: int) -> None:
+    _DATA_BITS = 40
+    _EDGE_READ_TIMEOUT = 0.05
+    _EDGE_IDLE_TIMEOUT = 0.001
+    _EDGE_BUFFER_SIZE = 256
+    _SUPPORTED_MODES = {'auto', 'edge', 'poll'}
+
+    def __init__(self, dht_type: str, chip_path: str, line_offset: int, mode: str = 'auto',
+                 request_factory: Optional[Callable[..., gpiod.LineRequest]] = None) -> None:
         """
         Initializes the DHTReader.
 
@@ -32,18 +64,41 @@ class DHTReader:
             dht_type (str): The type of the DHT sensor.
             chip_path (str): The path to the GPIO chip.
             line_offset (int): The offset of the GPIO line.
+            mode (str): Decoding mode: 'auto', 'edge' or 'poll'.
+            request_factory (Callable): Replacement for gpiod.request_lines (same signature),
+                e.g. a fake line that replays recorded edge timings.
 
         Raises:
-            ValueError: If the DHT type is not supported.
+            ValueError: If the DHT type or the mode is not supported.
         """
         dht_type = dht_type.upper()
         if dht_type not in self._SUPPORTED_SENSOR_TYPES:
             raise ValueError(f"Error: Unsupported DHT sensor type: {dht_type}. Supported: {', '.join(self._SUPPORTED_SENSOR_TYPES)}")
+        if mode not in self._SUPPORTED_MODES:
+            raise ValueError(f"Error: Unsupported mode: {mode}. Supported: {', '.join(sorted(self._SUPPORTED_MODES))}")
 
         self._dht_type = dht_type
         self._chip_path = chip_path
         self._line_offset = line_offset
         self._last_called = 0
+        self._mode = mode
+        self._request_lines = request_factory or gpiod.request_lines
+        self.last_edges: list[tuple[bool, int]] = []
+
+    @property
+    def mode(self) -> str:
+        """
+        The decoding mode in use: 'edge' or 'poll' ('auto' until the first edge read succeeds).
+        """
+        return self._mode
+
+    @property
+    def min_delay(self) -> int:
+        """
+        Minimum time between two readings of this sensor type (seconds), for callers that
+        schedule retries.
+        """
+        return self._SENSOR_MIN_DELAY[self._dht_type]
 
     def read_data(self) -> tuple[float, float, float]:
         """
@@ -52,10 +107,41 @@ class DHTReader:
         Returns:
             tuple[float, float, float]: A tuple containing humidity, temperature in Celsius
             and temperature in Fahrenheit.
+
+        Raises:
+            OSError: If the line cannot be set up for edge detection. In 'auto' mode the
+                reader switches to 'poll' and the next reading uses it.
         """
         self._check_elapsed_time_between_readings()
 
-        with gpiod.request_lines(
+        if self._mode == 'poll':
+            binary_data = self._read_polling()
+        else:
+            try:
+                binary_data = self._read_edges()
+            except OSError:
+                if self._mode == 'auto':
+                    self._mode = 'poll'
+                raise
+            if self._mode == 'auto':
+                self._mode = 'edge'
+
+        self._validate_checksum(binary_data)
+
+        humidity = self._get_humidity(binary_data)
+        temperature_c = self._get_temperature(binary_data)
+        temperature_f = self._convert_celsius_to_fahrenheit(temperature_c)
+
+        return humidity, temperature_c, temperature_f
+
+    def _read_polling(self) -> array.array:
+        """
+        Reads a frame by busy-waiting on the line value.
+
+        Returns:
+            array.array: A list containing binary data.
+        """
+        with self._request_lines(
             self._chip_path,
             consumer=self._dht_type,
             config={self._line_offset: gpiod.LineSettings(direction=Direction.OUTPUT)}
@@ -63,15 +149,92 @@ class DHTReader:
             self._send_start_signal(request)
             pulses = self._receive_data(request)
             high_pulses = self._extract_high_pulses(pulses)
-            binary_data = self._convert_to_binary(high_pulses)
+            return self._convert_to_binary(high_pulses)
 
-            self._validate_checksum(binary_data)
+    def _read_edges(self) -> array.array:
+        """
+        Reads a frame from kernel-timestamped edge events.
 
-            humidity = self._get_humidity(binary_data)
-            temperature_c = self._get_temperature(binary_data)
-            temperature_f = self._convert_celsius_to_fahrenheit(temperature_c)
+        The line is requested already high, so the sensor does not need the 500 ms wake-up
+        of the polling path; it is pulled low for the start signal and then released and armed
+        for both-edge detection in a single reconfiguration.
 
-            return humidity, temperature_c, temperature_f
+        Returns:
+            array.array: A list containing binary data.
+        """
+        with self._request_lines(
+            self._chip_path,
+            consumer=self._dht_type,
+            event_buffer_size=self._EDGE_BUFFER_SIZE,
+            config={self._line_offset: gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.ACTIVE)}
+        ) as request:
+            request.set_value(self._line_offset, Value.INACTIVE)
+            time.sleep(0.018 if self._dht_type == 'DHT11' else 0.001)
+            request.reconfigure_lines(
+                config={self._line_offset: gpiod.LineSettings(direction=Direction.INPUT, edge_detection=Edge.BOTH)}
+            )
+            events = self._collect_edges(request)
+
+        self.last_edges = [(e.event_type == EdgeEvent.Type.RISING_EDGE, e.timestamp_ns) for e in events]
+        return self._decode_edges(events)
+
+    def _collect_edges(self, request: gpiod.LineRequest) -> list[EdgeEvent]:
+        """
+        Collects the edge events of one frame.
+
+        Args:
+            request (gpiod.LineRequest): The GPIO line request object.
+
+        Returns:
+            list[EdgeEvent]: The events in arrival order, until the line stays idle for
+            _EDGE_IDLE_TIMEOUT or _EDGE_READ_TIMEOUT expires.
+        """
+        events: list[EdgeEvent] = []
+        deadline = time.monotonic() + self._EDGE_READ_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not request.wait_edge_events(min(remaining, self._EDGE_IDLE_TIMEOUT) if events else remaining):
+                break
+            events.extend(request.read_edge_events())
+
+        return events
+
+    def _decode_edges(self, events: list[EdgeEvent]) -> array.array:
+        """
+        Converts edge events to binary data.
+
+        A high pulse is the time between a rising edge and the next falling edge. The data
+        bits are the last 40 complete high pulses, so a missed response edge (or a glitch
+        when the line is released) does not shift the bits.
+
+        Args:
+            events (list[EdgeEvent]): The events of one frame.
+
+        Returns:
+            array.array: A list containing binary data.
+
+        Raises:
+            DHTPulseTimeoutError: If events were lost or fewer than 40 bits were received.
+        """
+        for previous, event in zip(events, events[1:]):
+            if event.line_seqno != previous.line_seqno + 1:
+                raise DHTPulseTimeoutError('Error: Edge events lost.')
+
+        high_pulses = []
+        rising_ns = None
+        for event in events:
+            if event.event_type == EdgeEvent.Type.RISING_EDGE:
+                rising_ns = event.timestamp_ns
+            elif rising_ns is not None:
+                high_pulses.append((event.timestamp_ns - rising_ns) / 1000)
+                rising_ns = None
+
+        if len(high_pulses) < self._DATA_BITS:
+            raise DHTPulseTimeoutError(f'Error: Pulse timeout ({len(high_pulses)} of {self._DATA_BITS} bits received).')
+
+        return self._convert_to_binary(high_pulses[-self._DATA_BITS:])
 
     def _send_start_signal(self, request: gpiod.LineRequest) -> None:
         """
@@ -105,6 +268,9 @@ class DHTReader:
 
         Returns:
             list[float]: A list containing pulse duration data.
+
+        Raises:
+            DHTPulseTimeoutError: If a pulse lasts longer than the timeout threshold.
         """
         pulses = [0.0] * self._EXPECTED_PULSES
         for i, _ in enumerate(pulses):
@@ -112,7 +278,7 @@ class DHTReader:
             start_time = time.monotonic()
             while request.get_value(self._line_offset) == pulse:
                 if time.monotonic() - start_time > self._PULSE_TIMEOUT_THRESHOLD:
-                    raise RuntimeError('Error: Pulse timeout.')
+                    raise DHTPulseTimeoutError('Error: Pulse timeout.')
             pulses[i] = time.monotonic() - start_time
 
         return pulses
@@ -199,14 +365,14 @@ class DHTReader:
             binary_data (array.array): A list containing binary data.
 
         Raises:
-            RuntimeError: If the checksum is invalid.
+            DHTChecksumError: If the checksum is invalid.
         """
         # Checksum is 1 byte
         received_checksum = binary_data[4]
         calculated_checksum = sum(binary_data[:4]) & 0xFF
 
         if calculated_checksum != received_checksum:
-            raise RuntimeError('Error: Invalid checksum.')
+            raise DHTChecksumError('Error: Invalid checksum.')
 
     def _check_elapsed_time_between_readings(self) -> None:
         """
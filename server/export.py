@@ -0,0 +1,50 @@
+import csv, io, json, zlib
+from telemetry import TELEMETRY_COLUMNS, open_reader
+
+EXPORT_COLUMNS = ('id', 'ts') + TELEMETRY_COLUMNS
+FETCH_SIZE = 500
+
+def parse_columns(spec):
+    """'ts,int_t,s_t' -> colunas válidas na ordem pedida; vazio = todas. Desconhecidas geram ValueError."""
+    if not spec: return list(EXPORT_COLUMNS)
+    cols = [c.strip() for c in spec.split(',') if c.strip()]
+    bad = [c for c in cols if c not in EXPORT_COLUMNS]
+    if bad: raise ValueError(f"colunas desconhecidas: {', '.join(bad)}")
+    return cols
+
+def iter_rows(db_path, cols, start, end):
+    """Cursor no servidor lido em blocos de FETCH_SIZE: memória constante seja qual for o intervalo."""
+    conn = open_reader(db_path)
+    conn.row_factory = None
+    try:
+        cur = conn.execute(f"SELECT {', '.join(cols)} FROM telemetry WHERE ts BETWEEN ? AND ? ORDER BY ts ASC", (start, end))
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows: break
+            yield rows
+    finally: conn.close()
+
+def csv_chunks(cols, blocks):
+    buf = io.StringIO(); w = csv.writer(buf)
+    w.writerow(cols)
+    for rows in blocks:
+        w.writerows(rows)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0); buf.truncate()
+    if buf.tell(): yield buf.getvalue().encode('utf-8')
+
+def ndjson_chunks(cols, blocks):
+    for rows in blocks:
+        yield "".join(json.dumps(dict(zip(cols, r)), separators=(',', ':')) + "\n" for r in rows).encode('utf-8')
+
+def gzip_chunks(chunks, level=6):
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out: yield out
+    yield z.flush()
+
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv', 'csv'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson', 'ndjson'),
+}
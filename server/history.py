@@ -0,0 +1,349 @@
+import base64, datetime, json
+from array import array
+from telemetry import TELEMETRY_COLUMNS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- ROLLUPS (1 MIN / 1 H / 1 DIA) ---
+# (sufixo, segundos, expressão SQL do início do bucket, fatia do ts em Python)
+RESOLUTIONS = [
+    ('1d', 86400, "substr(ts, 1, 10) || ' 00:00:00'", lambda ts: ts[:10] + " 00:00:00"),
+    ('1h', 3600, "substr(ts, 1, 13) || ':00:00'", lambda ts: ts[:13] + ":00:00"),
+    ('1m', 60, "substr(ts, 1, 16) || ':00'", lambda ts: ts[:16] + ":00"),
+]
+RAW_INTERVAL = 10
+TEMP_COLUMNS = {'int_t', 'ext_t', 's_t', 'm_core_t', 's_core_t'}
+PCT_COLUMNS = {'int_h', 's_f'}
+
+def column_limits(col):
+    """Limites físicos: leituras fora deles são glitches e não entram nos agregados."""
+    if col in TEMP_COLUMNS: return (-20, 120)
+    if col in PCT_COLUMNS: return (0, 100)
+    return None
+
+def init_rollup_tables(conn):
+    fields = ", ".join(f"{c}_min REAL, {c}_max REAL, {c}_sum REAL, {c}_n INTEGER" for c in TELEMETRY_COLUMNS)
+    for suffix, _, _, _ in RESOLUTIONS:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS telemetry_{suffix} (bucket TEXT PRIMARY KEY, n INTEGER, {fields})")
+
+def _valid_sql(col):
+    lim = column_limits(col)
+    return f"CASE WHEN {col} BETWEEN {lim[0]} AND {lim[1]} THEN {col} END" if lim else col
+
+def _aggregate_select(bucket_expr, where=""):
+    aggs = ", ".join(f"min({_valid_sql(c)}), max({_valid_sql(c)}), sum({_valid_sql(c)}), count({_valid_sql(c)})" for c in TELEMETRY_COLUMNS)
+    return f"SELECT {bucket_expr}, count(*), {aggs} FROM telemetry {where} GROUP BY 1"
+
+class Rollups:
+    """Agregados mín/méd/máx por minuto, hora e dia, mantidos pelo escritor da telemetria.
+
+    observe() soma cada lote nos buckets correspondentes (upsert); refresh_buckets()
+    recalcula a partir da tabela bruta os buckets tocados por linhas apagadas ou anuladas."""
+
+    def __init__(self):
+        sets = []
+        for c in TELEMETRY_COLUMNS:
+            sets.append(f"{c}_min = min(coalesce({c}_min, excluded.{c}_min), coalesce(excluded.{c}_min, {c}_min))")
+            sets.append(f"{c}_max = max(coalesce({c}_max, excluded.{c}_max), coalesce(excluded.{c}_max, {c}_max))")
+            sets.append(f"{c}_sum = coalesce({c}_sum, 0) + coalesce(excluded.{c}_sum, 0)")
+            sets.append(f"{c}_n = {c}_n + excluded.{c}_n")
+        cols = ["bucket", "n"] + [f"{c}_{a}" for c in TELEMETRY_COLUMNS for a in ("min", "max", "sum", "n")]
+        self._upsert = (f"INSERT INTO telemetry_{{}} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                        f"ON CONFLICT(bucket) DO UPDATE SET n = n + excluded.n, {', '.join(sets)}")
+
+    def observe(self, conn, rows):
+        """Hook do TelemetryWriter: rows é uma lista de (id, {coluna: valor, 'ts': ...})."""
+        for suffix, _, _, bucket_of in RESOLUTIONS:
+            buckets = {}
+            for _, row in rows:
+                b = buckets.setdefault(bucket_of(row['ts']), [0] + [None, None, None, 0] * len(TELEMETRY_COLUMNS))
+                b[0] += 1
+                for i, c in enumerate(TELEMETRY_COLUMNS):
+                    v, lim = row.get(c), column_limits(c)
+                    if v is None or (lim and not (lim[0] <= v <= lim[1])): continue
+                    j = 1 + i * 4
+                    b[j] = v if b[j] is None else min(b[j], v)
+                    b[j + 1] = v if b[j + 1] is None else max(b[j + 1], v)
+                    b[j + 2] = (b[j + 2] or 0) + v
+                    b[j + 3] += 1
+            conn.executemany(self._upsert.format(suffix), [(k, *v) for k, v in buckets.items()])
+
+    def is_empty(self, conn):
+        return conn.execute("SELECT 1 FROM telemetry_1d LIMIT 1").fetchone() is None
+
+    def rebuild(self, conn):
+        """Backfill completo dos três níveis a partir da tabela telemetry."""
+        for suffix, _, expr, _ in RESOLUTIONS:
+            conn.execute(f"DELETE FROM telemetry_{suffix}")
+            conn.execute(f"INSERT INTO telemetry_{suffix} {_aggregate_select(expr)}")
+
+    def refresh_buckets(self, conn, timestamps):
+        """Recalcula só os buckets que contêm os ts dados (após purge/reset)."""
+        for suffix, seconds, expr, bucket_of in RESOLUTIONS:
+            for b in sorted({bucket_of(ts) for ts in timestamps if ts}):
+                end = (datetime.datetime.strptime(b, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+                conn.execute(f"DELETE FROM telemetry_{suffix} WHERE bucket = ?", (b,))
+                conn.execute(f"INSERT INTO telemetry_{suffix} {_aggregate_select(expr, 'WHERE ts >= ? AND ts < ?')}", (b, end))
+
+# --- CONSULTA DOS GRÁFICOS ---
+def pick_resolution(start, end, max_points):
+    """Resolução mais grossa que ainda dá ~1 ponto por pixel; None = dados brutos."""
+    span = (datetime.datetime.strptime(end, "%Y-%m-%d %H:%M:%S") - datetime.datetime.strptime(start, "%Y-%m-%d %H:%M:%S")).total_seconds()
+    if span / RAW_INTERVAL <= max_points: return None
+    for suffix, seconds, _, _ in RESOLUTIONS:
+        if span / seconds >= max_points / 2: return suffix
+    return None
+
+def filter_series(values, is_temp=False):
+    """Blindagem do gráfico: limites físicos e, para temperaturas, saltos > 10 graus."""
+    result = []
+    last_val = None
+    for v in values:
+        try:
+            vf = float(v)
+            if is_temp:
+                # Ignora se fora dos limites físicos ou se houver um salto absurdo (>10 graus)
+                if not (-20 <= vf <= 120) or (last_val is not None and abs(vf - last_val) > 10.0):
+                    vf = None
+            else:
+                if not (0 <= vf <= 100):
+                    vf = None
+        except (ValueError, TypeError):
+            vf = None
+
+        if vf is not None: last_val = vf
+        result.append(vf)
+    return result
+
+# --- SÉRIES EM COLUNAS (NUMPY OU array('d')) ---
+# kind -> (mínimo, máximo, salto máximo entre leituras aceites ou None)
+SERIES_LIMITS = {'temp': (-20, 120, 10.0), 'pct': (0, 100, None)}
+JUMP_BLOCK_MIN, JUMP_BLOCK_MAX = 32, 4096
+
+def _to_float(v):
+    try: return float(v)
+    except (ValueError, TypeError): return float('nan')
+
+def column_array(values):
+    """Coluna como vetor float64 com NaN no lugar de None/lixo (ex.: '--' gravado por versões antigas)."""
+    if np is not None:
+        try: return np.array(values, dtype=np.float64)
+        except (ValueError, TypeError): return np.array([_to_float(v) for v in values], dtype=np.float64)
+    return array('d', [_to_float(v) for v in values])
+
+def _accept_jumps(v, ok, jump):
+    """Aplica o filtro de saltos com o mesmo estado sequencial de filter_series.
+
+    Cada janela compara as leituras com a última aceite (forward-fill das válidas); só no
+    primeiro salto rejeitado é que o estado muda, por isso a janela recomeça logo a seguir
+    a ele. Depois de um salto, um trecho curto é resolvido em Python puro, para que séries
+    cheias de glitches não paguem uma passagem vetorizada por rejeição."""
+    n = len(v)
+    accepted = ok.copy()
+    last, p, size, seq = np.nan, 0, JUMP_BLOCK_MAX, JUMP_BLOCK_MIN
+    while p < n:
+        end = min(n, p + size)
+        seg, seg_ok = v[p:end], ok[p:end]
+        vals = np.concatenate(([last], seg))
+        idx = np.where(np.concatenate(([True], seg_ok)), np.arange(len(vals)), 0)
+        np.maximum.accumulate(idx, out=idx)
+        prev = vals[idx[:-1]]
+        with np.errstate(invalid='ignore'):
+            bad = seg_ok & (np.abs(seg - prev) > jump)
+        if not bad.any():
+            if seg_ok.any(): last = seg[seg_ok][-1]
+            p, size, seq = end, min(size * 2, JUMP_BLOCK_MAX), JUMP_BLOCK_MIN
+            continue
+        k = int(np.argmax(bad))
+        if seg_ok[:k].any(): last = seg[:k][seg_ok[:k]][-1]
+        # Trecho sequencial a partir do salto (inclusive), maior se os saltos se repetirem
+        stop = min(n, p + k + seq)
+        for i, (x, good) in enumerate(zip(v[p + k:stop].tolist(), ok[p + k:stop].tolist()), p + k):
+            if not good: continue
+            if last == last and abs(x - last) > jump: accepted[i] = False
+            else: last = x
+        p, size, seq = stop, JUMP_BLOCK_MIN, min(seq * 2, JUMP_BLOCK_MAX)
+    return accepted
+
+def filter_column(arr, kind):
+    """Versão vetorizada de filter_series: devolve a coluna com NaN nas leituras rejeitadas."""
+    if kind is None: return arr
+    lo, hi, jump = SERIES_LIMITS[kind]
+    if np is None:
+        return array('d', [float('nan') if v is None else v for v in filter_series(arr, jump is not None)])
+    with np.errstate(invalid='ignore'):
+        ok = (arr >= lo) & (arr <= hi)
+    if jump is not None: ok = _accept_jumps(arr, ok, jump)
+    return np.where(ok, arr, np.nan)
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets: reduz [(x, y), ...] a threshold pontos preservando a forma."""
+    n = len(points)
+    if threshold >= n: return points
+    if threshold < 3: return [points[0], points[-1]]
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Média do próximo bucket, usada como terceiro vértice do triângulo
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, n)
+        avg_len = avg_end - avg_start
+        avg_x = sum(p[0] for p in points[avg_start:avg_end]) / avg_len
+        avg_y = sum(p[1] for p in points[avg_start:avg_end]) / avg_len
+        ax, ay = points[a]
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            px, py = points[j]
+            area = abs((ax - avg_x) * (py - ay) - (ax - px) * (avg_y - ay))
+            if area > best_area: best_area, best = area, j
+        sampled.append(points[best]); a = best
+    sampled.append(points[-1])
+    return sampled
+
+def downsample(points, threshold):
+    """LTTB por troço contínuo: os buracos (y None) continuam no gráfico como (x, None)."""
+    if len(points) <= threshold: return points
+    segments, cur = [], []
+    for p in points:
+        if p[1] is None:
+            if cur: segments.append(cur); cur = []
+        else: cur.append(p)
+    if cur: segments.append(cur)
+    total = sum(len(seg) for seg in segments)
+    if not total: return []
+    result = []
+    for seg in segments:
+        if result: result.append((seg[0][0], None))
+        result.extend(lttb(seg, max(2, round(threshold * len(seg) / total))))
+    return result
+
+def _lttb_indices(x, y, threshold):
+    """LTTB sobre vetores numpy: médias dos buckets por soma acumulada, área por bucket vetorizada."""
+    n = len(x)
+    if threshold >= n: return np.arange(n)
+    if threshold < 3: return np.array([0, n - 1])
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold) * every).astype(np.int64) + 1
+    edges[-1] = min(edges[-1], n)
+    cx, cy = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    # Bucket de médias de i = bucket de pontos de i + 1 (o último termina no ponto final)
+    avg_end = np.minimum(np.append(edges[2:], n), n)
+    avg_start = edges[1:]
+    with np.errstate(invalid='ignore'):  # o último slot fica vazio e não é usado
+        avg_x = (cx[avg_end] - cx[avg_start]) / (avg_end - avg_start)
+        avg_y = (cy[avg_end] - cy[avg_start]) / (avg_end - avg_start)
+    out = np.empty(threshold, dtype=np.int64); out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        s, e = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i]) * (y[s:e] - ay) - (ax - x[s:e]) * (avg_y[i] - ay))
+        a = out[i + 1] = s + int(np.argmax(area))
+    return out
+
+def _downsample_array(x, y, threshold):
+    """downsample() sobre vetores: y com NaN nos buracos; devolve [(x, y | None), ...]."""
+    if len(x) <= threshold:
+        return [(xv, None if yv != yv else yv) for xv, yv in zip(x.tolist(), y.tolist())]
+    valid = ~np.isnan(y)
+    total = int(valid.sum())
+    if not total: return []
+    # Troços contínuos de leituras válidas: [início, fim)
+    flips = np.flatnonzero(np.diff(np.concatenate(([False], valid, [False])).astype(np.int8)))
+    result = []
+    for s, e in zip(flips[0::2], flips[1::2]):
+        sx, sy = x[s:e], y[s:e]
+        if result: result.append((sx[0].item(), None))
+        keep = _lttb_indices(sx, sy, max(2, round(threshold * (e - s) / total)))
+        result.extend(zip(sx[keep].tolist(), sy[keep].tolist()))
+    return result
+
+# (nome no template, coluna, filtro: 'temp' | 'pct' | None)
+CHART_SERIES = [
+    ('c_int_t', 'int_t', 'temp'), ('c_int_h', 'int_h', 'pct'), ('c_ext_t', 'ext_t', 'temp'),
+    ('c_rack_t', 's_t', 'temp'), ('c_m_core', 'm_core_t', 'temp'), ('c_s_core', 's_core_t', 'temp'),
+    ('c_m_cpu', 'm_c', None), ('c_m_ram', 'm_r', None), ('c_s_cpu', 's_c', None), ('c_s_ram', 's_r', None),
+    ('c_fan', 's_f', 'pct'),
+    ('c_net_d', 'n_d', None), ('c_net_u', 'n_u', None), ('c_s_net_d', 'sn_d', None), ('c_s_net_u', 'sn_u', None),
+]
+
+def fetch_columns(conn, start, end, resolution):
+    """Lê o intervalo uma única vez em colunas: (x em ms, {coluna: vetor float}).
+
+    O SQLite devolve o instante já como epoch em ms (hora local tratada como UTC, que o
+    browser mostra como hora de parede), por isso cada linha é toda numérica e entra num único array 2D com numpy."""
+    cols = [c for _, c, _ in CHART_SERIES]
+    if resolution is None:
+        q = f"SELECT CAST(strftime('%s', ts) AS INTEGER) * 1000, {', '.join(cols)} FROM telemetry WHERE ts BETWEEN ? AND ? ORDER BY ts ASC"
+        params = (start, end)
+    else:
+        bucket_of = next(r[3] for r in RESOLUTIONS if r[0] == resolution)
+        avgs = ", ".join(f"{c}_sum / {c}_n" for c in cols)
+        q = f"SELECT CAST(strftime('%s', bucket) AS INTEGER) * 1000, {avgs} FROM telemetry_{resolution} WHERE bucket BETWEEN ? AND ? ORDER BY bucket ASC"
+        params = (bucket_of(start), end)
+    rows = conn.execute(q, params).fetchall()
+    if np is not None and rows:
+        try: m = np.array(rows, dtype=np.float64)
+        except (ValueError, TypeError): m = None  # lixo textual numa coluna: conversão por valor
+        if m is not None: return m[:, 0].astype(np.int64), {c: m[:, i + 1] for i, c in enumerate(cols)}
+    columns = list(zip(*rows)) if rows else [()] * (len(cols) + 1)
+    xs = np.array(columns[0], dtype=np.int64) if np is not None else array('q', columns[0])
+    return xs, {c: column_array(columns[i + 1]) for i, c in enumerate(cols)}
+
+def prepare_series(xs, data, max_points=1000):
+    """Colunas -> séries do gráfico [(x_ms, y), ...]: filtro vetorizado e downsample por série."""
+    series = {}
+    for name, col, kind in CHART_SERIES:
+        ys = filter_column(data[col], kind)
+        if np is not None: series[name] = _downsample_array(xs, ys, max_points)
+        else: series[name] = downsample([(x, None if y != y else y) for x, y in zip(xs, ys)], max_points)
+    return series
+
+# Da mais fina para a mais grossa; None = tabela bruta
+TIERS = [None] + [suffix for suffix, _, _, _ in reversed(RESOLUTIONS)]
+
+def load_chart_series(conn, start, end, max_points=1000):
+    """Séries dos gráficos como [(x_ms, y), ...], na resolução escolhida e limitadas a ~max_points.
+
+    A retenção apaga primeiro as linhas brutas, depois os buckets de 1 min e de 1 h: se o nível
+    escolhido já não tem nada no intervalo, desce para o seguinte mais grosso que ainda tenha."""
+    resolution = pick_resolution(start, end, max_points)
+    for tier in TIERS[TIERS.index(resolution):]:
+        xs, data = fetch_columns(conn, start, end, tier)
+        if len(xs): return prepare_series(xs, data, max_points), tier or 'raw'
+    return prepare_series(xs, data, max_points), resolution or 'raw'
+
+# --- TABELA PAGINADA (KEYSET) ---
+HISTORY_SORT_COLUMNS = ['ts', 'int_t', 'ext_t', 's_t', 'm_core_t', 's_core_t', 's_f', 'm_c', 's_c', 'n_d']
+HISTORY_TABLE_COLUMNS = ('id', 'ts', 'int_t', 'int_h', 'ext_t', 'm_core_t', 's_core_t', 's_t', 's_f', 'n_d', 'n_u', 'sn_d', 'sn_u')
+PAGE_SIZE, PAGE_SIZE_MAX = 100, 500
+NULL_KEY = -1e308  # NULL ordena como o menor valor possível, como no ORDER BY do SQLite
+
+def encode_cursor(key, row_id):
+    return base64.urlsafe_b64encode(json.dumps([key, row_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    key, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(row_id, int) or not isinstance(key, (int, float, str)): raise ValueError("cursor inválido")
+    return key, row_id
+
+def fetch_page(conn, start, end, sort='ts', direction='DESC', limit=PAGE_SIZE, cursor=None):
+    """Uma página da tabela por seek em (coluna de ordenação, id): custo constante por página.
+
+    Devolve (linhas como dicts, cursor da próxima página ou None). ValueError para parâmetros inválidos."""
+    if sort not in HISTORY_SORT_COLUMNS: raise ValueError(f"coluna de ordenação inválida: {sort}")
+    if direction not in ('ASC', 'DESC'): raise ValueError(f"direção inválida: {direction}")
+    limit = max(1, min(int(limit), PAGE_SIZE_MAX))
+    key = "ts" if sort == 'ts' else f"IFNULL({sort}, {NULL_KEY})"
+    where, params = "ts BETWEEN ? AND ?", [start, end]
+    if cursor:
+        where += f" AND ({key}, id) {'>' if direction == 'ASC' else '<'} (?, ?)"
+        params += list(decode_cursor(cursor))
+    q = (f"SELECT {key}, {', '.join(HISTORY_TABLE_COLUMNS)} FROM telemetry WHERE {where} "
+         f"ORDER BY {key} {direction}, id {direction} LIMIT ?")
+    rows = conn.execute(q, params + [limit + 1]).fetchall()
+    nxt = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+    return [dict(zip(HISTORY_TABLE_COLUMNS, r[1:])) for r in rows[:limit]], nxt
@@ -1,43 +1,51 @@
-import psutil, socket, requests, io, datetime, time, json, os, glob, threading, traceback, sqlite3
-from flask import Flask, send_file, request, render_template, redirect, jsonify, make_response
-from PIL import Image, ImageDraw, ImageFont, ImageOps
-from w1thermsensor import W1ThermSensor
+import io, datetime, time, os, glob, threading, traceback, sqlite3, signal, sys, atexit
+from flask import Flask, send_file, request, render_template, redirect, jsonify, make_response, Response, stream_with_context
+from renderer import RenderEngine, icon_cache, FORMATS as RENDER_FORMATS, FONT_SIZE_MIN, FONT_SIZE_MAX
+from weather import WeatherProvider, icon_name
+from config_store import ConfigStore, LocaleStore
+from telemetry import TelemetryWriter, TELEMETRY_COLUMNS, open_reader, tune_connection
+from records import RecordsBook, RECORD_SPECS
+from history import Rollups, init_rollup_tables, load_chart_series, fetch_page, HISTORY_SORT_COLUMNS, PAGE_SIZE
+import export
+from retention import RetentionEngine, ensure_incremental_vacuum, retention_enabled
+from devices import DeviceRegistry
+from sysmon import SystemSampler
+from nodes import NodeRegistry, init_node_tables, decode_report, store_backlog
+from sensors import SensorScheduler, SensorWorker
+import metrics
+from metrics import DB_ERRORS, DB_QUERY_SECONDS, REPORT_SECONDS, REPORT_ERRORS, INTERNAL_ERRORS
 
 try:
     from gpiozero import PWMOutputDevice
 except ImportError:
     PWMOutputDevice = None
 
+try:
+    from w1thermsensor import W1ThermSensor
+except ImportError:
+    W1ThermSensor = None
+
 # --- ESTADO GLOBAL ---
-latest_sensor_data = {"temp": "--", "hum": "--", "ext_temp": "--"}
-temp_online, cond_online = "--", "Buscando..."
 current_fan_speed = 0.0
 DASH_ACTIVE = True
 CURRENT_LANG = {}
-last_net_io, last_net_time, net_history = None, 0, []
-MAX_HISTORY = 120
-slave_data = {"last_seen": 0, "cpu": 0, "ram": 0, "temp": 0.0, "core_temp": 0.0, "fan": 0, "net_history": []}
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# Caminho para persistência no host (Mapeado via Docker)
-DATA_DIR = "/app/data"
+# Caminho para persistência no host (Mapeado via Docker); DATA_DIR/CONFIG_PATH no ambiente trocam-no (ex.: benchmarks)
+DATA_DIR = os.environ.get("DATA_DIR", "/app/data")
 DB_PATH = os.path.join(DATA_DIR, "telemetry.db")
 
-# --- AUXILIARES DE HARDWARE ---
-def get_master_cpu_temp():
-    """Lê a temperatura interna do SoC do Raspberry Pi (Master)."""
-    try:
-        temps = psutil.sensors_temperatures()
-        if 'cpu_thermal' in temps: return temps['cpu_thermal'][0].current
-        if 'bcm2835_thermal' in temps: return temps['bcm2835_thermal'][0].current
-    except: pass
-    return None
+# --- MÉTRICAS DO SISTEMA ---
+# Uma só thread lê CPU/RAM/SoC/débito/IP; as rotas e a telemetria só leem sysmon.snapshot
+sysmon = SystemSampler(on_sample=lambda snap: render_engine.invalidate())
 
 # --- BANCO DE DADOS (BLACKBOX V4.8.0) ---
 def init_db():
     try:
         if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR, exist_ok=True)
         with sqlite3.connect(DB_PATH) as conn:
+            # Incremental para a retenção devolver espaço; numa base antiga converte só se houver política
+            ensure_incremental_vacuum(conn, convert_existing=retention_enabled(load_config()))
             conn.execute('''CREATE TABLE IF NOT EXISTS telemetry (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 ts DATETIME DEFAULT (datetime('now','localtime')),
@@ -48,9 +56,30 @@ def init_db():
             cols = [('m_core_t','REAL'), ('s_core_t','REAL'), ('sn_d','REAL'), ('sn_u','REAL')]
             for c_n, c_t in cols:
                 try: conn.execute(f'ALTER TABLE telemetry ADD COLUMN {c_n} {c_t}')
-                except: pass
+                except sqlite3.OperationalError: pass  # coluna já existe
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_telemetry_ts ON telemetry(ts)')
+            init_rollup_tables(conn)
+            init_node_tables(conn)
             conn.commit()
-    except: pass
+            # WAL é persistente no ficheiro: leitores deixam de bloquear o escritor
+            tune_connection(conn)
+            records_book.load(conn)
+            if rollups.is_empty(conn) and conn.execute("SELECT 1 FROM telemetry LIMIT 1").fetchone():
+                # Base antiga sem agregados: backfill único antes de o escritor arrancar
+                with conn: rollups.rebuild(conn)
+    except Exception: DB_ERRORS.labels("init").inc(); traceback.print_exc()
+
+# Escritor único da telemetria (WAL + lotes); as rotas leem por conexões só de leitura
+telemetry_writer = TelemetryWriter(DB_PATH)
+# Recordes mín/máx mantidos a cada lote gravado, sem varrer a tabela no carregamento da página
+records_book = RecordsBook()
+telemetry_writer.add_hook(records_book.observe, records_book.invalidate)
+# Agregados de 1 min / 1 h / 1 dia para os gráficos de períodos longos
+rollups = Rollups()
+telemetry_writer.add_hook(rollups.observe)
+# Agentes secundários por id de nó; o primário continua nas colunas s_* e os demais em node_telemetry
+nodes = NodeRegistry()
+telemetry_writer.add_hook(nodes.write_rows)
 
 def log_telemetry():
     try:
@@ -58,196 +87,183 @@ def log_telemetry():
         def f(v):
             if v == "--" or v is None: return None
             try: return float(v)
-            except: return None
+            except (TypeError, ValueError): return None
             
-        s_online = (time.time() - slave_data["last_seen"] < 60)
+        slave, s_online = nodes.primary_state()
+        sys_snap = sysmon.snapshot
         
         v_m_real, v_e_real = get_sensor_value(c['sensor_main']), get_sensor_value(c['sensor_ext'])
         db_int = v_m_real if c['label_main'] == "Int" else (v_e_real if c['label_ext'] == "Int" else None)
         db_ext = v_m_real if c['label_main'] == "Ext" else (v_e_real if c['label_ext'] == "Ext" else None)
 
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute('''INSERT INTO telemetry (
-                int_t, int_h, ext_t, s_t, s_f, s_c, s_r, m_core_t, s_core_t, m_c, m_r, n_d, n_u, sn_d, sn_u
-            ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''', (
-                f(db_int), f(latest_sensor_data["hum"]), f(db_ext),
-                f(slave_data["temp"]) if s_online else None,
-                f(slave_data["fan"]) if s_online else None,
-                f(slave_data["cpu"]) if s_online else None,
-                f(slave_data["ram"]) if s_online else None,
-                get_master_cpu_temp(),
-                f(slave_data["core_temp"]) if s_online else None,
-                psutil.cpu_percent(), psutil.virtual_memory().percent,
-                net_history[-1][0] if net_history else 0,
-                net_history[-1][1] if net_history else 0,
-                f(slave_data.get("net_down", 0)) if s_online else 0,
-                f(slave_data.get("net_up", 0)) if s_online else 0
-            ))
-            conn.commit()
-    except: pass
+        values = (
+            f(db_int), f(local_sensor_data()["hum"]), f(db_ext),
+            slave.temp if s_online else None,
+            slave.fan if s_online else None,
+            slave.cpu if s_online else None,
+            slave.ram if s_online else None,
+            sys_snap.core_temp,
+            slave.core_temp if s_online else None,
+            sys_snap.cpu, sys_snap.ram,
+            sys_snap.net_down, sys_snap.net_up,
+            slave.net_down if s_online else 0,
+            slave.net_up if s_online else 0
+        )
+        row = dict(zip(TELEMETRY_COLUMNS, values))
+        row["ts"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        row["nodes"] = nodes.telemetry_rows()
+        telemetry_writer.submit(row)
+    except Exception: INTERNAL_ERRORS.labels("log_telemetry").inc(); traceback.print_exc()
 
 def get_records_from_db():
-    """Consulta os recordes térmicos diretamente do histórico, ignorando anomalias extremas."""
-    records = {
-        "hist_int_min_log": [], "hist_int_max_log": [],
-        "hist_ext_min_log": [], "hist_ext_max_log": [],
-        "hist_rack_min_log": [], "hist_rack_max_log": [],
-        "hist_fan_min_log": [], "hist_fan_max_log": []
-    }
+    """Recordes térmicos da tabela materializada (ver records.py), já sem anomalias extremas."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            def fetch_top(col, order, target_list):
-                val_filter = ">= -20 AND {} <= 120" if col != 's_f' else ">= 0 AND {} <= 100"
-                q = f"SELECT {col}, ts FROM telemetry WHERE {col} IS NOT NULL AND {col} {val_filter.format(col)} ORDER BY {col} {order}, ts DESC LIMIT 3"
-                rows = conn.execute(q).fetchall()
-                for r in rows:
-                    try:
-                        dt_obj = datetime.datetime.strptime(r['ts'], "%Y-%m-%d %H:%M:%S")
-                        dt_str = dt_obj.strftime("%d/%m %H:%M")
-                    except: dt_str = r['ts']
-                    records[target_list].append({"val": round(r[col], 1), "dt": dt_str})
-
-            fetch_top('int_t', 'ASC', 'hist_int_min_log')
-            fetch_top('int_t', 'DESC', 'hist_int_max_log')
-            fetch_top('ext_t', 'ASC', 'hist_ext_min_log')
-            fetch_top('ext_t', 'DESC', 'hist_ext_max_log')
-            fetch_top('s_t', 'ASC', 'hist_rack_min_log')
-            fetch_top('s_t', 'DESC', 'hist_rack_max_log')
-            fetch_top('s_f', 'ASC', 'hist_fan_min_log')
-            fetch_top('s_f', 'DESC', 'hist_fan_max_log')
-    except Exception as e:
-        traceback.print_exc()
-    return records
+        with DB_QUERY_SECONDS.labels("records").time(), open_reader(DB_PATH) as conn: return records_book.as_display(conn)
+    except Exception:
+        DB_ERRORS.labels("query").inc(); traceback.print_exc()
+        return {kind: [] for kind, _, _ in RECORD_SPECS}
 
 # --- HARDWARE INIT ---
 try:
-    from dht_reader import DHTReader
+    from dht_reader import DHTReader, DHTChecksumError, DHTPulseTimeoutError
     sensor_client = DHTReader("DHT22", "/dev/gpiochip4", 17)
     print("✓ [HARDWARE] DHT22 OK")
 except Exception: sensor_client = None
 
-try: ds_sensor = W1ThermSensor()
+try: ds_sensor = W1ThermSensor() if W1ThermSensor else None
 except Exception: ds_sensor = None
 
 try: fan = PWMOutputDevice(18, frequency=100) if PWMOutputDevice else None
 except Exception: fan = None
 
 # --- GESTÃO DE CONFIGURAÇÃO ---
-def load_config():
-    path = os.path.join(BASE_DIR, 'config.json')
-    default = {
-        "rotation": 1, "font_size": 120, "city_name": "Sao Paulo", "timezone": "America/Sao_Paulo", 
-        "lat": "-23.5505", "lon": "-46.6333", "theme_mode": "auto", "language": "pt_BR", 
-        "brightness": 10, "sensor_main": "online", "sensor_ext": "none", "label_main": "Int", 
-        "label_ext": "Ext", "fan_node": "none", "fan_temp_min": 35.0, "fan_temp_max": 50.0
-    }
-    try:
-        if not os.path.exists(path): return default
-        with open(path, 'r') as f:
-            c = json.load(f); [c.setdefault(k, v) for k, v in default.items()]; return c
-    except: return default
+CONFIG_DEFAULTS = {
+    "rotation": 1, "font_size": 120, "city_name": "Sao Paulo", "timezone": "America/Sao_Paulo", 
+    "lat": "-23.5505", "lon": "-46.6333", "theme_mode": "auto", "language": "pt_BR", 
+    "brightness": 10, "sensor_main": "online", "sensor_ext": "none", "label_main": "Int", 
+    "label_ext": "Ext", "fan_node": "none", "fan_temp_min": 35.0, "fan_temp_max": 50.0,
+    # Retenção em dias (0 = manter para sempre); os agregados de 1 dia nunca expiram
+    "retention_raw_days": 0, "retention_1m_days": 0, "retention_1h_days": 0,
+    # Agente cujas métricas aparecem como "Slave" (vazio = o nó padrão/primeiro a reportar)
+    "slave_node": "",
+    # Perfis por Kindle (cid -> campos de devices.DEVICE_FIELDS); cid desconhecido usa os globais
+    "devices": {}
+}
+# Lido do disco uma vez; recarregado só em /update ou quando o mtime do ficheiro muda
+config_store = ConfigStore(os.environ.get("CONFIG_PATH", os.path.join(BASE_DIR, 'config.json')), CONFIG_DEFAULTS)
+locale_store = LocaleStore(os.path.join(BASE_DIR, 'locale'))
+
+def load_config(): return config_store.get()
+
+# Limpeza periódica em blocos + incremental_vacuum (ver retention.py)
+retention = RetentionEngine(DB_PATH, load_config)
+devices = DeviceRegistry(load_config)
+nodes.configure(load_config())
 
 def save_config(data):
     # Remove as chaves injetadas pela UI antes de salvar no disco para evitar poluição
     clean_data = {k: v for k, v in data.items() if not k.startswith("hist_")}
-    path = os.path.join(BASE_DIR, 'config.json')
-    with open(path, 'w') as f: json.dump(clean_data, f, indent=4)
+    config_store.save(clean_data)
 
 # --- AUXILIARES DE DADOS ---
+def slave_temp():
+    slave, online = nodes.primary_state()
+    return f"{slave.temp:.1f}" if online else "--"
+
 def get_sensor_value(sensor_key):
-    if sensor_key == "online": return temp_online
-    if sensor_key == "dht": return latest_sensor_data["temp"]
-    if sensor_key == "ds18": return latest_sensor_data["ext_temp"]
-    if sensor_key == "slave": 
-        return f"{slave_data['temp']:.1f}" if (time.time() - slave_data['last_seen'] < 60) else "--"
+    if sensor_key == "online": return weather.current()["temp"]
+    if sensor_key == "dht": return local_sensor_data()["temp"]
+    if sensor_key == "ds18": return local_sensor_data()["ext_temp"]
+    if sensor_key == "slave": return slave_temp()
     return "--"
 
-def get_weather_data(lat, lon):
-    global temp_online, cond_online
-    try:
-        r = requests.get(f"http://api.weatherapi.com/v1/current.json?key=4df7b3293f31480b96c115457261002&q={lat},{lon}&lang=pt", timeout=5).json()
-        temp_online, cond_online = r['current']['temp_c'], r['current']['condition']['text']
-        return temp_online, cond_online, "https:" + r['current']['condition']['icon']
-    except: return "--", "Erro API", None
+def on_weather_update(w):
+    name = icon_name(w.get("icon_url"))
+    if name: icon_cache.get(name, (180, 180), load_config().get('theme_mode'))
+    render_engine.invalidate()
+
+# O clima é atualizado pela sua própria thread; as leituras nunca esperam pela API
+weather = WeatherProvider(on_update=on_weather_update)
+
+# --- SENSORES LOCAIS ---
+# Cada sensor tem a sua thread, cadência e tentativas (ver sensors.py); ninguém espera pelo hardware
+SENSOR_INTERVAL, TELEMETRY_INTERVAL = 10.0, 10.0
+
+def is_valid_temp(new_t, old_t):
+    """Faixa física do sensor e saltos de no máximo 10 °C face à leitura anterior ainda válida."""
+    if new_t is None or not (-20 <= new_t <= 120): return False
+    return old_t is None or abs(new_t - old_t) <= 10.0
+
+def read_dht():
+    h, t_val, _ = sensor_client.read_data()
+    return (h if h is not None and 0 <= h <= 100 else None), t_val
+
+def dht_error_reason(e):
+    if isinstance(e, DHTChecksumError): return "checksum"
+    if isinstance(e, DHTPulseTimeoutError): return "timeout"
+    if isinstance(e, ValueError): return "too_soon"
+    # Linha sem deteção de bordas: o DHTReader passa sozinho para o modo poll na próxima leitura
+    if isinstance(e, OSError): return "gpio"
+    return "error"
+
+sensors = SensorScheduler()
+if sensor_client:
+    sensors.add(SensorWorker("dht", read_dht, SENSOR_INTERVAL, min_delay=sensor_client.min_delay, retries=2,
+                             validate=lambda v, old: is_valid_temp(v[1], old[1] if old else None),
+                             classify=dht_error_reason, on_value=lambda r: render_engine.invalidate()))
+if ds_sensor:
+    sensors.add(SensorWorker("ds18", ds_sensor.get_temperature, SENSOR_INTERVAL, retries=1,
+                             validate=is_valid_temp, on_value=lambda r: render_engine.invalidate()))
+
+def local_sensor_data():
+    """Leituras locais formatadas; "--" se o sensor não existe ou não tem leitura recente."""
+    dht, ext = sensors.fresh("dht"), sensors.fresh("ds18")
+    fmt = lambda v: f"{v:.1f}" if v is not None else "--"
+    return {"temp": fmt(dht[1] if dht else None), "hum": fmt(dht[0] if dht else None), "ext_temp": fmt(ext)}
 
 # --- SENTINELA (THREAD DE BACKGROUND) ---
 def update_sensor_background():
-    global latest_sensor_data, current_fan_speed
+    """Ventoinha e telemetria a cada TELEMETRY_INTERVAL s, só com os valores já publicados."""
     init_db()
-    last_weather_check = 0
-    
-    def is_valid_temp(new_t, old_t_str):
-        if new_t is None or not (-20 <= new_t <= 120): return False
-        if old_t_str != "--":
-            try:
-                if abs(new_t - float(old_t_str)) > 10.0: return False
-            except: pass
-        return True
-
+    next_tick = time.monotonic()
     while True:
-        update_net_stats()
-        c = load_config()
-        if time.time() - last_weather_check > 900:
-            get_weather_data(c['lat'], c['lon']); last_weather_check = time.time()
-        
-        # 1. LEITURA DHT22 (Interno)
-        if sensor_client:
-            try:
-                h, t_val, _ = sensor_client.read_data()
-                if is_valid_temp(t_val, latest_sensor_data["temp"]):
-                    latest_sensor_data["temp"] = f"{t_val:.1f}"
-                if h is not None and 0 <= h <= 100:
-                    latest_sensor_data["hum"] = f"{h:.1f}"
-            except: pass
-            
-        # 2. LEITURA DS18B20 (Externo)
-        if ds_sensor:
-            try:
-                t_ext = ds_sensor.get_temperature()
-                if is_valid_temp(t_ext, latest_sensor_data["ext_temp"]):
-                    latest_sensor_data["ext_temp"] = f"{t_ext:.1f}"
-            except: pass
-
-        # 3. CONTROLE TÉRMICO
-        if c.get("fan_node") == "main":
-            target_temp = latest_sensor_data["ext_temp"]
-        elif c.get("fan_node") == "slave":
-            target_temp = f"{slave_data['temp']:.1f}" if (time.time()-slave_data['last_seen'] < 60) else "--"
-        else: target_temp = "--"
-
-        if target_temp != "--" and fan and c.get("fan_node") == "main":
-            try:
-                tv, tmin, tmax = float(target_temp), float(c["fan_temp_min"]), float(c["fan_temp_max"])
-                limit_off = tmin - 10.0
-                if tv <= limit_off: speed = 0.0
-                elif tv <= tmin: speed = 0.2
-                else: speed = min(1.0, max(0.2, 0.2 + (0.8 * ((tv - tmin) / (tmax - tmin)))))
-                fan.value = speed; current_fan_speed = speed
-            except: pass
-        
-        log_telemetry(); time.sleep(10)
+        try:
+            c = load_config()
+            weather.set_location(c['lat'], c['lon'])
+            apply_fan_control(c)
+            log_telemetry(); render_engine.invalidate()
+        except Exception: INTERNAL_ERRORS.labels("tick").inc(); traceback.print_exc()
+        next_tick = max(next_tick + TELEMETRY_INTERVAL, time.monotonic())
+        time.sleep(next_tick - time.monotonic())
+
+def apply_fan_control(c):
+    """Controle térmico da ventoinha local a partir da configuração dada."""
+    global current_fan_speed
+    if c.get("fan_node") == "main":
+        target_temp = local_sensor_data()["ext_temp"]
+    elif c.get("fan_node") == "slave":
+        target_temp = slave_temp()
+    else: target_temp = "--"
+
+    if target_temp != "--" and fan and c.get("fan_node") == "main":
+        try:
+            tv, tmin, tmax = float(target_temp), float(c["fan_temp_min"]), float(c["fan_temp_max"])
+            limit_off = tmin - 10.0
+            if tv <= limit_off: speed = 0.0
+            elif tv <= tmin: speed = 0.2
+            else: speed = min(1.0, max(0.2, 0.2 + (0.8 * ((tv - tmin) / (tmax - tmin)))))
+            fan.value = speed; current_fan_speed = speed
+        except Exception: INTERNAL_ERRORS.labels("fan").inc(); traceback.print_exc()
 
 app = Flask(__name__)
-ICONS_DIR = os.path.join(BASE_DIR, "icons")
 
 def load_translation_file():
     global CURRENT_LANG
-    conf = load_config()
-    path = os.path.join(BASE_DIR, 'locale', f"{conf.get('language', 'pt_BR')}.json")
-    try:
-        with open(path, 'r', encoding='utf-8') as f: CURRENT_LANG = json.load(f)
-    except: CURRENT_LANG = {}
+    CURRENT_LANG = locale_store.get(load_config().get('language', 'pt_BR'))
     return CURRENT_LANG
 
 def t(key): return CURRENT_LANG.get(key, key)
 
-def get_ip():
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80)); return s.getsockname()[0]
-    except: return "Offline"
-
 def get_moon_phase():
     diff = datetime.datetime.now() - datetime.datetime(2000, 1, 6, 18, 14, 0)
     index = int((diff.total_seconds() / 86400 % 29.530588) / 29.530588 * 8) % 8
@@ -255,74 +271,54 @@ def get_moon_phase():
     phases = ["m_new", "m_wax_cresc", "m_first_q", "m_wax_gib", "m_full", "m_wan_gib", "m_last_q", "m_wan_cresc"]
     return icons[index], phases[index]
 
-def draw_gauge(draw, x, y, radius, percent, label, font_val, font_label, color):
-    start, end = 135, 405; curr = start + ((end - start) * (percent / 100))
-    draw.arc([x-radius, y-radius, x+radius, y+radius], start=start, end=end, fill=color, width=3)
-    draw.arc([x-radius, y-radius, x+radius, y+radius], start=start, end=curr, fill=color, width=12)
-    draw.text((x, y), f"{int(percent)}%", font=font_val, fill=color, anchor="mm")
-    draw.text((x, y + radius + 15), label, font=font_label, fill=color, anchor="mm")
-
-def draw_sparkline(draw, x, y, w, h, data, label, font_val, font_axis, color):
-    draw.line((x, y, x, y+h), fill=color, width=3); draw.line((x, y+h, x+w, y+h), fill=color, width=3)
-    if data:
-        max_v = max(data) if max(data) > 10 else 10
-        y_lbl = f"{max_v/1024:.1f}M" if max_v > 1024 else f"{int(max_v)}K"
-        draw.text((x - 10, y), y_lbl, font=font_axis, fill=color, anchor="rm")
-        step_x = w / (MAX_HISTORY - 1); pts = [(x + (i * step_x), (y + h) - ((v / max_v) * h)) for i, v in enumerate(data)]
-        if len(pts) > 1: draw.line(pts, fill=color, width=3)
-        draw.text((x, y-35), f"{label}: {data[-1]/1024:.1f}MB/s" if data[-1]>1024 else f"{label}: {int(data[-1])}KB/s", font=font_val, fill=color)
-
-def update_net_stats():
-    global last_net_io, last_net_time, net_history
-    now, io_now = time.time(), psutil.net_io_counters()
-    down, up = 0, 0
-    if last_net_io:
-        dt = now - last_net_time
-        if dt > 0:
-            down = (io_now.bytes_recv - last_net_io.bytes_recv) / dt / 1024
-            up = (io_now.bytes_sent - last_net_io.bytes_sent) / dt / 1024
-    last_net_io, last_net_time = io_now, now
-    net_history.append((down, up)); [net_history.pop(0) for _ in range(len(net_history) - MAX_HISTORY)]
-    return down, up
-
 @app.route('/report', methods=['POST'])
 def report():
-    global slave_data
-    if request.is_json:
-        data = request.get_json()
-        slave_data.update({
-            "cpu": data.get("cpu", 0), "ram": data.get("ram", 0), "temp": data.get("temp", 0.0), 
-            "core_temp": data.get("core_temp", 0.0), "fan": data.get("fan", 0), 
-            "net_down": data.get("net_down", 0.0), "net_up": data.get("net_up", 0.0),
-            "last_seen": time.time()
-        })
-        slave_data["net_history"].append((data.get("net_down", 0), data.get("net_up", 0)))
-        if len(slave_data["net_history"]) > MAX_HISTORY: slave_data["net_history"].pop(0)
-        
-        c = load_config()
-        return jsonify({
-            "status": "ok",
-            "fan_node": c.get("fan_node", "none"),
-            "fan_temp_min": float(c.get("fan_temp_min", 35.0)),
-            "fan_temp_max": float(c.get("fan_temp_max", 50.0))
-        })
-    return jsonify({"status": "error"}), 400
+    """Métricas de um agente secundário ({"node": id, ...}; sem node = DEFAULT_NODE). Os agentes
+    novos mandam a média da janela nos campos de sempre e {campo: [mín, média, máx]} em "agg".
+    Depois de uma queda o agente manda o atraso num só pedido, {"node", "samples": [...]} em gzip;
+    as amostras atrasadas vão para a base com o ts original (ver nodes.store_backlog)."""
+    with REPORT_SECONDS.time():
+        try: data = decode_report(request.get_data(cache=False), request.headers.get('Content-Encoding'))
+        except ValueError as e:
+            REPORT_ERRORS.labels("bad_body").inc(); return jsonify({"status": "error", "error": str(e)}), 400
+        reply, backlog = nodes.ingest(data)
+        if reply is None:
+            REPORT_ERRORS.labels("rejected").inc(); return jsonify({"status": "error", "error": "invalid batch or too many nodes"}), 400
+        if backlog:
+            try:
+                with sqlite3.connect(DB_PATH, timeout=5) as conn:
+                    filled = store_backlog(conn, reply['node'], backlog, nodes.primary() is nodes.get(reply['node']))
+                    rollups.refresh_buckets(conn, [row['ts'] for _, row in filled])
+                    if filled: records_book.observe(conn, filled)
+                    conn.commit()
+            except Exception:
+                # O estado ao vivo já foi aplicado; o agente reenvia se não receber 200
+                REPORT_ERRORS.labels("storage").inc(); DB_ERRORS.labels("backlog").inc()
+                traceback.print_exc(); return jsonify({"status": "error", "error": "backlog not stored"}), 503
+        render_engine.invalidate()
+        return jsonify(reply)
 
 @app.route('/check_status')
 def check_status(): return "RUN" if DASH_ACTIVE else "STOP"
 
 @app.route('/toggle_status', methods=['POST'])
 def toggle_status():
-    global DASH_ACTIVE; DASH_ACTIVE = not DASH_ACTIVE; return redirect('/')
+    global DASH_ACTIVE; DASH_ACTIVE = not DASH_ACTIVE
+    render_engine.notify()
+    return redirect('/')
 
 @app.route('/reset_history', methods=['POST'])
 def reset_history():
     # Agora expurga glitches residuais do banco em vez de limpar um JSON inútil
     try:
+        cond = "int_t < -20 OR int_t > 120 OR ext_t < -20 OR ext_t > 120 OR s_t < -20 OR s_t > 120"
         with sqlite3.connect(DB_PATH) as conn:
-            conn.execute("DELETE FROM telemetry WHERE int_t < -20 OR int_t > 120 OR ext_t < -20 OR ext_t > 120 OR s_t < -20 OR s_t > 120")
+            hit = conn.execute(f"SELECT id, ts FROM telemetry WHERE {cond}").fetchall()
+            conn.execute(f"DELETE FROM telemetry WHERE {cond}")
+            rollups.refresh_buckets(conn, [ts for _, ts in hit])
             conn.commit()
-    except: pass
+            records_book.forget_rows(conn, [rid for rid, _ in hit])
+    except Exception: DB_ERRORS.labels("reset").inc(); traceback.print_exc()
     return redirect('/')
 
 @app.route('/history')
@@ -334,205 +330,257 @@ def history_page():
     sort_col = request.args.get('sort', 'ts')
     sort_dir = request.args.get('dir', 'DESC').upper()
     
-    allowed = ['ts', 'int_t', 'ext_t', 's_t', 'm_core_t', 's_core_t', 's_f', 'm_c', 's_c', 'n_d']
-    if sort_col not in allowed: sort_col = 'ts'
+    if sort_col not in HISTORY_SORT_COLUMNS: sort_col = 'ts'
     if sort_dir not in ['ASC', 'DESC']: sort_dir = 'DESC'
     
     start_f = f"{start_d} {st_t}:00"
     end_f = f"{end_d} {en_t}:59"
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            logs = conn.execute(f"SELECT * FROM telemetry WHERE ts BETWEEN ? AND ? ORDER BY {sort_col} {sort_dir}", (start_f, end_f)).fetchall()
-            c_data = conn.execute("SELECT * FROM telemetry WHERE ts BETWEEN ? AND ? ORDER BY ts ASC", (start_f, end_f)).fetchall()
-
-        # O Filtro de Blindagem de Gráfico
-        def filter_series(key, is_temp=False):
-            result = []
-            last_val = None
-            for r in c_data:
-                v = r[key] if key in r.keys() else None
-                try:
-                    vf = float(v)
-                    if is_temp:
-                        # Ignora se fora dos limites físicos ou se houver um salto absurdo (>10 graus)
-                        if not (-20 <= vf <= 120) or (last_val is not None and abs(vf - last_val) > 10.0):
-                            vf = None
-                    else:
-                        if not (0 <= vf <= 100):
-                            vf = None
-                except (ValueError, TypeError):
-                    vf = None
-                
-                if vf is not None: last_val = vf
-                result.append(vf)
-            return result
+        # A tabela é carregada por páginas via /api/history à medida que se faz scroll
+        with DB_QUERY_SECONDS.labels("history").time(), open_reader(DB_PATH) as conn:
+            # Gráficos: rollup mais grosso que ainda dá ~1 ponto por pixel, LTTB nos dados brutos
+            series, resolution = load_chart_series(conn, start_f, end_f)
 
         return render_template('history.html', 
-            logs=logs, start_date=start_d, end_date=end_d, start_time=st_t, end_time=en_t, sort=sort_col, dir=sort_dir,
-            c_labels=[r['ts'].split(' ')[1] for r in c_data],
-            # Passa as séries de dados sanitizadas
-            c_int_t=filter_series('int_t', True),
-            c_int_h=filter_series('int_h', False),
-            c_ext_t=filter_series('ext_t', True),
-            c_rack_t=filter_series('s_t', True),
-            c_m_core=filter_series('m_core_t', True),
-            c_s_core=filter_series('s_core_t', True),
-            # Uso de sistema não sofre saltos físicos, passa direto
-            c_m_cpu=[r['m_c'] if 'm_c' in r.keys() else 0 for r in c_data],
-            c_m_ram=[r['m_r'] if 'm_r' in r.keys() else 0 for r in c_data],
-            c_s_cpu=[r['s_c'] if 's_c' in r.keys() else 0 for r in c_data],
-            c_s_ram=[r['s_r'] if 's_r' in r.keys() else 0 for r in c_data],
-            c_fan=filter_series('s_f', False),
-            c_net_d=[r['n_d'] if 'n_d' in r.keys() else 0 for r in c_data],
-            c_net_u=[r['n_u'] if 'n_u' in r.keys() else 0 for r in c_data],
-            c_s_net_d=[r['sn_d'] if 'sn_d' in r.keys() else 0 for r in c_data],
-            c_s_net_u=[r['sn_u'] if 'sn_u' in r.keys() else 0 for r in c_data]
+            page_size=PAGE_SIZE, start_date=start_d, end_date=end_d, start_time=st_t, end_time=en_t, sort=sort_col, dir=sort_dir,
+            c_resolution=resolution, multi_day=(start_d != end_d), **series
         )
     except Exception as e:
-        traceback.print_exc()
+        DB_ERRORS.labels("query").inc(); traceback.print_exc()
         return f"Erro na telemetria: {e}", 500
 
+@app.route('/api/history')
+def api_history():
+    """Página da tabela do histórico: mesmos filtros de /history + limit e cursor (keyset)."""
+    start_d = request.args.get('start_date', datetime.datetime.now().strftime('%Y-%m-%d'))
+    end_d = request.args.get('end_date', datetime.datetime.now().strftime('%Y-%m-%d'))
+    start_f = f"{start_d} {request.args.get('start_time', '00:00')}:00"
+    end_f = f"{end_d} {request.args.get('end_time', '23:59')}:59"
+    try:
+        with DB_QUERY_SECONDS.labels("history_page").time(), open_reader(DB_PATH) as conn:
+            rows, nxt = fetch_page(conn, start_f, end_f, request.args.get('sort', 'ts'), request.args.get('dir', 'DESC').upper(),
+                                   request.args.get('limit', PAGE_SIZE), request.args.get('cursor'))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"rows": rows, "next": nxt})
+
+@app.route('/export')
+def export_telemetry():
+    """Exporta a telemetria em CSV ou NDJSON por streaming (memória constante).
+
+    Parâmetros: format=csv|ndjson, cols=ts,int_t,..., start_date/start_time/end_date/end_time
+    como em /history e gzip=1 para comprimir."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS: return f"Formato inválido: {fmt}", 400
+    try: cols = export.parse_columns(request.args.get('cols', ''))
+    except ValueError as e: return str(e), 400
+    start_d = request.args.get('start_date', datetime.datetime.now().strftime('%Y-%m-%d'))
+    end_d = request.args.get('end_date', datetime.datetime.now().strftime('%Y-%m-%d'))
+    start_f = f"{start_d} {request.args.get('start_time', '00:00')}:00"
+    end_f = f"{end_d} {request.args.get('end_time', '23:59')}:59"
+    use_gzip = request.args.get('gzip', '0') in ('1', 'true', 'yes')
+
+    encode, mimetype, ext = export.FORMATS[fmt]
+    body = encode(cols, export.iter_rows(DB_PATH, cols, start_f, end_f))
+    filename = f"telemetry_{start_d}_{end_d}.{ext}"
+    if use_gzip: body, filename = export.gzip_chunks(body), filename + ".gz"
+    resp = Response(stream_with_context(body), mimetype='application/gzip' if use_gzip else mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return resp
+
 @app.route('/api/stats')
 def api_stats():
-    conf = load_config(); is_s_act = (time.time() - slave_data["last_seen"] < 60)
-    net_down, net_up = update_net_stats()
+    slave, is_s_act = nodes.primary_state()
+    m, local = sysmon.snapshot, local_sensor_data()
     return jsonify({
         "system_master": {
-            "hostname": socket.gethostname(),
-            "core_temp": f"{get_master_cpu_temp():.1f}°C" if get_master_cpu_temp() else "--",
-            "cpu_usage": f"{psutil.cpu_percent()}%",
-            "ram_usage": f"{psutil.virtual_memory().percent}%",
-            "net_down": f"{net_down:.1f} KB/s"
+            "hostname": m.hostname,
+            "core_temp": f"{m.core_temp:.1f}°C" if m.core_temp else "--",
+            "cpu_usage": f"{m.cpu}%",
+            "ram_usage": f"{m.ram}%",
+            "net_down": f"{m.net_down:.1f} KB/s",
+            "sampled_at": m.ts
         },
         "system_slave": {
             "status": "Online" if is_s_act else "Offline",
-            "core_temp": f"{slave_data['core_temp']:.1f}°C",
-            "cpu_usage": f"{slave_data['cpu']}%",
-            "temp": f"{slave_data['temp']:.1f}°C",
-            "fan_speed": f"{slave_data['fan']}%"
+            "core_temp": f"{slave.core_temp:.1f}°C",
+            "cpu_usage": f"{slave.cpu}%",
+            "temp": f"{slave.temp:.1f}°C",
+            "fan_speed": f"{slave.fan}%"
         },
+        "nodes": nodes.summary(),
+        "telemetry_writer": telemetry_writer.stats(),
+        "render": render_engine.stats(),
+        "retention": {"last_run": retention.last_run, "totals": retention.totals},
+        "sensors": sensors.status(),
         "environment": {
-            "internal_temp": f"{latest_sensor_data['temp']}°C",
-            "internal_hum": f"{latest_sensor_data['hum']}%",
-            "external_temp": f"{latest_sensor_data['ext_temp']}°C"
+            "internal_temp": f"{local['temp']}°C",
+            "internal_hum": f"{local['hum']}%",
+            "external_temp": f"{local['ext_temp']}°C"
         }
     })
 
+# --- MÉTRICAS (PROMETHEUS) ---
+# Filas, buffers e contadores que os objetos já mantêm: lidos só no scrape
+metrics.gauge_fn("kindleberry_telemetry_queue_depth", "Linhas à espera do escritor da telemetria.",
+                 lambda: telemetry_writer.stats()["queue_depth"])
+metrics.counter_fn("kindleberry_telemetry_rows_total", "Linhas da telemetria gravadas, descartadas (fila cheia) ou perdidas após max_retries.",
+                   lambda: {"written": telemetry_writer.counters["rows_written"], "dropped": telemetry_writer.counters["rows_dropped"],
+                            "failed": telemetry_writer.counters["rows_failed"]}, ("result",))
+metrics.counter_fn("kindleberry_render_events_total", "Jobs do pool de render e como cada pedido foi servido.",
+                   lambda: dict(render_engine.counters), ("event",))
+metrics.gauge_fn("kindleberry_render_inflight", "Jobs em curso no pool de render.", lambda: render_engine.stats()["inflight"])
+metrics.gauge_fn("kindleberry_wait_clients", "Kindles estacionados no /wait.", lambda: render_engine.stats()["waiters"])
+metrics.gauge_fn("kindleberry_frame_version", "Versão publicada do frame.", lambda: render_engine.published)
+metrics.gauge_fn("kindleberry_sysmon_buffer_fill", "Ocupação do buffer circular do débito do Master (0-1).", lambda: sysmon.fill())
+metrics.gauge_fn("kindleberry_node_buffer_fill", "Ocupação dos buffers circulares de cada agente (0-1).",
+                 lambda: {n.node_id: len(n.net_history) / nodes.history for n in nodes.nodes()}, ("node",))
+metrics.gauge_fn("kindleberry_node_online", "1 se o agente reportou nos últimos NODE_TIMEOUT segundos.",
+                 lambda: {n.node_id: int(n.online()) for n in nodes.nodes()}, ("node",))
+metrics.gauge_fn("kindleberry_weather_age_seconds", "Idade do último clima válido.", lambda: weather.current()["age"])
+metrics.gauge_fn("kindleberry_dht_mode", "Modo de leitura do DHT22 (edge = bordas do kernel, poll = busy-wait).",
+                 lambda: {sensor_client.mode: 1} if sensor_client else {}, ("mode",))
+metrics.gauge_fn("kindleberry_source_age_seconds", "Idade da última leitura válida de cada fonte (sensores, clima, sistema).",
+                 lambda: dict(sensors.ages(), weather=weather.current()["age"],
+                              system=time.time() - sysmon.snapshot.ts if sysmon.snapshot.ts else None), ("source",))
+metrics.gauge_fn("kindleberry_sensor_failed_cycles", "Ciclos seguidos sem leitura válida (afastam o próximo ciclo).",
+                 lambda: {name: w.failed_cycles for name, w in sensors.workers.items()}, ("sensor",))
+metrics.gauge_fn("kindleberry_dashboard_active", "1 = RUN, 0 = STOP.", lambda: int(DASH_ACTIVE))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Formato de texto do Prometheus (version 0.0.4); ver metrics.py."""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def build_render_snapshot():
+    """Reúne as entradas do dashboard num dict simples; o motor só redesenha quando ele muda."""
+    conf = load_config(); load_translation_file()
+    now = datetime.datetime.now()
+    moon_icon, moon_key = get_moon_phase()
+    w, local = weather.current(), local_sensor_data()
+
+    def get_display_val(s):
+        if s == "online": return str(w["temp"]), None
+        if s == "dht": return local["temp"], local["hum"]
+        if s == "ds18": return local["ext_temp"], None
+        if s == "slave": return slave_temp(), None
+        return "--", None
+
+    v1, h1 = get_display_val(conf['sensor_main'])
+    v2, h2 = get_display_val(conf['sensor_ext'])
+    slave, is_s_act = nodes.primary_state()
+    summary, m = nodes.summary(), sysmon.snapshot
+    rack_t, fan_p = (f"{slave.temp:.1f}", str(slave.fan)) if (conf.get("fan_node") == "slave" and is_s_act) else (local['ext_temp'], str(int(current_fan_speed * 100)))
+    return {
+        "theme": conf.get('theme_mode'), "font_size": max(FONT_SIZE_MIN, min(int(conf.get('font_size', 120)), FONT_SIZE_MAX)), "rotation": conf.get('rotation', 1),
+        "clock": now.strftime("%H:%M"), "date": f"{t(f'day_{now.weekday()}')}, {now.strftime('%d/%m')}",
+        "city": conf.get('city_name', 'Dashboard'), "label_main": conf.get('label_main', ''), "label_ext": conf.get('label_ext', ''),
+        "sensor_ext": conf['sensor_ext'], "v1": v1, "v2": v2,
+        "hum": h1 if conf['sensor_main'] == "dht" else h2 if conf['sensor_ext'] == "dht" else None,
+        "cond": w["cond"], "icon": icon_name(w["icon_url"]),
+        "ip": m.ip, "rack_t": rack_t, "fan_p": fan_p, "s_act": is_s_act,
+        "m_cpu": int(m.cpu), "m_ram": int(m.ram), "m_net": m.net_history,
+        "s_cpu": int(slave.cpu), "s_ram": int(slave.ram), "s_net": nodes.primary_net(),
+        "nodes": (sum(n['online'] for n in summary), len(summary), next((n['node'] for n in summary if n['primary']), '')),
+        "moon_icon": moon_icon, "moon_label": t(moon_key)
+    }
+
+# Processos que desenham e codificam os frames fora do GIL do Flask; 0 = desenha na thread do motor
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "2"))
+render_engine = RenderEngine(build_render_snapshot, workers=RENDER_WORKERS)
+
+def on_config_change(new, old):
+    """Subscritor do config_store: renderizador, clima e ventoinha reagem na hora."""
+    weather.set_location(new['lat'], new['lon'])
+    nodes.configure(new)
+    apply_fan_control(new)
+    render_engine.invalidate()
+    if any(new.get(k) != old.get(k) for k in ('retention_raw_days', 'retention_1m_days', 'retention_1h_days')): retention.trigger()
+
+config_store.subscribe(on_config_change)
+
+def frame_response(cid, kbat, fmt=None, dither=None, force_full=False):
+    """Resposta com o frame (ou a região alterada, com cid) no perfil do Kindle cid."""
+    settings = devices.settings(cid)
+    fmt = fmt or settings['format']
+    dither = settings['dither'] if dither is None else dither == '1'
+    if fmt not in RENDER_FORMATS: return make_response(f"Formato inválido: {fmt}", 400)
+    mimetype = RENDER_FORMATS[fmt][1]
+    if not cid:
+        res = make_response(send_file(io.BytesIO(render_engine.encoded(kbat, fmt, dither)), mimetype=mimetype))
+    else:
+        d = render_engine.delta(cid, kbat, force_full, fmt, dither, devices.profile(settings), settings['partial_limit'])
+        devices.seen(cid, kbat=kbat, mode=d.mode, format=fmt, ip=request.remote_addr)
+        res = make_response('', 204) if d.mode == 'none' else make_response(send_file(io.BytesIO(d.data), mimetype=mimetype))
+        res.headers['X-Frame-Mode'] = d.mode
+        res.headers['X-Frame-Version'] = str(d.version)
+        if d.region: res.headers['X-Region'] = ",".join(map(str, d.region))
+        res.headers['X-Refresh'] = str(settings['refresh_interval'])
+    res.headers['X-Brightness'] = str(settings['brightness'])
+    return res
+
 @app.route('/dashboard.png')
 def serve_dashboard():
+    """Frame do Kindle. ?format=png|png4|pgm escolhe a codificação (png4 = 16 cinzas, dither=1 opcional).
+    Com ?cid= usa o perfil desse Kindle (config['devices'][cid]: tamanho, rotação, tema, fonte, formato)
+    e responde só a região alterada desde o último frame dele:
+    X-Frame-Mode full|partial|none (204), X-Region x,y,w,h no frame já rodado; ?full=1 força o frame inteiro."""
     try:
-        kindle_bat = request.args.get('kbat'); conf = load_config(); load_translation_file()
-        now = datetime.datetime.now()
-        
-        W, H = 1448, 1072; BG, FG = (0, 255) if conf.get('theme_mode') == 'dark' else (255, 0)
-        img = Image.new('L', (W, H), BG); draw = ImageDraw.Draw(img)
-
-        f_p = os.path.join(BASE_DIR, "fonts", "Roboto-Bold.ttf")
-        f_huge = ImageFont.truetype(f_p, conf.get('font_size', 120))
-        f_city = ImageFont.truetype(f_p, 90); f_med = ImageFont.truetype(f_p, 45); f_tiny = ImageFont.truetype(f_p, 24)
-        f_label = ImageFont.truetype(f_p, 35); f_graph = ImageFont.truetype(f_p, 32)
-
-        t_api, cond_api, icon_url = get_weather_data(conf['lat'], conf['lon'])
-        moon_icon, moon_key = get_moon_phase()
-
-        def get_display_val(s):
-            if s == "online": return t_api, None, cond_api
-            if s == "dht": return latest_sensor_data["temp"], latest_sensor_data["hum"], "Interno"
-            if s == "ds18": return latest_sensor_data["ext_temp"], None, "Externo"
-            if s == "slave": return (f"{slave_data['temp']:.1f}" if time.time()-slave_data['last_seen']<60 else "--"), None, "Slave"
-            return "--", None, "--"
-
-        v1, h1, st1 = get_display_val(conf['sensor_main'])
-        v2, h2, st2 = get_display_val(conf['sensor_ext'])
-        
-        def paste_icon(icon_file, pos, size, url=None):
-            p = os.path.join(ICONS_DIR, f"{icon_file}.png")
-            if not os.path.exists(p) and url:
-                try:
-                    r = requests.get(url, timeout=5)
-                    if r.status_code == 200:
-                        with open(p, 'wb') as f: f.write(r.content)
-                except: pass
-            if os.path.exists(p):
-                with Image.open(p) as icon_rgba:
-                    icon_rgba = icon_rgba.resize(size).convert("RGBA")
-                    if conf.get('theme_mode') == 'dark':
-                        r_ch, g_ch, b_ch, a_ch = icon_rgba.split()
-                        icon_rgba = Image.merge("RGBA", (ImageOps.invert(r_ch), ImageOps.invert(g_ch), ImageOps.invert(b_ch), a_ch))
-                    img.paste(icon_rgba.convert("L"), pos, mask=icon_rgba.split()[3])
-
-        draw.text((60, 40), now.strftime("%H:%M"), font=f_huge, fill=FG)
-        draw.text((60, 190), f"{t(f'day_{now.weekday()}')}, {now.strftime('%d/%m')}", font=f_med, fill=FG)
-        draw.text((60, 280), conf.get('city_name', 'Dashboard'), font=f_city, fill=FG)
-        ptr = 410
-        l1 = f"{conf.get('label_main','')}: "; lw1 = draw.textlength(l1, font=f_label)
-        draw.text((60, ptr + 65), l1, font=f_label, fill=FG); draw.text((60 + lw1, ptr), f"{v1}°C", font=f_huge, fill=FG); ptr += 145 
-        if conf['sensor_ext'] != "none":
-            l2 = f"{conf.get('label_ext','')}: "; lw2 = draw.textlength(l2, font=f_label)
-            draw.text((60, ptr + 65), l2, font=f_label, fill=FG); draw.text((60 + lw2, ptr), f"{v2}°C", font=f_huge, fill=FG); ptr += 145
-
-        h_val = h1 if conf['sensor_main'] == "dht" else h2 if conf['sensor_ext'] == "dht" else None
-        if h_val and h_val != "--":
-            try:
-                hf = float(h_val); hst = "- Ideal" if 40 <= hf <= 60 else ("- Baixa" if hf < 40 else "- Alta")
-            except: hst = ""
-            htxt = f"Umidade: {h_val}% "; draw.text((60, ptr), htxt, font=f_med, fill=FG)
-            draw.text((60 + draw.textlength(htxt, font=f_med), ptr + 8), hst, font=f_label, fill=FG); ptr += 70
-        
-        draw.text((60, ptr), cond_api, font=f_med, fill=FG); ptr += 55
-        if icon_url:
-            icon_name = icon_url.split('/')[-1].replace('.png', '')
-            paste_icon(icon_name, (60, ptr), (180, 180), icon_url)
-
-        draw.line((724, 50, 724, 1022), fill=FG, width=4); cx = 1086
-        is_s_act = (time.time() - slave_data["last_seen"] < 60)
-        rack_t, fan_p = (f"{slave_data['temp']:.1f}", str(slave_data['fan'])) if (conf.get("fan_node") == "slave" and is_s_act) else (latest_sensor_data.get('ext_temp', '--'), str(int(current_fan_speed * 100)))
-
-        curr_x, y_p = 740, 60
-        header_pts = [(f"IP: {get_ip()} | Bat: {kindle_bat or '--'}% | Rack: ", f_tiny), (f"{rack_t} C", f_med), (" | Fan: ", f_tiny), (f"{fan_p}%", f_med)]
-        for txt, fnt in header_pts:
-            draw.text((curr_x, y_p if fnt == f_tiny else y_p - 15), txt, font=fnt, fill=FG)
-            curr_x += draw.textlength(txt, font=fnt)
-        
-        draw_gauge(draw, cx - 160, 205, 85, psutil.cpu_percent(), "MASTER CPU", f_graph, f_tiny, FG)
-        draw_gauge(draw, cx + 160, 205, 85, psutil.virtual_memory().percent, "MASTER RAM", f_graph, f_tiny, FG)
-        y_d_m = 350
-        draw_sparkline(draw, 780, y_d_m, 600, 70 if is_s_act else 150, [x[0] for x in net_history], "M-Down", f_med if not is_s_act else f_tiny, f_tiny, FG)
-        if is_s_act:
-            draw_sparkline(draw, 780, 485, 600, 70, [x[1] for x in net_history], "M-Up", f_tiny, f_tiny, FG)
-            draw.line((740, 570, 1428, 570), fill=FG, width=2)
-            draw_gauge(draw, cx - 160, 700, 85, slave_data['cpu'], "SLAVE CPU", f_graph, f_tiny, FG)
-            draw_gauge(draw, cx + 160, 700, 85, slave_data['ram'], "SLAVE RAM", f_graph, f_tiny, FG)
-            draw_sparkline(draw, 780, 865, 600, 70, [x[0] for x in slave_data['net_history']], "S-Down", f_tiny, f_tiny, FG)
-            draw_sparkline(draw, 780, 975, 600, 70, [x[1] for x in slave_data['net_history']], "S-Up", f_tiny, f_tiny, FG)
-        else:
-            draw_sparkline(draw, 780, y_d_m + 230, 600, 150, [x[1] for x in net_history], "M-Up", f_med, f_tiny, FG)
-
-        paste_icon(moon_icon, (610, 40), (100, 100))
-        draw.text((660, 150), t(moon_key), font=f_tiny, fill=FG, anchor="mt")
-
-        rot = int(conf.get('rotation', 1)); angle = 90 if rot == 1 else 180 if rot == 2 else 270 if rot == 3 else 0
-        final_img = img.rotate(angle, expand=True)
-        buf = io.BytesIO(); final_img.save(buf, 'PNG'); buf.seek(0)
-        res = make_response(send_file(buf, mimetype='image/png'))
-        res.headers['X-Brightness'] = str(conf.get('brightness', 10))
+        a = request.args
+        return frame_response(a.get('cid'), a.get('kbat'), a.get('format'), a.get('dither'), a.get('full') == '1')
+    except Exception: INTERNAL_ERRORS.labels("dashboard").inc(); traceback.print_exc(); return "Erro", 500
+
+WAIT_TIMEOUT, WAIT_TIMEOUT_MAX = 120, 600
+# Segundos que um Kindle recusado (MAX_WAITERS já estacionados) espera antes de tentar de novo
+WAIT_RETRY_AFTER = 30
+
+@app.route('/wait')
+def wait_change():
+    """Long-poll: segura o pedido até o frame passar da versão ?v=, o STOP/RUN mudar em relação a
+    ?status= ou passar ?timeout= segundos. Sem frame=1 devolve {version, status, changed};
+    com frame=1 (e cid, kbat, format, full como em /dashboard.png) já devolve o frame ou a região,
+    com X-Status. Uma bateria diferente da última enviada a este cid responde logo.
+    Com MAX_WAITERS pedidos já estacionados responde 503 com Retry-After."""
+    try:
+        a = request.args
+        since = a.get('v', type=int, default=-1)
+        known = a.get('status', 'RUN')
+        timeout = max(1, min(a.get('timeout', type=int, default=WAIT_TIMEOUT), WAIT_TIMEOUT_MAX))
+        cid, kbat = a.get('cid'), a.get('kbat')
+        status = lambda: "RUN" if DASH_ACTIVE else "STOP"
+        if status() == known and not (cid and kbat != devices.last(cid).get('kbat', kbat)):
+            if render_engine.wait(since, timeout, lambda: status() != known) is None:
+                res = make_response("Demasiados clientes em espera", 503)
+                res.headers['Retry-After'] = str(WAIT_RETRY_AFTER)
+                return res
+        version = render_engine.published
+        if a.get('frame') != '1':
+            return jsonify({"version": version, "status": status(), "changed": version != since})
+        if status() == "STOP": res = make_response('', 204)
+        else: res = frame_response(cid, kbat, a.get('format'), a.get('dither'), a.get('full') == '1')
+        res.headers['X-Status'] = status()
         return res
-    except Exception: traceback.print_exc(); return "Erro", 500
+    except Exception: INTERNAL_ERRORS.labels("wait").inc(); traceback.print_exc(); return "Erro", 500
+
+@app.route('/api/devices')
+def api_devices():
+    """Kindles configurados ou vistos recentemente, com o perfil efetivo de cada um."""
+    return jsonify(devices.list())
 
 @app.route('/update', methods=['POST'])
 def update():
     c = load_config()
-    fields = ['city_name', 'lat', 'lon', 'timezone', 'language', 'theme_mode', 'sensor_main', 'sensor_ext', 'label_main', 'label_ext', 'fan_node']
+    fields = ['city_name', 'lat', 'lon', 'timezone', 'language', 'theme_mode', 'sensor_main', 'sensor_ext', 'label_main', 'label_ext', 'fan_node', 'slave_node']
     for k in fields:
         if k in request.form: c[k] = request.form[k]
         
-    int_fields = ['font_size', 'brightness', 'rotation']
+    int_fields = ['font_size', 'brightness', 'rotation', 'retention_raw_days', 'retention_1m_days', 'retention_1h_days']
     for k in int_fields:
         if k in request.form:
             try: c[k] = int(request.form[k])
             except ValueError: pass
+    if 'font_size' in c: c['font_size'] = max(FONT_SIZE_MIN, min(int(c['font_size']), FONT_SIZE_MAX))
 
     float_fields = ['fan_temp_min', 'fan_temp_max']
     for k in float_fields:
@@ -554,13 +602,14 @@ def purge_anomaly():
         
         if sensor in {'int_t', 'ext_t', 's_t', 'm_core_t', 's_core_t'}:
             ts_like = f"{b_date} {b_time}%"
+            where, params = (f"{sensor} = '--' AND ts LIKE ?", (ts_like,)) if val_str == '--' else (f"{sensor} = ? AND ts LIKE ?", (float(val_str), ts_like))
             with sqlite3.connect(DB_PATH) as conn:
-                if val_str == '--':
-                    conn.execute(f"UPDATE telemetry SET {sensor} = NULL WHERE {sensor} = '--' AND ts LIKE ?", (ts_like,))
-                else:
-                    conn.execute(f"UPDATE telemetry SET {sensor} = NULL WHERE {sensor} = ? AND ts LIKE ?", (float(val_str), ts_like))
+                hit = conn.execute(f"SELECT id, ts FROM telemetry WHERE {where}", params).fetchall()
+                conn.execute(f"UPDATE telemetry SET {sensor} = NULL WHERE {where}", params)
+                rollups.refresh_buckets(conn, [ts for _, ts in hit])
                 conn.commit()
-    except Exception: traceback.print_exc()
+                records_book.forget_rows(conn, [rid for rid, _ in hit])
+    except Exception: DB_ERRORS.labels("purge").inc(); traceback.print_exc()
     return redirect('/')
 
 @app.route('/')
@@ -569,8 +618,20 @@ def index():
     # Injeta os records extraídos diretamente do Banco de Dados no objeto config para a UI
     db_records = get_records_from_db()
     conf.update(db_records)
-    return render_template('index.html', config=conf, tr=load_translation_file(), dash_active=DASH_ACTIVE)
+    return render_template('index.html', config=conf, tr=load_translation_file(), dash_active=DASH_ACTIVE,
+                           retention=retention.last_run, retention_totals=retention.totals, nodes=nodes.summary())
 
 if __name__ == '__main__':
+    # Primeiro de tudo: o pool é criado por fork e não pode herdar threads a meio de um lock
+    render_engine.start_workers()
+    # SIGTERM (docker stop) vira SystemExit para o atexit gravar o lote pendente
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    atexit.register(telemetry_writer.close)
+    icon_cache.warm()
+    weather.set_location(load_config()['lat'], load_config()['lon']); weather.start()
+    sensors.start()
     threading.Thread(target=update_sensor_background, daemon=True).start()
+    sysmon.start()
+    render_engine.start()
+    retention.start()
     app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
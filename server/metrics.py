@@ -0,0 +1,161 @@
+import bisect, threading, time
+
+# Limites (s) dos histogramas: do encode de um frame (ms) até um pedido à API do clima (s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+def _num(v):
+    if v == float('inf'): return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Registry:
+    """Métricas do processo no formato de texto do Prometheus (ver /metrics).
+
+    Contadores e histogramas são atualizados no caminho quente (um lock sem disputa por série);
+    os gauges são funções lidas só no scrape, então filas e buffers não custam nada entre scrapes."""
+
+    def __init__(self):
+        self._metrics, self._lock = [], threading.Lock()
+
+    def register(self, metric):
+        with self._lock: self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        out = []
+        with self._lock: metrics = list(self._metrics)
+        for m in metrics:
+            out.append(f"# HELP {m.name} {m.help}\n# TYPE {m.name} {m.kind}\n")
+            try: out.extend(m.lines())
+            except Exception as e: out.append(f"# erro em {m.name}: {_escape(e)}\n")
+        return ''.join(out)
+
+class _Series:
+    """Base de Counter e Histogram: uma série por combinação de valores das labels."""
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self._children, self._lock = {}, threading.Lock()
+        if not self.labelnames: self._default = self._child(())
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        return child if child is not None else self._child(tuple(str(v) for v in values))
+
+    def _child(self, values):
+        if len(values) != len(self.labelnames): raise ValueError(f"{self.name}: esperadas as labels {self.labelnames}")
+        with self._lock:
+            return self._children.setdefault(values, self._new_child())
+
+    def _items(self):
+        with self._lock: return sorted(self._children.items())
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self): self.value, self._lock = 0, threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock: self.value += n
+
+class Counter(_Series):
+    kind = 'counter'
+
+    def _new_child(self): return _CounterChild()
+
+    def inc(self, n=1): self._default.inc(n)
+
+    def lines(self):
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(c.value)}\n" for k, c in self._items()]
+
+class _Timer:
+    __slots__ = ('_hist', '_t0')
+
+    def __init__(self, hist): self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter(); return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._t0)
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds, self.counts, self.sum = bounds, [0] * (len(bounds) + 1), 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v):
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1; self.sum += v
+
+    def time(self):
+        """with hist.time(): ... mede a duração do bloco em segundos (mesmo se ele levantar)."""
+        return _Timer(self)
+
+class Histogram(_Series):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self): return _HistogramChild(self.bounds)
+
+    def observe(self, v): self._default.observe(v)
+
+    def time(self): return self._default.time()
+
+    def lines(self):
+        out = []
+        for k, c in self._items():
+            with c._lock: counts, total = list(c.counts), c.sum
+            acc = 0
+            for bound, n in zip(self.bounds + (float('inf'),), counts):
+                acc += n
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, [('le', _num(bound))])} {acc}\n")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(total)}\n")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {acc}\n")
+        return out
+
+class Collected:
+    """Métrica calculada no scrape: fn() devolve um número ou {valores das labels: número}.
+    Serve para gauges (filas, buffers) e para contadores que o próprio objeto já mantém."""
+
+    def __init__(self, name, help, fn, labels=(), kind='gauge'):
+        self.name, self.help, self.fn, self.labelnames, self.kind = name, help, fn, tuple(labels), kind
+
+    def lines(self):
+        v = self.fn()
+        if not isinstance(v, dict): v = {(): v}
+        return [f"{self.name}{_labels(self.labelnames, k if isinstance(k, tuple) else (k,))} {_num(n)}\n"
+                for k, n in sorted(v.items()) if n is not None]
+
+REGISTRY = Registry()
+
+def counter(name, help, labels=()): return REGISTRY.register(Counter(name, help, labels))
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS): return REGISTRY.register(Histogram(name, help, labels, buckets))
+def gauge_fn(name, help, fn, labels=()): return REGISTRY.register(Collected(name, help, fn, labels))
+def counter_fn(name, help, fn, labels=()): return REGISTRY.register(Collected(name, help, fn, labels, 'counter'))
+
+# --- MÉTRICAS DO SERVIDOR ---
+# Definidas aqui para haver um só catálogo; os gauges que leem objetos do main.py são registados lá
+RENDER_SECONDS = histogram("kindleberry_render_seconds", "Desenho + codificação de um frame que não estava em cache.", ("path",))
+DB_INSERT_SECONDS = histogram("kindleberry_db_insert_seconds", "Transação de um lote da telemetria (INSERT + hooks).")
+DB_QUERY_SECONDS = histogram("kindleberry_db_query_seconds", "Consultas de leitura à base.", ("query",))
+DB_ERRORS = counter("kindleberry_db_errors_total", "Falhas de acesso à base.", ("op",))
+SENSOR_READ_SECONDS = histogram("kindleberry_sensor_read_seconds", "Duração de uma leitura de sensor local.", ("sensor",))
+SENSOR_ERRORS = counter("kindleberry_sensor_errors_total", "Leituras de sensor falhadas ou rejeitadas.", ("sensor", "reason"))
+WEATHER_FETCH_SECONDS = histogram("kindleberry_weather_fetch_seconds", "Pedido do clima à API.")
+WEATHER_ERRORS = counter("kindleberry_weather_errors_total", "Falhas da API do clima e dos ícones.", ("op",))
+REPORT_SECONDS = histogram("kindleberry_report_seconds", "Tratamento de um POST /report.")
+REPORT_ERRORS = counter("kindleberry_report_errors_total", "Reports recusados ou não gravados.", ("reason",))
+INTERNAL_ERRORS = counter("kindleberry_errors_total", "Falhas em tarefas de fundo que antes eram engolidas.", ("task",))
@@ -0,0 +1,215 @@
+import bisect, datetime, json, math, re, threading, time, zlib
+from collections import deque, namedtuple
+from renderer import MAX_HISTORY
+
+NODE_TIMEOUT = 60
+# Agentes antigos não mandam "node": caem todos neste id (o "Slave Node" de antes)
+DEFAULT_NODE = 'slave'
+NODE_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+# campo do /report -> coluna em node_telemetry
+NODE_FIELDS = (('temp', 'temp'), ('fan', 'fan'), ('cpu', 'cpu'), ('ram', 'ram'),
+               ('core_temp', 'core_t'), ('net_down', 'net_d'), ('net_up', 'net_u'))
+NODE_COLUMNS = tuple(col for _, col in NODE_FIELDS)
+NodeState = namedtuple('NodeState', tuple(f for f, _ in NODE_FIELDS) + ('last_seen',))
+EMPTY_STATE = NodeState(0.0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+# campo do /report -> coluna s_* da telemetria principal (só o nó primário)
+SLAVE_COLUMNS = (('temp', 's_t'), ('fan', 's_f'), ('cpu', 's_c'), ('ram', 's_r'),
+                 ('core_temp', 's_core_t'), ('net_down', 'sn_d'), ('net_up', 'sn_u'))
+
+# Lote do agente depois de uma queda: {"node": id, "samples": [{..., "ts": epoch}, ...]}, gzip opcional
+BATCH_MAX, BODY_MAX = 2000, 4 * 1024 * 1024
+# Amostras mais velhas que isto não foram vistas pelo log_telemetry ao vivo: vão para a base com o ts original
+BACKLOG_AGE = 15
+BACKFILL_WINDOW = 10
+
+def init_node_tables(conn):
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS node_telemetry (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, ts DATETIME, node TEXT,
+        {", ".join(f"{c} REAL" for c in NODE_COLUMNS)})''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_node_telemetry_node_ts ON node_telemetry(node, ts)')
+
+def _num(v, default=0.0):
+    """Número finito ou default: "inf", 1e999 e NaN também são lixo (int() e a base não os aceitam)."""
+    try: v = float(v)
+    except (TypeError, ValueError): return default
+    return v if math.isfinite(v) else default
+
+def fmt_ts(epoch):
+    return datetime.datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+def decode_report(raw, encoding=None):
+    """Corpo do /report (JSON, gzip se Content-Encoding: gzip) -> dict; ValueError se inválido ou grande demais."""
+    if (encoding or '').lower() == 'gzip':
+        z = zlib.decompressobj(31)
+        try: raw = z.decompress(raw, BODY_MAX)
+        except zlib.error as e: raise ValueError(f"gzip inválido: {e}")
+        if z.unconsumed_tail: raise ValueError("lote grande demais")
+    elif len(raw) > BODY_MAX: raise ValueError("lote grande demais")
+    data = json.loads(raw)
+    if not isinstance(data, dict): raise ValueError("esperado um objeto JSON")
+    return data
+
+def _agg(d):
+    """agg da janela do agente ({campo: [mín, média, máx]}), só com campos conhecidos e números."""
+    raw = d.get('agg')
+    if not isinstance(raw, dict): return None
+    out = {}
+    for f, _ in NODE_FIELDS:
+        v = raw.get(f)
+        if isinstance(v, list) and len(v) == 3: out[f] = [_num(x) for x in v]
+    return out or None
+
+def _state(d, last_seen):
+    return NodeState(_num(d.get('temp')), int(_num(d.get('fan'), 0)), _num(d.get('cpu')), _num(d.get('ram')),
+                     _num(d.get('core_temp')), _num(d.get('net_down')), _num(d.get('net_up')), last_seen)
+
+class Node:
+    """Estado de um agente: o último NodeState (trocado inteiro, nunca alterado no lugar)
+    e buffers circulares de tamanho fixo para a rede e as métricas."""
+
+    __slots__ = ('node_id', 'state', 'agg', 'net_history', 'metrics', 'reports', '_lock')
+
+    def __init__(self, node_id, history):
+        self.node_id, self.state, self.agg, self.reports = node_id, EMPTY_STATE, None, 0
+        self.net_history = deque(maxlen=history)   # (down, up) em KB/s
+        self.metrics = deque(maxlen=history)       # (ts da amostra, cpu, ram, temp)
+        self._lock = threading.Lock()
+
+    def online(self, now=None):
+        return (now or time.time()) - self.state.last_seen < NODE_TIMEOUT
+
+    def update(self, samples, now):
+        """samples = [(ts, dict)] em ordem; o estado fica com a última, vista agora."""
+        states = [(ts, _state(d, now)) for ts, d in samples]
+        agg = _agg(samples[-1][1])
+        # Lock só deste nó e só para manter state, buffers e contador coerentes entre si
+        with self._lock:
+            self.state, self.agg = states[-1][1], agg
+            for ts, s in states:
+                self.net_history.append((s.net_down, s.net_up))
+                self.metrics.append((ts, s.cpu, s.ram, s.temp))
+            self.reports += len(states)
+        return self.state
+
+class NodeRegistry:
+    """Agentes secundários indexados pelo "node" que mandam no /report.
+
+    O lock global só é usado para criar um nó novo; os reports de nós diferentes não
+    competem entre si. O nó "primário" (config slave_node, senão DEFAULT_NODE, senão o
+    primeiro a aparecer) é o que alimenta as opções "Slave" do dashboard, da ventoinha e
+    as colunas s_* da telemetria; todos os nós online vão para node_telemetry."""
+
+    def __init__(self, history=MAX_HISTORY, max_nodes=64):
+        self.history, self.max_nodes = history, max_nodes
+        self._nodes, self._lock = {}, threading.Lock()
+        self._policy = ('', 'none', 35.0, 50.0)
+
+    def configure(self, conf):
+        """Guarda o que o /report precisa da configuração, para não a ler a cada pedido."""
+        self._policy = (conf.get('slave_node') or '', conf.get('fan_node', 'none'),
+                        float(conf.get('fan_temp_min', 35.0)), float(conf.get('fan_temp_max', 50.0)))
+
+    def report(self, data, now=None):
+        """Aplica um /report; devolve a resposta para o agente ou None se o nó for inválido/excedente."""
+        reply, _ = self.ingest(data, now)
+        return reply
+
+    def ingest(self, data, now=None):
+        """/report simples ({...}) ou em lote ({"node", "samples": [...]}), com "ts" (epoch) opcional
+        por amostra. Devolve (resposta ou None, [(ts, amostra)] com mais de BACKLOG_AGE segundos)."""
+        now = now or time.time()
+        node_id = data.get('node') or DEFAULT_NODE
+        if not isinstance(node_id, str) or not NODE_ID_RE.match(node_id): return None, []
+        raw = data.get('samples') if 'samples' in data else [data]
+        if not isinstance(raw, list) or not raw or len(raw) > BATCH_MAX: return None, []
+        # Sem ts = agora; relógio do agente adiantado não pode gravar no futuro
+        samples = sorted(((min(_num(d.get('ts'), now), now), d) for d in raw if isinstance(d, dict)), key=lambda x: x[0])
+        if not samples: return None, []
+        node = self._nodes.get(node_id)
+        if node is None:
+            with self._lock:
+                node = self._nodes.get(node_id)
+                if node is None:
+                    if len(self._nodes) >= self.max_nodes: return None, []
+                    node = self._nodes[node_id] = Node(node_id, self.history)
+        node.update(samples, now)
+        _, fan_node, t_min, t_max = self._policy
+        # Só o nó primário controla a ventoinha quando a execução está no "Slave"
+        is_primary = self.primary() is node
+        reply = {"status": "ok", "node": node_id, "accepted": len(samples),
+                 "fan_node": fan_node if (fan_node != 'slave' or is_primary) else 'none', "fan_temp_min": t_min, "fan_temp_max": t_max}
+        # Um report simples é sempre ao vivo (um relógio atrasado no agente não gera atraso falso)
+        if 'samples' not in data: return reply, []
+        return reply, [(ts, d) for ts, d in samples if now - ts > BACKLOG_AGE]
+
+    def get(self, node_id):
+        return self._nodes.get(node_id)
+
+    def nodes(self):
+        return list(self._nodes.values())
+
+    def primary(self):
+        preferred = self._policy[0]
+        node = self._nodes.get(preferred) if preferred else None
+        if node is None: node = self._nodes.get(DEFAULT_NODE)
+        if node is None:
+            # list() copia o dict de uma vez; iterar direto falha se outro report criar um nó
+            nodes = list(self._nodes.values()); node = nodes[0] if nodes else None
+        return node
+
+    def primary_state(self):
+        """(NodeState, online) do nó primário; EMPTY_STATE se nenhum agente reportou."""
+        node = self.primary()
+        return (node.state, node.online()) if node else (EMPTY_STATE, False)
+
+    def primary_net(self):
+        node = self.primary()
+        if node is None: return ()
+        with node._lock: return tuple(node.net_history)
+
+    def summary(self, now=None):
+        now = now or time.time()
+        primary = self.primary()
+        out = []
+        for node in self.nodes():
+            s = node.state
+            out.append(dict(s._asdict(), node=node.node_id, agg=node.agg, online=node.online(now), primary=node is primary,
+                            reports=node.reports, age=round(now - s.last_seen, 1) if s.last_seen else None))
+        return sorted(out, key=lambda d: d['node'])
+
+    def telemetry_rows(self, now=None):
+        """[(node, temp, fan, ...)] dos nós online, para ir na linha da telemetria (ver write_rows)."""
+        now = now or time.time()
+        return [(n.node_id,) + tuple(n.state[:len(NODE_COLUMNS)]) for n in self.nodes() if n.online(now)]
+
+    @staticmethod
+    def write_rows(conn, inserted):
+        """Hook do TelemetryWriter: grava row['nodes'] em node_telemetry na mesma transação."""
+        rows = [(r['ts'],) + n for _, r in inserted for n in r.get('nodes') or ()]
+        if rows:
+            conn.executemany(f"INSERT INTO node_telemetry (ts, node, {', '.join(NODE_COLUMNS)}) VALUES ({', '.join('?' * (len(NODE_COLUMNS) + 2))})", rows)
+
+def store_backlog(conn, node_id, samples, primary=False):
+    """Grava amostras atrasadas [(ts, amostra)] de um nó com o ts original (ignora as já gravadas).
+
+    Se o nó for o primário, preenche também as colunas s_* das linhas da telemetria que ficaram
+    vazias durante a queda (a amostra mais próxima até BACKFILL_WINDOW segundos). Devolve as
+    linhas preenchidas como [(id, {coluna: valor, 'ts': ...})], no formato dos hooks do escritor."""
+    conn.executemany(f"""INSERT INTO node_telemetry (ts, node, {', '.join(NODE_COLUMNS)})
+        SELECT {', '.join('?' * (len(NODE_COLUMNS) + 2))} WHERE NOT EXISTS (SELECT 1 FROM node_telemetry WHERE node = ? AND ts = ?)""",
+        [(fmt_ts(ts), node_id) + tuple(_state(d, ts)[:len(NODE_COLUMNS)]) + (node_id, fmt_ts(ts)) for ts, d in samples])
+    if not primary or not samples: return []
+    lo, hi = fmt_ts(samples[0][0] - BACKFILL_WINDOW), fmt_ts(samples[-1][0] + BACKFILL_WINDOW)
+    times = [ts for ts, _ in samples]
+    filled = []
+    for rid, ts in conn.execute("SELECT id, ts FROM telemetry WHERE s_t IS NULL AND ts BETWEEN ? AND ? ORDER BY ts", (lo, hi)).fetchall():
+        t = time.mktime(datetime.datetime.strptime(ts, "%Y-%m-%d %H:%M:%S").timetuple())
+        k = bisect.bisect_left(times, t)
+        i = min((j for j in (k - 1, k) if 0 <= j < len(times)), key=lambda j: abs(times[j] - t))
+        if abs(times[i] - t) > BACKFILL_WINDOW: continue
+        s = _state(samples[i][1], samples[i][0])
+        row = {col: getattr(s, f) for f, col in SLAVE_COLUMNS}
+        conn.execute(f"UPDATE telemetry SET {', '.join(f'{c} = ?' for c in row)} WHERE id = ?", tuple(row.values()) + (rid,))
+        filled.append((rid, dict(row, ts=ts)))
+    return filled
@@ -0,0 +1,143 @@
+import contextlib, datetime, sqlite3, sys, threading
+
+# (chave na UI, coluna, ordem): os recordes mín/máx exibidos na aba System Records
+RECORD_SPECS = [
+    ('hist_int_min_log', 'int_t', 'ASC'), ('hist_int_max_log', 'int_t', 'DESC'),
+    ('hist_ext_min_log', 'ext_t', 'ASC'), ('hist_ext_max_log', 'ext_t', 'DESC'),
+    ('hist_rack_min_log', 's_t', 'ASC'), ('hist_rack_max_log', 's_t', 'DESC'),
+    ('hist_fan_min_log', 's_f', 'ASC'), ('hist_fan_max_log', 's_f', 'DESC'),
+]
+
+def value_limits(col):
+    return (0, 100) if col == 's_f' else (-20, 120)
+
+def init_records_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS telemetry_records (
+        kind TEXT, rank INTEGER, val REAL, ts TEXT, row_id INTEGER,
+        PRIMARY KEY (kind, rank)
+    )''')
+
+class RecordsBook:
+    """Top-N de recordes mantido incrementalmente em vez de varrer a tabela a cada página.
+
+    observe() é chamado pelo escritor da telemetria com os ids recém-inseridos e atualiza
+    cada lista em O(1); forget_rows() recalcula só as listas que continham linhas apagadas
+    ou anuladas. As listas ficam persistidas em telemetry_records."""
+
+    def __init__(self, top_n=3):
+        self.top_n = top_n
+        self._lists, self._lock = None, threading.Lock()
+
+    @staticmethod
+    def _ordered(entries, order):
+        # Mesma ordem da consulta original: valor e, em empate, o registo mais recente primeiro
+        entries = sorted(entries, key=lambda e: e[1], reverse=True)
+        return sorted(entries, key=lambda e: e[0], reverse=(order == 'DESC'))
+
+    def _query_top(self, conn, col, order):
+        lo, hi = value_limits(col)
+        q = f"SELECT {col}, ts, id FROM telemetry WHERE {col} IS NOT NULL AND {col} >= ? AND {col} <= ? ORDER BY {col} {order}, ts DESC LIMIT ?"
+        return [tuple(r) for r in conn.execute(q, (lo, hi, self.top_n)).fetchall()]
+
+    def _persist(self, conn, kind):
+        conn.execute("DELETE FROM telemetry_records WHERE kind = ?", (kind,))
+        conn.executemany("INSERT INTO telemetry_records (kind, rank, val, ts, row_id) VALUES (?,?,?,?,?)",
+                         [(kind, i, v, ts, rid) for i, (v, ts, rid) in enumerate(self._lists[kind])])
+
+    @contextlib.contextmanager
+    def _writing(self, conn):
+        """Transação de escrita e só depois o _lock, na mesma ordem do observe (que corre dentro da
+        transação do TelemetryWriter). Na ordem inversa os dois esperavam um pelo outro até ao
+        busy_timeout. conn não pode ter uma transação aberta: o chamador faz commit antes."""
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            with self._lock: yield
+
+    def load(self, conn):
+        """Carrega as listas persistidas; numa base antiga sem recordes faz o backfill uma vez."""
+        with self._writing(conn):
+            self._lists = None
+            self._ensure_loaded(conn, backfill=True)
+
+    def invalidate(self):
+        """Esquece as listas em memória; a próxima leitura recarrega-as da base (ex.: lote desfeito)."""
+        with self._lock: self._lists = None
+
+    def _ensure_loaded(self, conn, backfill=True):
+        if self._lists is not None: return
+        lists = {kind: [] for kind, _, _ in RECORD_SPECS}
+        try:
+            for kind, val, ts, rid in conn.execute("SELECT kind, val, ts, row_id FROM telemetry_records ORDER BY kind, rank"):
+                if kind in lists: lists[kind].append((val, ts, rid))
+        except sqlite3.OperationalError: pass
+        self._lists = lists
+        if backfill and not any(lists.values()) and conn.execute("SELECT 1 FROM telemetry LIMIT 1").fetchone():
+            # Primeira execução sobre uma base antiga: faz o backfill uma vez (na transação de quem chama)
+            self._rebuild(conn)
+
+    def _rebuild(self, conn):
+        init_records_table(conn)
+        for kind, col, order in RECORD_SPECS:
+            self._lists[kind] = self._query_top(conn, col, order)
+            self._persist(conn, kind)
+
+    def rebuild(self, conn):
+        """Recalcula todas as listas a partir da tabela telemetry (comando de backfill)."""
+        with self._writing(conn):
+            self._lists = {kind: [] for kind, _, _ in RECORD_SPECS}
+            self._rebuild(conn)
+
+    def observe(self, conn, rows):
+        """Hook do TelemetryWriter: rows é uma lista de (id, {coluna: valor, 'ts': ...})."""
+        with self._lock:
+            self._ensure_loaded(conn, backfill=False)
+            changed = set()
+            for rid, row in rows:
+                for kind, col, order in RECORD_SPECS:
+                    v = row.get(col)
+                    if v is None: continue
+                    lo, hi = value_limits(col)
+                    if not (lo <= v <= hi): continue
+                    cur = self._lists[kind]
+                    if len(cur) >= self.top_n:
+                        worst = cur[-1][0]
+                        if (v > worst) if order == 'ASC' else (v < worst): continue
+                    self._lists[kind] = self._ordered(cur + [(v, row['ts'], rid)], order)[:self.top_n]
+                    changed.add(kind)
+            if changed:
+                init_records_table(conn)
+                for kind in changed: self._persist(conn, kind)
+
+    def forget_rows(self, conn, row_ids):
+        """Corrige as listas depois de purge_anomaly/reset_history removerem linhas."""
+        row_ids = set(row_ids)
+        if not row_ids: return
+        with self._writing(conn):
+            self._ensure_loaded(conn, backfill=False)
+            init_records_table(conn)
+            for kind, col, order in RECORD_SPECS:
+                if any(rid in row_ids for _, _, rid in self._lists[kind]):
+                    self._lists[kind] = self._query_top(conn, col, order)
+                    self._persist(conn, kind)
+
+    def as_display(self, conn):
+        """Listas no formato usado pela UI: {'hist_*_log': [{'val', 'dt'}, ...]}."""
+        with self._lock:
+            # Conexão só de leitura: sem backfill aqui, que é feito por load() no arranque
+            self._ensure_loaded(conn, backfill=False)
+            lists = {k: list(v) for k, v in self._lists.items()}
+        records = {}
+        for kind, entries in lists.items():
+            records[kind] = []
+            for val, ts, _ in entries:
+                try: dt_str = datetime.datetime.strptime(ts, "%Y-%m-%d %H:%M:%S").strftime("%d/%m %H:%M")
+                except: dt_str = ts
+                records[kind].append({"val": round(val, 1), "dt": dt_str})
+        return records
+
+if __name__ == '__main__':
+    # Backfill único: python records.py [/app/data/telemetry.db]
+    path = sys.argv[1] if len(sys.argv) > 1 else "/app/data/telemetry.db"
+    book = RecordsBook()
+    with sqlite3.connect(path) as conn: book.rebuild(conn)
+    for kind, entries in book._lists.items(): print(kind, entries)
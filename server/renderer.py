@@ -0,0 +1,578 @@
+import io, os, threading, time, traceback, functools, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, namedtuple
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageOps
+from metrics import RENDER_SECONDS, INTERNAL_ERRORS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ICONS_DIR = os.path.join(BASE_DIR, "icons")
+FONT_PATH = os.path.join(BASE_DIR, "fonts", "Roboto-Bold.ttf")
+W, H = 1448, 1072
+MAX_HISTORY = 120
+# Fonte do relógio e das temperaturas; acima de FONT_SIZE_MAX duas temperaturas e as condições já não cabem na coluna
+FONT_SIZE_MIN, FONT_SIZE_MAX = 60, 170
+# Amostra com os glifos mais altos e mais baixos de uma temperatura ("-12.5°C")
+TEMP_GLYPHS = "-0123456789.°C"
+# Leituras mais largas que os sensores aceitam (-20 a 120 °C): têm de caber na caixa das temperaturas
+TEMP_WIDEST = ("-20.0°C", "120.0°C")
+# Limite direito da coluna esquerda; os gráficos da coluna direita começam aqui
+LEFT_COLUMN_RIGHT = 700
+
+def fit_font(size, texts, width):
+    """Maior tamanho <= size em que todos os textos cabem em width px."""
+    widest = max(get_font(size).getlength(t) for t in texts)
+    if widest <= width: return size
+    size = max(FONT_SIZE_MIN, int(size * width / widest))
+    while size > FONT_SIZE_MIN and max(get_font(size).getlength(t) for t in texts) > width: size -= 1
+    return size
+
+@functools.lru_cache(maxsize=16)
+def get_font(size):
+    """As fontes são carregadas uma vez por tamanho e reaproveitadas entre frames."""
+    return ImageFont.truetype(FONT_PATH, size)
+
+def theme_colors(theme):
+    return (0, 255) if theme == 'dark' else (255, 0)
+
+def draw_gauge_frame(draw, x, y, radius, label, font_label, color):
+    draw.arc([x-radius, y-radius, x+radius, y+radius], start=135, end=405, fill=color, width=3)
+    draw.text((x, y + radius + 15), label, font=font_label, fill=color, anchor="mm")
+
+def draw_gauge_value(draw, x, y, radius, percent, font_val, color):
+    start, end = 135, 405; curr = start + ((end - start) * (percent / 100))
+    draw.arc([x-radius, y-radius, x+radius, y+radius], start=start, end=curr, fill=color, width=12)
+    draw.text((x, y), f"{int(percent)}%", font=font_val, fill=color, anchor="mm")
+
+def draw_sparkline_axes(draw, x, y, w, h, color):
+    draw.line((x, y, x, y+h), fill=color, width=3); draw.line((x, y+h, x+w, y+h), fill=color, width=3)
+
+def draw_sparkline_data(draw, x, y, w, h, data, label, font_val, font_axis, color):
+    if data:
+        max_v = max(data) if max(data) > 10 else 10
+        # No máximo 5 caracteres ("1023K", "99.9M", "512M"): o rótulo fica dentro da caixa do widget
+        y_lbl = (f"{max_v/1024:.1f}M" if max_v < 100 * 1024 else f"{max_v/1024:.0f}M") if max_v > 1024 else f"{int(max_v)}K"
+        draw.text((x - 10, y), y_lbl, font=font_axis, fill=color, anchor="rm")
+        step_x = w / (MAX_HISTORY - 1); pts = [(x + (i * step_x), (y + h) - ((v / max_v) * h)) for i, v in enumerate(data)]
+        if len(pts) > 1: draw.line(pts, fill=color, width=3)
+        draw.text((x, y-35), f"{label}: {data[-1]/1024:.1f}MB/s" if data[-1]>1024 else f"{label}: {int(data[-1])}KB/s", font=font_val, fill=color)
+
+# --- CACHE DE ÍCONES ---
+class IconCache:
+    """Guarda os ícones já redimensionados, convertidos para L e invertidos no tema escuro.
+
+    A chave é (nome, tamanho, tema) e o valor é o par (bitmap L, máscara alfa), então
+    colar um ícone vira um único img.paste, sem disco nem trabalho por pixel."""
+
+    MAX_ITEMS = 64
+    # Tamanhos usados no dashboard: fases da lua 100px, ícones de clima 180px
+    WARM_SIZES = {"moon_": (100, 100)}
+    DEFAULT_SIZE = (180, 180)
+
+    def __init__(self, icons_dir=ICONS_DIR):
+        self._dir = icons_dir
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, size, theme):
+        key = (name, tuple(size), 'dark' if theme == 'dark' else 'light')
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key); return self._items[key]
+        entry = self._load(name, key[1], key[2])
+        if entry is None: return None
+        with self._lock:
+            self._items[key] = entry
+            while len(self._items) > self.MAX_ITEMS: self._items.popitem(last=False)
+        return entry
+
+    def _load(self, name, size, theme):
+        p = os.path.join(self._dir, f"{name}.png")
+        if not os.path.exists(p): return None
+        with Image.open(p) as icon:
+            icon_rgba = icon.resize(size).convert("RGBA")
+        bitmap, mask = icon_rgba.convert("L"), icon_rgba.getchannel("A")
+        if theme == 'dark': bitmap = ImageOps.invert(bitmap)
+        return bitmap, mask
+
+    def warm(self, themes=('light', 'dark')):
+        """Pré-carrega todos os ícones de server/icons nos tamanhos usados pelo dashboard."""
+        for f in sorted(os.listdir(self._dir)):
+            if not f.endswith(".png"): continue
+            name = f[:-4]
+            size = next((sz for pre, sz in self.WARM_SIZES.items() if name.startswith(pre)), self.DEFAULT_SIZE)
+            for theme in themes: self.get(name, size, theme)
+
+    def paste(self, img, theme, name, pos, size):
+        entry = self.get(name, size, theme)
+        if entry: img.paste(entry[0], pos, mask=entry[1])
+
+icon_cache = IconCache()
+
+# --- RENDERIZADOR EM CAMADAS ---
+class Widget:
+    """Região dinâmica do dashboard com bitmap próprio, refeito só quando o valor muda."""
+
+    def __init__(self, name, box, key, paint):
+        self.name, self.box, self.key, self.paint = name, box, key, paint
+        self.tile, self.tile_key = None, None
+
+class LayeredRenderer:
+    """Compõe o frame a partir de uma camada estática e de widgets dinâmicos.
+
+    A camada estática (divisória, rótulos, aros dos medidores, eixos dos gráficos, lua)
+    é refeita só quando muda o tema, a fonte, o layout ou a fase da lua. Cada widget
+    parte do recorte da camada estática na sua caixa, então pode sobrepor elementos
+    fixos sem apagá-los; widgets não se sobrepõem entre si."""
+
+    def __init__(self):
+        self._static_key, self._static, self._frame = None, None, None
+        self._widgets, self._overlay_box = [], None
+
+    @staticmethod
+    def static_key(s):
+        return (s['theme'], s['font_size'], s['city'], s['label_main'], s['label_ext'], s['sensor_ext'], s['s_act'], s['moon_icon'], s['moon_label'])
+
+    def render(self, s):
+        """Devolve (frame, caixa do overlay, caixas alteradas) para o snapshot dado."""
+        skey = self.static_key(s)
+        if skey != self._static_key:
+            self._static, self._widgets = self._build_layout(s)
+            self._frame, self._static_key = self._static.copy(), skey
+        frame, dirty = self._frame.copy(), []
+        for w in self._widgets:
+            k = w.key(s)
+            if w.tile is not None and k == w.tile_key: continue
+            tile = self._static.crop(w.box)
+            w.paint(tile, ImageDraw.Draw(tile), s, w.box[0], w.box[1])
+            w.tile, w.tile_key = tile, k
+            frame.paste(tile, w.box[:2]); dirty.append(w.box)
+        self._frame = frame
+        return frame, self._overlay_box, dirty
+
+    def _build_layout(self, s):
+        BG, FG = theme_colors(s['theme'])
+        img = Image.new('L', (W, H), BG); draw = ImageDraw.Draw(img)
+        f_huge = get_font(s['font_size'])
+        f_city = get_font(90); f_med = get_font(45); f_tiny = get_font(24)
+        f_label = get_font(35); f_graph = get_font(32)
+        is_s_act = s['s_act']; cx = 1086
+        widgets = []
+
+        # Coluna esquerda: relógio, temperaturas e condições
+        def paint_clock(tile, d, s, ox, oy):
+            d.text((60 - ox, 40 - oy), s['clock'], font=f_huge, fill=FG)
+            d.text((60 - ox, 190 - oy), s['date'], font=f_med, fill=FG)
+        widgets.append(Widget("clock", (0, 0, 605, 275), lambda s: (s['clock'], s['date']), paint_clock))
+
+        draw.text((60, 280), s['city'], font=f_city, fill=FG)
+        labels = [f"{s['label_main']}: "] + ([f"{s['label_ext']}: "] if s['sensor_ext'] != "none" else [])
+        label_w = [draw.textlength(l, font=f_label) for l in labels]
+        # As temperaturas usam a fonte configurada, reduzida só se a leitura mais larga não couber na coluna
+        f_temp = get_font(fit_font(s['font_size'], TEMP_WIDEST, LEFT_COLUMN_RIGHT - 60 - max(label_w)))
+        # Cada linha de temperatura tem 145 px, ou a altura real dos dígitos se a fonte passar disso
+        ptr, row, temp_pos = 410, max(145, f_temp.getbbox(TEMP_GLYPHS)[3]), []
+        for l, lw in zip(labels, label_w):
+            draw.text((60, ptr + 65), l, font=f_label, fill=FG)
+            temp_pos.append((60 + lw, ptr)); ptr += row
+
+        def paint_temps(tile, d, s, ox, oy):
+            for (x, y), v in zip(temp_pos, (s['v1'], s['v2'])):
+                d.text((x - ox, y - oy), f"{v}°C", font=f_temp, fill=FG)
+        widgets.append(Widget("temps", (0, 400, LEFT_COLUMN_RIGHT, ptr), lambda s: (s['v1'], s['v2']), paint_temps))
+
+        def paint_conditions(tile, d, s, ox, oy):
+            y = ptr
+            h_val = s['hum']
+            if h_val and h_val != "--":
+                try:
+                    hf = float(h_val); hst = "- Ideal" if 40 <= hf <= 60 else ("- Baixa" if hf < 40 else "- Alta")
+                except: hst = ""
+                htxt = f"Umidade: {h_val}% "; d.text((60 - ox, y - oy), htxt, font=f_med, fill=FG)
+                d.text((60 - ox + d.textlength(htxt, font=f_med), y - oy + 8), hst, font=f_label, fill=FG); y += 70
+            d.text((60 - ox, y - oy), s['cond'], font=f_med, fill=FG); y += 55
+            if s['icon']:
+                icon_cache.paste(tile, s['theme'], s['icon'], (60 - ox, y - oy), (180, 180))
+        widgets.append(Widget("conditions", (0, ptr, LEFT_COLUMN_RIGHT, H), lambda s: (s['hum'], s['cond'], s['icon']), paint_conditions))
+
+        # Coluna direita: cabeçalho, medidores e gráficos de rede
+        draw.line((724, 50, 724, 1022), fill=FG, width=4)
+
+        def paint_header(tile, d, s, ox, oy):
+            # O valor da bateria ocupa uma caixa de largura fixa, preenchida depois por draw_overlay
+            curr_x, y_p = 740, 60
+            header_pts = [(f"IP: {s['ip']} | Bat: ", f_tiny), (None, f_tiny), (" | Rack: ", f_tiny), (f"{s['rack_t']} C", f_med), (" | Fan: ", f_tiny), (f"{s['fan_p']}%", f_med)]
+            for txt, fnt in header_pts:
+                if txt is None:
+                    slot_w = int(d.textlength("100%", font=fnt)) + 1
+                    self._overlay_box = (int(curr_x), y_p, int(curr_x) + slot_w, y_p + 30)
+                    curr_x += slot_w; continue
+                d.text((curr_x - ox, (y_p if fnt == f_tiny else y_p - 15) - oy), txt, font=fnt, fill=FG)
+                curr_x += d.textlength(txt, font=fnt)
+        widgets.append(Widget("header", (726, 20, W, 110), lambda s: (s['ip'], s['rack_t'], s['fan_p']), paint_header))
+
+        def add_gauge(name, x, y, label):
+            draw_gauge_frame(draw, x, y, 85, label, f_tiny, FG)
+            paint = lambda tile, d, s, ox, oy: draw_gauge_value(d, x - ox, y - oy, 85, s[name], f_graph, FG)
+            widgets.append(Widget(name, (x - 93, y - 93, x + 93, y + 93), lambda s: s[name], paint))
+
+        def add_sparkline(series, x, y, h, idx, label, font_val):
+            draw_sparkline_axes(draw, x, y, 600, h, FG)
+            def paint(tile, d, s, ox, oy):
+                draw_sparkline_data(d, x - ox, y - oy, 600, h, [p[idx] for p in s[series]], label, font_val, f_tiny, FG)
+            widgets.append(Widget(f"{series}_{idx}", (LEFT_COLUMN_RIGHT, y - 36, W, y + h + 2), lambda s: tuple(p[idx] for p in s[series]), paint))
+
+        add_gauge("m_cpu", cx - 160, 205, "MASTER CPU")
+        add_gauge("m_ram", cx + 160, 205, "MASTER RAM")
+        y_d_m = 350
+        add_sparkline("m_net", 780, y_d_m, 70 if is_s_act else 150, 0, "M-Down", f_med if not is_s_act else f_tiny)
+        if is_s_act:
+            add_sparkline("m_net", 780, 485, 70, 1, "M-Up", f_tiny)
+            draw.line((740, 570, 1428, 570), fill=FG, width=2)
+            def paint_nodes(tile, d, s, ox, oy):
+                # Só aparece com mais de um agente: "NODES online/total · primário"
+                online, total, primary = s['nodes']
+                if total > 1: d.text((740 - ox, 578 - oy), f"NODES {online}/{total} · {primary}", font=f_tiny, fill=FG)
+            widgets.append(Widget("nodes", (726, 574, W, 606), lambda s: s['nodes'], paint_nodes))
+            add_gauge("s_cpu", cx - 160, 700, "SLAVE CPU")
+            add_gauge("s_ram", cx + 160, 700, "SLAVE RAM")
+            add_sparkline("s_net", 780, 865, 70, 0, "S-Down", f_tiny)
+            add_sparkline("s_net", 780, 975, 70, 1, "S-Up", f_tiny)
+        else:
+            add_sparkline("m_net", 780, y_d_m + 230, 150, 1, "M-Up", f_med)
+
+        icon_cache.paste(img, s['theme'], s['moon_icon'], (610, 40), (100, 100))
+        draw.text((660, 150), s['moon_label'], font=f_tiny, fill=FG, anchor="mt")
+        return img, widgets
+
+def draw_overlay(img, box, theme, kbat):
+    """Escreve a bateria do Kindle na caixa reservada do frame base."""
+    BG, FG = theme_colors(theme)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle(box, fill=BG)
+    draw.text(box[:2], f"{kbat or '--'}%", font=get_font(24), fill=FG)
+
+# rotation da configuração -> transposição sem perdas (mesmo sentido do antigo rotate(angle, expand=True))
+ROTATIONS = {1: Image.Transpose.ROTATE_90, 2: Image.Transpose.ROTATE_180, 3: Image.Transpose.ROTATE_270}
+
+def rotate_frame(img, rotation):
+    op = ROTATIONS.get(int(rotation))
+    return img.transpose(op) if op is not None else img
+
+# --- CODIFICAÇÕES PARA E-INK ---
+# O painel só mostra 16 níveis de cinza (0x00, 0x11, ..., 0xFF)
+GRAY16_PALETTE = Image.new('P', (1, 1))
+GRAY16_PALETTE.putpalette([v for i in range(16) for v in (i * 17,) * 3] + [0] * 3 * 240)
+GRAY16_LUT = [(v * 15 + 127) // 255 for v in range(256)]
+
+def encode_png(img):
+    buf = io.BytesIO(); img.save(buf, 'PNG')
+    return buf.getvalue()
+
+def encode_png4(img, dither=False):
+    """PNG paletizado de 4 bits com os 16 cinzas do painel (dither Floyd-Steinberg opcional)."""
+    if dither: q = img.convert('RGB').quantize(palette=GRAY16_PALETTE, dither=Image.Dither.FLOYDSTEINBERG)
+    else:
+        q = img.point(GRAY16_LUT); q = Image.frombytes('P', img.size, q.tobytes())
+        q.putpalette(GRAY16_PALETTE.getpalette()[:48])
+    buf = io.BytesIO(); q.save(buf, 'PNG', bits=4)
+    return buf.getvalue()
+
+def encode_pgm(img):
+    """PGM binário (P5): cabeçalho + bytes crus do framebuffer, sem descompressão no Kindle."""
+    return b"P5 %d %d 255\n" % img.size + img.tobytes()
+
+# formato -> (codificador(img, dither), mimetype)
+FORMATS = {
+    'png': (lambda img, dither: encode_png(img), 'image/png'),
+    'png4': (encode_png4, 'image/png'),
+    'pgm': (lambda img, dither: encode_pgm(img), 'image/x-portable-graymap'),
+}
+
+def encode_frame(img, fmt='png', dither=False):
+    if fmt not in FORMATS: raise ValueError(f"formato desconhecido: {fmt}")
+    return FORMATS[fmt][0](img, dither)
+
+def clean_kbat(kbat):
+    """Normaliza o parâmetro ?kbat para servir de chave de cache (0-100 ou None)."""
+    try: return str(max(0, min(100, int(kbat))))
+    except (TypeError, ValueError): return None
+
+# Frame final já com overlay e rotação; image nunca é alterada depois de criada
+Composed = namedtuple('Composed', 'version image')
+# Frame final de um perfil já codificado: image serve ao delta, data é o frame inteiro em fmt
+Frame = namedtuple('Frame', 'version image data')
+# Resposta de delta(): mode 'full' | 'partial' | 'none', região codificada e (x, y, w, h) no frame rodado
+FrameDelta = namedtuple('FrameDelta', 'mode data region version')
+
+def finish_frame(img, box, profile, kbat):
+    """Variante (tema, fonte) -> frame do perfil: overlay da bateria, tamanho do Kindle e rotação."""
+    width, height, rotation, theme, _ = profile
+    frame = img.copy()
+    draw_overlay(frame, box, theme, kbat)
+    if (width, height) != frame.size: frame = frame.resize((width, height), Image.LANCZOS)
+    return rotate_frame(frame, rotation)
+
+# --- RENDER NOS PROCESSOS DO POOL ---
+# Cada processo guarda as suas variantes, então a camada estática também é reaproveitada lá
+_worker_variants = OrderedDict()
+
+def render_job(snap, profile, kbat, fmt, dither):
+    """Corre num processo do pool: recebe o snapshot (só tipos simples) e devolve
+    (mode, size, pixels, bytes codificados, segundos), tudo picklable e sem objetos do PIL."""
+    t0 = time.perf_counter()
+    vkey = (profile[3], profile[4])
+    r = _worker_variants.get(vkey)
+    if r is None:
+        r = _worker_variants[vkey] = LayeredRenderer()
+        while len(_worker_variants) > RenderEngine.MAX_VARIANTS: _worker_variants.popitem(last=False)
+    img, box, _ = r.render(dict(snap, theme=vkey[0], font_size=vkey[1]))
+    frame = finish_frame(img, box, profile, kbat)
+    data = encode_frame(frame, fmt, dither)
+    return frame.mode, frame.size, frame.tobytes(), data, time.perf_counter() - t0
+
+def _warm_worker():
+    get_font(24); return os.getpid()
+
+# --- MOTOR DE RENDERIZAÇÃO (FRAME PRÉ-RENDERIZADO) ---
+class RenderEngine:
+    """Mantém o último frame pronto em memória e o redesenha em segundo plano.
+
+    O frame só é redesenhado quando o snapshot das entradas muda (tick dos sensores,
+    /report, virada de minuto ou gravação de configuração). A bateria do Kindle fica
+    num overlay, então /dashboard.png só precisa compor e codificar quando o kbat muda.
+
+    Cada perfil de dispositivo (tamanho, rotação, tema, fonte; ver devices.Profile) usa a
+    variante (tema, fonte) do canvas W x H, redimensionada e rodada no compose; Kindles
+    com o mesmo perfil partilham os mesmos frames e caches. profile=None é o perfil global.
+
+    Com workers > 0 (start_workers), o desenho e a codificação correm num pool de processos,
+    fora do GIL do servidor web: pedidos iguais ao mesmo tempo partilham um só job, a fila
+    tem no máximo 2 x workers jobs e, se o pool estiver cheio ou passar timeout, serve o
+    último frame bom desse perfil (e só desenha aqui se ainda não houver nenhum).
+
+    Para refresh parcial, delta() guarda por cliente o último frame enviado e devolve só
+    a caixa que mudou; o frame inteiro volta na primeira visita, a cada partial_limit
+    parciais (limpa o ghosting do e-ink) ou quando a área alterada passa PARTIAL_MAX_AREA.
+
+    wait() estaciona um pedido numa única Condition até published passar da versão que o
+    cliente já tem (o frame novo já está desenhado), até notify() ou até o timeout, sem
+    polling. Cada pedido estacionado ocupa a sua thread do servidor (o Flask atende uma thread
+    por pedido), por isso no máximo MAX_WAITERS esperam ao mesmo tempo e os seguintes são
+    recusados (o /wait responde 503 com Retry-After)."""
+
+    MAX_ENCODED, MAX_VARIANTS, MAX_WAITERS = 16, 4, 32
+    MAX_CLIENTS, PARTIAL_LIMIT, PARTIAL_MAX_AREA = 16, 30, 0.5
+
+    def __init__(self, snapshot_fn, workers=0, timeout=5.0):
+        self._snapshot_fn, self.workers, self.timeout = snapshot_fn, workers, timeout
+        self._lock, self._render_lock = threading.Lock(), threading.Lock()
+        self._wake = threading.Event()
+        self._snap, self._composed, self._frames = None, {}, {}
+        # (tema, fonte) -> [LayeredRenderer, versão, (frame, caixa do overlay)]
+        self._variants = OrderedDict()
+        self._clients = OrderedDict()
+        self._changed, self._waiters = threading.Condition(), 0
+        # Pool: (versão, chave) -> Future em curso; chave -> último Frame bom (sobrevive aos redesenhos)
+        self._pool, self._inflight, self._last_good = None, {}, OrderedDict()
+        self.counters = {"jobs": 0, "coalesced": 0, "rejected": 0, "timeouts": 0, "errors": 0, "stale": 0, "local": 0}
+        self.version = self.published = 0
+
+    def invalidate(self):
+        """Sinaliza que alguma entrada mudou; o redesenho acontece na thread do motor."""
+        self._wake.set()
+
+    def start_workers(self):
+        """Arranca o pool. Chamar antes de qualquer outra thread: os processos são criados por
+        fork (com spawn cada um voltaria a importar o main.py e a iniciar o hardware)."""
+        if self.workers <= 0 or self._pool is not None: return
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        # O pool só cria processos quando há trabalho: um job por worker cria-os já todos
+        wait_futures([self._pool.submit(_warm_worker) for _ in range(self.workers)])
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, workers=self.workers if self._pool else 0, inflight=len(self._inflight),
+                        waiters=self._waiters, version=self.version)
+
+    def _run(self):
+        while True:
+            self.refresh()
+            # Acorda sozinho na virada do minuto para atualizar o relógio
+            self._wake.wait(60.05 - time.time() % 60); self._wake.clear()
+
+    def refresh(self):
+        try:
+            snap = self._snapshot_fn()
+            if snap == self._snap: return
+            with self._lock:
+                self._snap, self._composed, self._frames = snap, {}, {}
+                self.version += 1; version = self.version
+                keys = list(self._variants) or [(snap['theme'], snap['font_size'])]
+                recent = list(self._last_good)
+            if self._pool is None:
+                # Redesenha já as variantes em uso, para nenhum pedido esperar pelo render
+                for vkey in keys: self._variant(vkey)
+            else:
+                # Pede ao pool, em paralelo, os frames dos perfis servidos recentemente
+                jobs = [self._submit(key, version, snap) for key in recent]
+                jobs = [f for f in jobs if f is not None]
+                if jobs: wait_futures(jobs, timeout=self.timeout)
+            with self._changed:
+                self.published = max(self.published, version); self._changed.notify_all()
+        except Exception: INTERNAL_ERRORS.labels("render").inc(); traceback.print_exc()
+
+    def notify(self):
+        """Acorda todos os wait() para reavaliarem as suas condições (ex.: STOP/RUN)."""
+        with self._changed: self._changed.notify_all()
+
+    def wait(self, since, timeout, wake=None):
+        """Bloqueia até published != since, wake() verdadeiro ou timeout; devolve published.
+        Com MAX_WAITERS já estacionados devolve logo None, sem esperar."""
+        with self._changed:
+            if self._waiters >= self.MAX_WAITERS: return None
+            self._waiters += 1
+            try: self._changed.wait_for(lambda: self.published != since or (wake is not None and wake()), timeout)
+            finally: self._waiters -= 1
+            return self.published
+
+    def _variant(self, vkey):
+        """(versão, frame, caixa do overlay) da variante (tema, fonte) para o snapshot atual."""
+        with self._render_lock:
+            with self._lock: snap, version = self._snap, self.version
+            v = self._variants.get(vkey)
+            if v is None:
+                v = self._variants[vkey] = [LayeredRenderer(), None, None]
+                while len(self._variants) > self.MAX_VARIANTS: self._variants.popitem(last=False)
+            self._variants.move_to_end(vkey)
+            if v[1] != version:
+                with RENDER_SECONDS.labels("draw").time(): img, box, _ = v[0].render(dict(snap, theme=vkey[0], font_size=vkey[1]))
+                v[1], v[2] = version, (img, box)
+            return v[1], v[2][0], v[2][1]
+
+    def default_profile(self):
+        s = self._snap
+        return (W, H, int(s['rotation']), s['theme'], int(s['font_size']))
+
+    def compose(self, kbat=None, profile=None):
+        """Frame final para este kbat e perfil (Composed) desenhado neste processo, em cache até ao próximo redesenho."""
+        if self._snap is None: self.refresh()
+        kbat, profile = clean_kbat(kbat), tuple(profile or self.default_profile())
+        with self._lock:
+            hit = self._composed.get((profile, kbat))
+            if hit and hit.version == self.version: return hit
+        version, img, box = self._variant((profile[3], profile[4]))
+        entry = Composed(version, finish_frame(img, box, profile, kbat))
+        with self._lock:
+            if version == self.version:
+                if len(self._composed) >= self.MAX_ENCODED: self._composed.clear()
+                self._composed[(profile, kbat)] = entry
+        return entry
+
+    def frame(self, kbat=None, fmt='png', dither=False, profile=None):
+        """Frame do perfil já codificado em fmt (ver FORMATS), em cache por (perfil, kbat, fmt, dither)."""
+        if self._snap is None: self.refresh()
+        key = (tuple(profile or self.default_profile()), clean_kbat(kbat), fmt, dither)
+        with self._lock:
+            hit = self._frames.get(key)
+            version, snap = self.version, self._snap
+        if hit and hit.version == version: return hit
+        if self._pool is not None:
+            job = self._submit(key, version, snap)
+            if job is None: self._count("rejected")
+            else:
+                try: return self._collect(key, version, job.result(timeout=self.timeout))
+                except FutureTimeout: self._count("timeouts")
+                except Exception: self._count("errors"); traceback.print_exc()
+            with self._lock: last = self._last_good.get(key)
+            if last is not None:
+                self._count("stale"); return last
+            # Ainda não há frame bom deste perfil: desenha aqui para não responder em branco
+            self._count("local")
+        with RENDER_SECONDS.labels("local").time():
+            cur = self.compose(kbat, key[0])
+            return self._store(key, Frame(cur.version, cur.image, encode_frame(cur.image, fmt, dither)))
+
+    def _count(self, name):
+        with self._lock: self.counters[name] += 1
+
+    def _submit(self, key, version, snap):
+        """Future do job (versão, chave), partilhado por quem pedir o mesmo; None com a fila cheia."""
+        with self._lock:
+            job = self._inflight.get((version, key))
+            if job is not None:
+                self.counters["coalesced"] += 1; return job
+            if self._pool is None or len(self._inflight) >= 2 * self.workers: return None
+            try: job = self._pool.submit(render_job, snap, *key)
+            except (BrokenProcessPool, RuntimeError):
+                self._disable_pool(); return None
+            self._inflight[(version, key)] = job; self.counters["jobs"] += 1
+        job.add_done_callback(lambda f: self._job_done(key, version, f))
+        return job
+
+    def _job_done(self, key, version, job):
+        with self._lock: self._inflight.pop((version, key), None)
+        if job.cancelled(): return
+        if isinstance(job.exception(), BrokenProcessPool):
+            with self._lock: self._disable_pool()
+        elif job.exception() is None:
+            RENDER_SECONDS.labels("pool").observe(job.result()[4])
+            self._collect(key, version, job.result())
+
+    def _disable_pool(self):
+        """Chamado com _lock. Um pool partido não é recriado (fork com threads a correr não é seguro):
+        o motor volta a desenhar neste processo."""
+        if self._pool is None: return
+        print("[RENDER] Pool de render partido; a desenhar no processo principal.")
+        pool, self._pool = self._pool, None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _collect(self, key, version, result):
+        with self._lock:
+            hit = self._frames.get(key)
+            if hit and hit.version == version: return hit
+        mode, size, pixels, data, _ = result
+        return self._store(key, Frame(version, Image.frombytes(mode, size, pixels), data))
+
+    def _store(self, key, frame):
+        with self._lock:
+            if frame.version == self.version:
+                if len(self._frames) >= self.MAX_ENCODED: self._frames.clear()
+                self._frames[key] = frame
+            last = self._last_good.get(key)
+            if last is None or last.version <= frame.version:
+                self._last_good[key] = frame; self._last_good.move_to_end(key)
+                while len(self._last_good) > self.MAX_ENCODED: self._last_good.popitem(last=False)
+        return frame
+
+    def encoded(self, kbat=None, fmt='png', dither=False, profile=None):
+        return self.frame(kbat, fmt, dither, profile).data
+
+    def png(self, kbat=None):
+        return self.encoded(kbat, 'png')
+
+    def delta(self, cid, kbat=None, force_full=False, fmt='png', dither=False, profile=None, partial_limit=None):
+        """Só o que mudou desde o último frame enviado a cid (ver FrameDelta)."""
+        cur = self.frame(kbat, fmt, dither, profile)
+        limit = self.PARTIAL_LIMIT if partial_limit is None else partial_limit
+        with self._lock:
+            prev = self._clients.get(cid)
+        full_region = (0, 0) + cur.image.size
+        mode, bbox = 'full', None
+        if not (force_full or prev is None or prev[0].size != cur.image.size or prev[1] >= limit):
+            bbox = None if prev[0] is cur.image else ImageChops.difference(prev[0], cur.image).getbbox()
+            if bbox is None: mode = 'none'
+            elif (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) <= self.PARTIAL_MAX_AREA * full_region[2] * full_region[3]: mode = 'partial'
+        if mode == 'full': result = FrameDelta('full', cur.data, full_region, cur.version)
+        elif mode == 'none': result = FrameDelta('none', None, None, cur.version)
+        else:
+            region = (bbox[0], bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1])
+            result = FrameDelta('partial', encode_frame(cur.image.crop(bbox), fmt, dither), region, cur.version)
+        partials = 0 if mode == 'full' else prev[1] + (mode == 'partial')
+        with self._lock:
+            self._clients[cid] = (cur.image, partials); self._clients.move_to_end(cid)
+            while len(self._clients) > self.MAX_CLIENTS: self._clients.popitem(last=False)
+        return result
@@ -0,0 +1,105 @@
+import datetime, sqlite3, threading, time, traceback
+from telemetry import tune_connection
+
+# (tabela, coluna de tempo, chave de configuração com os dias a manter; 0 = para sempre)
+RETENTION_TABLES = [
+    ('telemetry', 'ts', 'retention_raw_days'),
+    ('node_telemetry', 'ts', 'retention_raw_days'),
+    ('telemetry_1m', 'bucket', 'retention_1m_days'),
+    ('telemetry_1h', 'bucket', 'retention_1h_days'),
+]
+AUTO_VACUUM_INCREMENTAL = 2
+
+def retention_enabled(conf):
+    return any(int(conf.get(key) or 0) > 0 for _, _, key in RETENTION_TABLES)
+
+def ensure_incremental_vacuum(conn, convert_existing=False):
+    """Põe a base em auto_vacuum=INCREMENTAL. Numa base nova basta o PRAGMA antes de criar
+    as tabelas; numa base existente só vale após um VACUUM completo (feito se convert_existing)."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL: return True
+    conn.execute(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+    has_tables = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' LIMIT 1").fetchone()
+    if has_tables and convert_existing:
+        print("[RETENTION] A converter a base para auto_vacuum incremental (VACUUM único)...")
+        conn.execute("VACUUM")
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+
+class RetentionEngine:
+    """Apaga dados mais velhos que a política configurada e devolve o espaço ao disco.
+
+    Os DELETE correm em blocos de chunk_size linhas, cada um na sua transação curta e com
+    uma pausa entre eles, para nunca segurar o lock de escrita muito tempo; depois, se a base
+    estiver em modo incremental, corre PRAGMA incremental_vacuum também aos poucos.
+    Os agregados de 1 dia e os recordes não são tocados."""
+
+    def __init__(self, db_path, policy_fn, interval=3600, chunk_size=500, pause=0.05, vacuum_pages=256):
+        self.db_path, self.policy_fn, self.interval = db_path, policy_fn, interval
+        self.chunk_size, self.pause, self.vacuum_pages = chunk_size, pause, vacuum_pages
+        self._wake, self._run_lock = threading.Event(), threading.Lock()
+        self.last_run, self.totals = None, {"runs": 0, "rows_removed": 0, "bytes_reclaimed": 0}
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def trigger(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try: self.run_once()
+            except Exception: traceback.print_exc()
+            self._wake.wait(self.interval); self._wake.clear()
+
+    def run_once(self):
+        """Uma passagem completa; devolve as estatísticas dela (também em last_run)."""
+        policy = self.policy_fn()
+        if not retention_enabled(policy): return None
+        with self._run_lock:
+            t0 = time.perf_counter()
+            stats = {"ts": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "removed": {},
+                     "rows_removed": 0, "bytes_reclaimed": 0, "max_lock_ms": 0.0}
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            try:
+                tune_connection(conn)
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+                for table, col, key in RETENTION_TABLES:
+                    days = int(policy.get(key) or 0)
+                    if days <= 0: continue
+                    cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+                    n = self._delete_before(conn, table, col, cutoff, stats)
+                    stats["removed"][table] = n; stats["rows_removed"] += n
+                if stats["rows_removed"]: self._vacuum(conn)
+                pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+                stats["bytes_reclaimed"] = max(0, pages_before - pages_after) * page_size
+                stats["db_bytes"] = pages_after * page_size
+                stats["free_bytes"] = conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+                stats["incremental"] = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+            finally: conn.close()
+            stats["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            self.last_run = stats
+            self.totals["runs"] += 1
+            self.totals["rows_removed"] += stats["rows_removed"]; self.totals["bytes_reclaimed"] += stats["bytes_reclaimed"]
+            return stats
+
+    def _delete_before(self, conn, table, col, cutoff, stats):
+        q = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {col} < ? LIMIT ?)"
+        total = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                with conn: n = conn.execute(q, (cutoff, self.chunk_size)).rowcount
+            except sqlite3.OperationalError as e:
+                # Tabela ainda não existe ou lock ocupado: tenta de novo na próxima passagem
+                print(f"[RETENTION] {table}: {e}"); return total
+            stats["max_lock_ms"] = max(stats["max_lock_ms"], round((time.perf_counter() - t0) * 1000, 2))
+            total += n
+            if n < self.chunk_size: return total
+            time.sleep(self.pause)
+
+    def _vacuum(self, conn):
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL: return
+        while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            # executescript corre o PRAGMA até ao fim; execute() liberta só uma página por chamada
+            conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+            time.sleep(self.pause)
@@ -0,0 +1,112 @@
+import threading, time, traceback
+from collections import namedtuple
+from metrics import SENSOR_READ_SECONDS, SENSOR_ERRORS, INTERNAL_ERRORS
+
+# Última leitura válida de uma fonte; ts em time.time(). Trocada inteira, nunca alterada no lugar
+Reading = namedtuple('Reading', 'value ts')
+
+class SensorWorker:
+    """Uma fonte local (DHT22, DS18B20...) lida pela sua própria thread, na sua cadência.
+
+    A cada interval segundos faz um ciclo: até 1 + retries tentativas, separadas por backoff
+    exponencial (backoff_base * 2^k) e nunca por menos de min_delay desde o fim da tentativa
+    anterior (o DHT22 recusa leituras com menos de 2 s). As tentativas não passam do ciclo
+    seguinte; ciclos que falham todos afastam o próximo (interval * 2^k, até backoff_max).
+    read() devolve o valor ou levanta; validate(valor, anterior) recusa leituras absurdas.
+    Quem lê usa fresh(), que não toca no hardware e ignora valores com mais de stale_after s."""
+
+    def __init__(self, name, read, interval=10.0, min_delay=0.0, retries=2, backoff_base=0.5, backoff_max=300.0,
+                 stale_after=None, validate=None, classify=None, on_value=None):
+        self.name, self.read, self.validate, self.classify, self.on_value = name, read, validate, classify, on_value
+        self.interval, self.min_delay, self.retries = max(interval, min_delay), min_delay, retries
+        self.backoff_base, self.backoff_max = backoff_base, backoff_max
+        self.stale_after = stale_after if stale_after is not None else 3 * self.interval
+        self.latest = None
+        self.reads, self.errors, self.failed_cycles, self.last_error = 0, 0, 0, None
+        self._last_attempt, self._next_cycle = None, None
+
+    def fresh(self, now=None):
+        """Última leitura se tiver no máximo stale_after segundos, senão None."""
+        r = self.latest
+        if r is None or (now or time.time()) - r.ts > self.stale_after: return None
+        return r
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"sensor-{self.name}", daemon=True).start()
+
+    def _run(self):
+        self._next_cycle = time.monotonic()
+        while True:
+            try: ok = self.cycle()
+            except Exception: INTERNAL_ERRORS.labels(f"sensor_{self.name}").inc(); traceback.print_exc(); ok = False
+            self.failed_cycles = 0 if ok else self.failed_cycles + 1
+            step = self.interval if ok else min(self.backoff_max, self.interval * 2 ** (self.failed_cycles - 1))
+            self._next_cycle = max(self._next_cycle + step, time.monotonic())
+            time.sleep(max(0.0, self._next_cycle - time.monotonic()))
+
+    def cycle(self):
+        """Um ciclo com o orçamento de tentativas; devolve True se publicou uma leitura."""
+        deadline = time.monotonic() + self.interval
+        for attempt in range(self.retries + 1):
+            if attempt:
+                at = self._last_attempt + max(self.min_delay, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                if at >= deadline: return False  # fica para o próximo ciclo
+                time.sleep(max(0.0, at - time.monotonic()))
+            if self.poll(): return True
+        return False
+
+    def poll(self):
+        """Uma tentativa, na thread de quem chama. Devolve True se publicou uma leitura."""
+        if self._last_attempt is not None:
+            wait = self._last_attempt + self.min_delay - time.monotonic()
+            if wait > 0: time.sleep(wait)
+        try:
+            with SENSOR_READ_SECONDS.labels(self.name).time(): value = self.read()
+        except Exception as e:
+            return self._fail(self.classify(e) if self.classify else "error", e)
+        finally: self._last_attempt = time.monotonic()
+        previous = self.fresh()
+        if value is None or (self.validate and not self.validate(value, previous.value if previous else None)):
+            return self._fail("out_of_range", f"rejeitado: {value!r}")
+        self.latest, self.reads = Reading(value, time.time()), self.reads + 1
+        if self.on_value: self.on_value(self.latest)
+        return True
+
+    def _fail(self, reason, error):
+        self.errors += 1; self.last_error = f"{reason}: {error}"
+        SENSOR_ERRORS.labels(self.name, reason).inc()
+        return False
+
+    def status(self):
+        r, now = self.latest, time.time()
+        return {"interval": self.interval, "value": r.value if r else None, "age": round(now - r.ts, 1) if r else None,
+                "fresh": self.fresh(now) is not None, "reads": self.reads, "errors": self.errors,
+                "failed_cycles": self.failed_cycles, "last_error": self.last_error,
+                "next_in": round(max(0.0, self._next_cycle - time.monotonic()), 1) if self._next_cycle else None}
+
+class SensorScheduler:
+    """Agrupa os SensorWorker: cada um tem a sua thread, então um 1-Wire lento ou um DHT a
+    repetir não atrasa os outros nem a telemetria, que só lê as leituras publicadas."""
+
+    def __init__(self):
+        self.workers = {}
+
+    def add(self, worker):
+        self.workers[worker.name] = worker
+        return worker
+
+    def start(self):
+        for w in self.workers.values(): w.start()
+
+    def fresh(self, name):
+        """Valor mais recente e ainda válido da fonte, ou None (fonte ausente, sem leitura ou velha)."""
+        w = self.workers.get(name)
+        r = w.fresh() if w else None
+        return r.value if r else None
+
+    def ages(self):
+        now = time.time()
+        return {name: now - w.latest.ts for name, w in self.workers.items() if w.latest}
+
+    def status(self):
+        return {name: w.status() for name, w in self.workers.items()}
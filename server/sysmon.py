@@ -0,0 +1,82 @@
+import socket, threading, time, traceback
+from array import array
+from collections import namedtuple
+import psutil
+from renderer import MAX_HISTORY
+from metrics import INTERNAL_ERRORS
+
+# Leitura publicada pelo SystemSampler; trocada inteira a cada amostra, nunca alterada no lugar
+SysSnapshot = namedtuple('SysSnapshot', 'ts cpu ram core_temp net_down net_up net_history ip hostname')
+
+def read_cpu_temp():
+    """Lê a temperatura interna do SoC do Raspberry Pi (Master)."""
+    try:
+        temps = psutil.sensors_temperatures()
+        if 'cpu_thermal' in temps: return temps['cpu_thermal'][0].current
+        if 'bcm2835_thermal' in temps: return temps['bcm2835_thermal'][0].current
+    except Exception: pass
+    return None
+
+def read_ip():
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect(("8.8.8.8", 80)); return s.getsockname()[0]
+        finally: s.close()
+    except OSError: return "Offline"
+
+class SystemSampler:
+    """Único leitor das métricas do sistema: CPU, RAM, temperatura do SoC, débito e IP.
+
+    Uma thread lê tudo a cada interval segundos (o IP só a cada ip_interval) e grava o débito
+    em buffers circulares array('d') pré-alocados; depois publica um SysSnapshot imutável.
+    Dashboard, /api/stats e telemetria só leem snapshot, sem tocar no psutil, então nenhum
+    cliente encurta a janela do débito nem o cpu_percent dos outros."""
+
+    def __init__(self, interval=10.0, history=MAX_HISTORY, ip_interval=60.0, on_sample=None):
+        self.interval, self.history, self.ip_interval, self.on_sample = interval, history, ip_interval, on_sample
+        self._down, self._up = array('d', [0.0]) * history, array('d', [0.0]) * history
+        self._next, self._count = 0, 0
+        self._last_io, self._last_t, self._ip, self._ip_at = None, None, "Offline", None
+        self._hostname = socket.gethostname()
+        self.snapshot = SysSnapshot(0.0, 0.0, 0.0, None, 0.0, 0.0, (), self._ip, self._hostname)
+
+    def start(self):
+        self.sample()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            self.sample()
+
+    def sample(self):
+        try:
+            now, io_now = time.monotonic(), psutil.net_io_counters()
+            down = up = 0.0
+            if self._last_io is not None and now > self._last_t:
+                dt = now - self._last_t
+                down = (io_now.bytes_recv - self._last_io.bytes_recv) / dt / 1024
+                up = (io_now.bytes_sent - self._last_io.bytes_sent) / dt / 1024
+            self._last_io, self._last_t = io_now, now
+            i = self._next
+            self._down[i], self._up[i] = down, up
+            self._next, self._count = (i + 1) % self.history, min(self._count + 1, self.history)
+            if self._ip_at is None or now - self._ip_at >= self.ip_interval:
+                self._ip, self._ip_at = read_ip(), now
+            self.snapshot = SysSnapshot(time.time(), psutil.cpu_percent(), psutil.virtual_memory().percent, read_cpu_temp(),
+                                        down, up, self._net_history(), self._ip, self._hostname)
+        except Exception: INTERNAL_ERRORS.labels("sysmon").inc(); traceback.print_exc(); return
+        if self.on_sample: self.on_sample(self.snapshot)
+
+    def fill(self):
+        """Fração ocupada dos buffers circulares (1.0 depois de history amostras)."""
+        return self._count / self.history
+
+    def _net_history(self):
+        """Do mais antigo para o mais recente, como os gráficos esperam."""
+        start = (self._next - self._count) % self.history
+        idx = [(start + k) % self.history for k in range(self._count)]
+        return tuple((self._down[j], self._up[j]) for j in idx)
@@ -0,0 +1,127 @@
+import queue, sqlite3, threading, time, traceback
+from metrics import DB_INSERT_SECONDS, DB_ERRORS
+
+TELEMETRY_COLUMNS = ('int_t', 'int_h', 'ext_t', 's_t', 's_f', 's_c', 's_r', 'm_core_t', 's_core_t', 'm_c', 'm_r', 'n_d', 'n_u', 'sn_d', 'sn_u')
+
+def open_reader(db_path):
+    """Conexão só de leitura; em WAL não bloqueia nem é bloqueada pelo escritor."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def tune_connection(conn, synchronous="NORMAL"):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    conn.execute("PRAGMA busy_timeout=5000")
+
+class TelemetryWriter:
+    """Escritor dedicado da telemetria: uma única conexão WAL e gravação em lote (write-behind).
+
+    submit() só enfileira a linha (com o seu próprio ts) numa fila limitada; a thread do
+    escritor grava quando o lote atinge batch_size linhas ou a linha mais antiga tem
+    flush_interval segundos, numa única transação. close() esvazia a fila antes de sair.
+    Se o INSERT ou um hook falhar, a transação inteira volta atrás e o lote fica para o
+    flush seguinte (flush_interval depois); só ao fim de max_retries tentativas é descartado."""
+
+    def __init__(self, db_path, batch_size=6, flush_interval=60, max_queue=1000, synchronous="NORMAL", max_retries=3):
+        self.db_path, self.batch_size, self.flush_interval = db_path, batch_size, flush_interval
+        self.synchronous, self.max_retries = synchronous, max_retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_req, self._stop = threading.Event(), threading.Event()
+        self._thread, self._start_lock = None, threading.Lock()
+        self._hooks = []
+        self.counters = {
+            "rows_written": 0, "batches": 0, "rows_dropped": 0, "errors": 0, "retries": 0, "rows_failed": 0,
+            "last_batch_size": 0, "max_batch_size": 0,
+            "last_write_ms": 0.0, "max_write_ms": 0.0, "total_write_ms": 0.0
+        }
+
+    def add_hook(self, hook, on_rollback=None):
+        """hook(conn, [(id, linha), ...]) corre na mesma transação de cada lote gravado.
+        Se o lote voltar atrás, on_rollback() descarta o que o hook já guardou em memória."""
+        self._hooks.append((hook, on_rollback))
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True); self._thread.start()
+
+    def submit(self, row):
+        """Enfileira uma linha {coluna: valor, 'ts': ...}; nunca bloqueia quem chama."""
+        if self._thread is None: self.start()
+        try: self._queue.put_nowait(row)
+        except queue.Full: self.counters["rows_dropped"] += 1
+
+    def flush(self):
+        self._flush_req.set()
+
+    def close(self, timeout=10):
+        self._stop.set(); self._flush_req.set()
+        if self._thread: self._thread.join(timeout)
+
+    def stats(self):
+        c = dict(self.counters)
+        c["queue_depth"] = self._queue.qsize(); c["total_write_ms"] = round(c["total_write_ms"], 2)
+        c["avg_write_ms"] = round(c["total_write_ms"] / c["batches"], 2) if c["batches"] else 0.0
+        c["avg_batch_size"] = round(c["rows_written"] / c["batches"], 2) if c["batches"] else 0.0
+        return c
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        tune_connection(conn, self.synchronous)
+        pending, first_at, attempts = [], None, 0
+        try:
+            while True:
+                wait = 1.0 if first_at is None else first_at + self.flush_interval - time.monotonic()
+                try:
+                    pending.append(self._queue.get(timeout=max(0.0, min(wait, 1.0))))
+                    if first_at is None: first_at = time.monotonic()
+                except queue.Empty: pass
+                forced = self._flush_req.is_set() or self._stop.is_set()
+                # Um lote que falhou espera pelo flush seguinte, mesmo que já tenha batch_size linhas
+                due = len(pending) >= self.batch_size and not attempts
+                if pending and (forced or due or time.monotonic() - first_at >= self.flush_interval):
+                    self._drain_into(pending)
+                    if self._write(conn, pending): pending, first_at, attempts = [], None, 0
+                    else:
+                        attempts += 1
+                        if attempts > self.max_retries:
+                            print(f"[TELEMETRY] lote de {len(pending)} linhas descartado após {attempts} tentativas")
+                            self.counters["rows_failed"] += len(pending); pending, first_at, attempts = [], None, 0
+                        else:
+                            self.counters["retries"] += 1; first_at = time.monotonic()
+                            print(f"[TELEMETRY] lote de {len(pending)} linhas falhou; tentativa {attempts + 1} em {self.flush_interval}s")
+                            if self._stop.is_set(): time.sleep(min(1.0, self.flush_interval))
+                if forced: self._flush_req.clear()
+                if self._stop.is_set() and not pending and self._queue.empty(): break
+        finally: conn.close()
+
+    def _drain_into(self, pending):
+        while True:
+            try: pending.append(self._queue.get_nowait())
+            except queue.Empty: return
+
+    def _write(self, conn, rows):
+        """Grava o lote e corre os hooks numa só transação; devolve False se ela voltou atrás."""
+        cols = ('ts',) + TELEMETRY_COLUMNS
+        sql = f"INSERT INTO telemetry ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        t0, op = time.perf_counter(), "insert"
+        try:
+            with conn:
+                inserted = [(conn.execute(sql, tuple(r.get(c) for c in cols)).lastrowid, r) for r in rows]
+                op = "hook"
+                for hook, _ in self._hooks: hook(conn, inserted)
+        except Exception:
+            self.counters["errors"] += 1; DB_ERRORS.labels(op).inc(); traceback.print_exc()
+            for _, on_rollback in self._hooks:
+                if on_rollback:
+                    try: on_rollback()
+                    except Exception: traceback.print_exc()
+            return False
+        ms = (time.perf_counter() - t0) * 1000
+        DB_INSERT_SECONDS.observe(ms / 1000)
+        c = self.counters
+        c["rows_written"] += len(rows); c["batches"] += 1
+        c["last_batch_size"] = len(rows); c["max_batch_size"] = max(c["max_batch_size"], len(rows))
+        c["last_write_ms"] = round(ms, 2); c["max_write_ms"] = max(c["max_write_ms"], round(ms, 2)); c["total_write_ms"] += ms
+        return True
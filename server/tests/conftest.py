@@ -0,0 +1,12 @@
+import os, sys
+import pytest
+
+# Os módulos do servidor são planos em server/; os testes importam-nos como o main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """main.py importado com os fakes de benchmarks/fakes.py (sem GPIO, 1-Wire, psutil nem rede)."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    from fakes import load_server
+    return load_server(str(tmp_path_factory.mktemp("data")))
@@ -0,0 +1,36 @@
+import datetime, sqlite3
+from history import Rollups, init_rollup_tables, load_chart_series
+from retention import RetentionEngine
+from telemetry import TELEMETRY_COLUMNS
+
+FMT = "%Y-%m-%d %H:%M:%S"
+
+def make_db(path, start, minutes):
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE telemetry (id INTEGER PRIMARY KEY AUTOINCREMENT, ts DATETIME, "
+                 f"{', '.join(f'{c} REAL' for c in TELEMETRY_COLUMNS)})")
+    init_rollup_tables(conn)
+    conn.executemany("INSERT INTO telemetry (ts, int_t, ext_t) VALUES (?, ?, ?)",
+                     [((start + datetime.timedelta(minutes=i)).strftime(FMT), 20.0 + i % 5, 15.0) for i in range(minutes)])
+    Rollups().rebuild(conn); conn.commit(); conn.close()
+
+def test_expired_range_falls_back_to_coarser_rollup(tmp_path):
+    db = str(tmp_path / "telemetry.db")
+    start = (datetime.datetime.now() - datetime.timedelta(days=40)).replace(minute=0, second=0, microsecond=0)
+    make_db(db, start, 6 * 60)
+    policy = {"retention_raw_days": 7, "retention_1m_days": 14, "retention_1h_days": 0}
+    stats = RetentionEngine(db, lambda: policy).run_once()
+    assert stats["removed"]["telemetry"] == 6 * 60 and stats["removed"]["telemetry_1m"] == 6 * 60
+    # 2 h de janela escolheria os dados brutos; só os buckets de 1 h sobreviveram
+    conn = sqlite3.connect(db)
+    series, resolution = load_chart_series(conn, start.strftime(FMT), (start + datetime.timedelta(hours=2)).strftime(FMT))
+    assert resolution == '1h'
+    assert [y for _, y in series['c_ext_t']] == [15.0, 15.0, 15.0]
+
+def test_recent_range_keeps_chosen_resolution(tmp_path):
+    db = str(tmp_path / "telemetry.db")
+    start = datetime.datetime.now().replace(second=0, microsecond=0) - datetime.timedelta(hours=3)
+    make_db(db, start, 60)
+    conn = sqlite3.connect(db)
+    series, resolution = load_chart_series(conn, start.strftime(FMT), (start + datetime.timedelta(hours=1)).strftime(FMT))
+    assert resolution == 'raw' and len(series['c_int_t']) == 60
@@ -0,0 +1,28 @@
+import time
+from nodes import NodeRegistry
+
+def test_node_over_max_nodes_is_rejected_not_crashing():
+    reg, now = NodeRegistry(history=10, max_nodes=3), time.time()
+    for i in range(3):
+        reply, backlog = reg.ingest({"node": f"pi-{i}", "temp": 30.0}, now)
+        assert reply["status"] == "ok" and backlog == []
+    # O /report desempacota (resposta, backlog): o nó excedente tem de devolver o par, não None
+    assert reg.ingest({"node": "pi-3", "temp": 30.0}, now) == (None, [])
+    assert reg.report({"node": "pi-3", "temp": 30.0}, now) is None
+    assert sorted(n.node_id for n in reg.nodes()) == ["pi-0", "pi-1", "pi-2"]
+    # Os nós já registados continuam a ser aceites
+    assert reg.ingest({"node": "pi-1", "temp": 31.0}, now)[0]["status"] == "ok"
+
+def test_non_finite_numbers_fall_back_to_defaults():
+    reg, now = NodeRegistry(history=10), time.time()
+    for bad in (float('inf'), float('-inf'), float('nan'), "inf", "NaN", "-Infinity"):
+        reply, _ = reg.ingest({"node": "pi-x", "temp": bad, "fan": bad, "cpu": bad, "ts": bad}, now)
+        assert reply["status"] == "ok"
+        st = reg.get("pi-x").state
+        assert (st.temp, st.fan, st.cpu, st.last_seen) == (0.0, 0, 0.0, now)
+
+def test_report_route_accepts_non_finite_json(server):
+    client = server.app.test_client()
+    for body in ('{"node": "pi-inf", "fan": 1e999}', '{"node": "pi-inf", "fan": NaN}', '{"node": "pi-inf", "fan": "inf"}'):
+        res = client.post('/report', data=body, content_type='application/json')
+        assert res.status_code == 200, (body, res.status_code)
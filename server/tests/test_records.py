@@ -0,0 +1,42 @@
+import sqlite3, threading, time
+from records import RecordsBook, init_records_table
+from telemetry import TELEMETRY_COLUMNS
+
+def make_db(path, temps):
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"CREATE TABLE telemetry (id INTEGER PRIMARY KEY AUTOINCREMENT, ts DATETIME, "
+                     f"{', '.join(f'{c} REAL' for c in TELEMETRY_COLUMNS)})")
+        init_records_table(conn)
+        conn.executemany("INSERT INTO telemetry (ts, int_t) VALUES (?, ?)",
+                         [(f"2026-01-01 10:00:{i:02d}", t) for i, t in enumerate(temps)])
+
+def test_forget_rows_while_writer_holds_the_write_lock(tmp_path):
+    db = str(tmp_path / "t.db"); make_db(db, [20.0, 21.0, 90.0, 22.0])
+    book = RecordsBook()
+    with sqlite3.connect(db) as conn: book.load(conn)
+    # purge_anomaly: o 90 °C é anulado e os recordes têm de o esquecer
+    purge = sqlite3.connect(db, timeout=2)
+    purge.execute("UPDATE telemetry SET int_t = NULL WHERE id = 3"); purge.commit()
+
+    locked, errors = threading.Event(), []
+    def writer():
+        # Como o TelemetryWriter: a transação de escrita já está aberta quando o hook pede o _lock
+        conn = sqlite3.connect(db, timeout=5)
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                rid = conn.execute("INSERT INTO telemetry (ts, int_t) VALUES ('2026-01-01 10:01:00', 23.0)").lastrowid
+                locked.set(); time.sleep(0.3)
+                book.observe(conn, [(rid, {'ts': '2026-01-01 10:01:00', 'int_t': 23.0})])
+        except Exception as e: errors.append(e)
+        finally: conn.close()
+    t = threading.Thread(target=writer); t.start()
+    locked.wait(2)
+    t0 = time.perf_counter()
+    book.forget_rows(purge, [3])
+    t.join(5)
+    assert not errors and time.perf_counter() - t0 < 1.5
+    assert [v for v, _, _ in book._lists['hist_int_max_log']] == [23.0, 22.0, 21.0]
+    persisted = purge.execute("SELECT val FROM telemetry_records WHERE kind = 'hist_int_max_log' ORDER BY rank").fetchall()
+    assert [v for v, in persisted] == [23.0, 22.0, 21.0]
@@ -0,0 +1,50 @@
+from PIL import ImageChops, ImageDraw
+from renderer import LayeredRenderer, FONT_SIZE_MAX, FONT_SIZE_MIN
+
+def full_frame(s):
+    """Referência sem camadas: o layout estático e todos os widgets pintados direto no frame inteiro."""
+    img, widgets = LayeredRenderer()._build_layout(s)
+    draw = ImageDraw.Draw(img)
+    for w in widgets: w.paint(img, draw, s, 0, 0)
+    return img
+
+def snapshot(server, font_size):
+    # Débito realista: o sysmon falso amostra em rajada e daria taxas absurdas nos rótulos dos gráficos
+    net = tuple(((i * 37) % 900 + 20.0, (i * 11) % 300 + 5.0) for i in range(120))
+    return dict(server.build_render_snapshot(), font_size=font_size, theme='light', sensor_ext='ds18',
+                v1='-10.5', v2='88.8', hum='55.0', cond='Possibilidade de chuva irregular', m_net=net, s_net=net)
+
+def test_layered_frame_matches_full_frame_at_every_font_size(server):
+    for size in (FONT_SIZE_MIN, 120, FONT_SIZE_MAX):
+        s = snapshot(server, size)
+        frame, _, _ = LayeredRenderer().render(s)
+        assert ImageChops.difference(frame, full_frame(s)).getbbox() is None, size
+
+def test_temperature_digits_are_not_cropped_at_max_font(server):
+    s = snapshot(server, FONT_SIZE_MAX)
+    frame, _, _ = LayeredRenderer().render(s)
+    blank = dict(s, v1='', v2='')
+    diff = ImageChops.difference(frame, LayeredRenderer().render(blank)[0]).getbbox()
+    # A segunda linha passa do antigo fim fixo da caixa (y=700) e tem de estar inteira no frame
+    assert diff is not None and diff[3] > 700
+
+def test_widget_boxes_are_disjoint(server):
+    for s_act in (False, True):
+        _, widgets = LayeredRenderer()._build_layout(dict(snapshot(server, FONT_SIZE_MAX), s_act=s_act))
+        for i, a in enumerate(widgets):
+            for b in widgets[i + 1:]:
+                ax0, ay0, ax1, ay1 = a.box; bx0, by0, bx1, by1 = b.box
+                assert ax1 <= bx0 or bx1 <= ax0 or ay1 <= by0 or by1 <= ay0, (a.name, a.box, b.name, b.box)
+
+def test_incremental_frames_match_full_repaint(server):
+    """Muda um valor de cada vez: só os widgets sujos são refeitos e o frame tem de ser igual a um redesenho total."""
+    net = tuple((1000.0 - i % 7, 1000.0 + i % 5) for i in range(120))
+    s = dict(snapshot(server, FONT_SIZE_MAX), s_act=False, m_net=net)
+    changes = [{}, {'v1': '120.0'}, {'v2': '-20.0'}, {'v1': '--'}, {'hum': '99.9'}, {'cond': 'Sol'},
+               {'m_net': tuple((v + 50, u) for v, u in net)}, {'clock': '23:59'}, {'ip': '10.0.0.254'},
+               {'rack_t': '55.5'}, {'v1': '-20.0', 'm_cpu': 99.0}]
+    renderer = LayeredRenderer()
+    for change in changes:
+        s = dict(s, **change)
+        frame, _, _ = renderer.render(s)
+        assert ImageChops.difference(frame, full_frame(s)).getbbox() is None, change
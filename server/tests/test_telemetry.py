@@ -0,0 +1,58 @@
+import sqlite3, time
+from history import Rollups, init_rollup_tables
+from records import RecordsBook, init_records_table
+from telemetry import TelemetryWriter, TELEMETRY_COLUMNS
+
+def make_db(path):
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"CREATE TABLE telemetry (id INTEGER PRIMARY KEY AUTOINCREMENT, ts DATETIME, "
+                     f"{', '.join(f'{c} REAL' for c in TELEMETRY_COLUMNS)})")
+        init_rollup_tables(conn); init_records_table(conn)
+
+class FailingHook:
+    """Falha nas primeiras `failures` chamadas, depois deixa passar."""
+
+    def __init__(self, failures): self.failures, self.calls = failures, 0
+
+    def __call__(self, conn, rows):
+        self.calls += 1
+        if self.calls <= self.failures: raise sqlite3.OperationalError("disco cheio")
+
+def counts(path):
+    with sqlite3.connect(path) as conn:
+        return (conn.execute("SELECT count(*) FROM telemetry").fetchone()[0],
+                conn.execute("SELECT sum(n) FROM telemetry_1m").fetchone()[0] or 0,
+                conn.execute("SELECT count(*) FROM telemetry_records").fetchone()[0])
+
+def writer_with(path, failures, max_retries=3):
+    records, hook = RecordsBook(), FailingHook(failures)
+    w = TelemetryWriter(path, batch_size=3, flush_interval=0.2, max_retries=max_retries)
+    w.add_hook(records.observe, records.invalidate); w.add_hook(Rollups().observe); w.add_hook(hook)
+    return w, records, hook
+
+def submit_rows(w, n):
+    for i in range(n): w.submit({"ts": f"2026-01-01 10:00:{i:02d}", "int_t": 20.0 + i, "ext_t": 10.0})
+
+def test_hook_failure_rolls_back_and_batch_is_retried(tmp_path):
+    db = str(tmp_path / "t.db"); make_db(db)
+    w, records, hook = writer_with(db, failures=2)
+    submit_rows(w, 3)
+    deadline = time.time() + 5
+    while w.counters["rows_written"] < 3 and time.time() < deadline: time.sleep(0.05)
+    w.close()
+    # Duas transações desfeitas sem deixar rastro, a terceira grava linhas, agregados e recordes juntos
+    assert hook.calls == 3 and w.counters["retries"] == 2 and w.counters["rows_failed"] == 0
+    assert counts(db)[:2] == (3, 3)
+    # Os recordes em memória das tentativas desfeitas foram esquecidos: sem entradas repetidas
+    with sqlite3.connect(db) as conn: records.as_display(conn)
+    assert [v for v, _, _ in records._lists['hist_int_max_log']] == [22.0, 21.0, 20.0]
+
+def test_batch_is_dropped_after_max_retries(tmp_path):
+    db = str(tmp_path / "t.db"); make_db(db)
+    w, _, hook = writer_with(db, failures=100, max_retries=2)
+    submit_rows(w, 3)
+    deadline = time.time() + 5
+    while w.counters["rows_failed"] == 0 and time.time() < deadline: time.sleep(0.05)
+    w.close()
+    assert hook.calls == 3 and w.counters["rows_failed"] == 3 and w.counters["rows_written"] == 0
+    assert counts(db) == (0, 0, 0)
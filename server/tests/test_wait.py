@@ -0,0 +1,34 @@
+import threading, time
+from renderer import RenderEngine
+
+def park(engine, n):
+    threads = [threading.Thread(target=engine.wait, args=(engine.published, 2.0), daemon=True) for _ in range(n)]
+    for t in threads: t.start()
+    deadline = time.time() + 2
+    while engine.stats()["waiters"] < n and time.time() < deadline: time.sleep(0.01)
+    return threads
+
+def test_wait_refuses_past_max_waiters():
+    engine = RenderEngine(lambda: {})
+    engine.MAX_WAITERS = 2
+    threads = park(engine, 2)
+    t0 = time.perf_counter()
+    assert engine.wait(engine.published, 2.0) is None
+    assert time.perf_counter() - t0 < 0.1
+    engine.published += 1; engine.notify()
+    for t in threads: t.join(3)
+    assert engine.wait(engine.published - 1, 0.1) == engine.published
+
+def test_wait_route_answers_503_with_retry_after(server):
+    engine, client = server.render_engine, server.app.test_client()
+    old = engine.MAX_WAITERS
+    engine.MAX_WAITERS = 1
+    try:
+        threads = park(engine, 1)
+        res = client.get(f"/wait?v={engine.published}&timeout=5")
+        assert res.status_code == 503
+        assert int(res.headers["Retry-After"]) == server.WAIT_RETRY_AFTER
+    finally:
+        engine.MAX_WAITERS = old
+        engine.published += 1; engine.notify()
+    for t in threads: t.join(3)
@@ -0,0 +1,33 @@
+import time
+from weather import WeatherProvider
+
+class FlakySource:
+    """Responde uma vez e depois falha sempre, contando os pedidos."""
+
+    def __init__(self): self.calls = 0
+
+    def fetch(self, lat, lon):
+        self.calls += 1
+        if self.calls > 1: raise ConnectionError("API fora do ar")
+        return {"temp": 20.0, "cond": "Limpo", "icon_url": None}
+
+def test_outage_respects_backoff_while_dashboard_polls(tmp_path):
+    source = FlakySource()
+    provider = WeatherProvider(source=source, ttl=0.1, icons_dir=str(tmp_path))
+    provider.BACKOFF_BASE, provider.BACKOFF_MAX = 0.5, 10
+    provider.set_location("-23.5", "-46.6")
+    provider.start()
+    deadline = time.time() + 3.0
+    while time.time() < deadline:
+        provider.current(); time.sleep(0.005)  # dashboard a ler um valor já vencido
+    # 1 sucesso + falhas com backoff de 0.5, 1, 2 s: no máximo 4 pedidos em 3 s
+    assert 2 <= source.calls <= 4
+    assert provider.current()["temp"] == 20.0
+
+def test_new_location_skips_backoff(tmp_path):
+    source = FlakySource(); source.calls = 1
+    provider = WeatherProvider(source=source, ttl=60, icons_dir=str(tmp_path))
+    provider.set_location("1", "1"); assert not provider.refresh()
+    assert provider._next_attempt > time.time()
+    provider.set_location("2", "2")
+    assert provider._next_attempt == 0
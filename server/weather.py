@@ -0,0 +1,106 @@
+import os, threading, time, traceback
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import WEATHER_FETCH_SECONDS, WEATHER_ERRORS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ICONS_DIR = os.path.join(BASE_DIR, "icons")
+
+def make_session():
+    """Sessão HTTP com pool de conexões keep-alive, compartilhada pelas buscas de clima e ícones."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+    session.mount("http://", adapter); session.mount("https://", adapter)
+    return session
+
+def icon_name(url):
+    return url.split('/')[-1].replace('.png', '') if url else None
+
+class WeatherAPISource:
+    """Fonte padrão: weatherapi.com. Qualquer objeto com fetch(lat, lon) pode substituí-la."""
+
+    URL = "http://api.weatherapi.com/v1/current.json?key=4df7b3293f31480b96c115457261002&q={lat},{lon}&lang=pt"
+
+    def __init__(self, session=None, timeout=5):
+        self.session, self.timeout = session or make_session(), timeout
+
+    def fetch(self, lat, lon):
+        r = self.session.get(self.URL.format(lat=lat, lon=lon), timeout=self.timeout)
+        r.raise_for_status(); cur = r.json()['current']
+        return {"temp": cur['temp_c'], "cond": cur['condition']['text'], "icon_url": "https:" + cur['condition']['icon']}
+
+class WeatherProvider:
+    """Mantém o último clima válido e o atualiza em segundo plano.
+
+    current() nunca bloqueia: devolve o último valor bom com a sua idade (stale-while-revalidate).
+    Falhas reagendam a busca com backoff exponencial (nem leituras de um valor vencido a
+    antecipam: _next_attempt só deixa acordar a thread depois do backoff), e o ícone da condição é baixado para
+    server/icons antes de o renderizador precisar dele."""
+
+    BACKOFF_BASE, BACKOFF_MAX = 15, 900
+
+    def __init__(self, source=None, ttl=900, icons_dir=ICONS_DIR, on_update=None):
+        self.session = make_session()
+        self.source = source or WeatherAPISource(self.session)
+        self.ttl, self.icons_dir, self.on_update = ttl, icons_dir, on_update
+        self._wake = threading.Event()
+        self._location, self._value, self._updated, self._next_attempt = None, None, 0, 0
+        self.failures, self.last_error = 0, None
+
+    def set_location(self, lat, lon):
+        if (lat, lon) != self._location:
+            self._location = (lat, lon); self._value = None; self._next_attempt = 0; self._wake.set()
+
+    def current(self):
+        """Último clima conhecido: {'temp', 'cond', 'icon_url', 'age'} (age em segundos ou None)."""
+        v = self._value
+        if v is None:
+            return {"temp": "--", "cond": "Erro API" if self.failures else "Buscando...", "icon_url": None, "age": None}
+        now = time.time()
+        if now - self._updated > self.ttl and now >= self._next_attempt: self._wake.set()
+        return dict(v, age=time.time() - self._updated)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            delay = self.ttl
+            if self._location is not None and time.time() >= self._next_attempt:
+                delay = self.ttl if self.refresh() else self._backoff()
+            elif self._next_attempt: delay = max(0.0, self._next_attempt - time.time())
+            self._wake.wait(delay); self._wake.clear()
+
+    def _backoff(self):
+        return min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (self.failures - 1))
+
+    def refresh(self):
+        """Busca o clima agora (na thread de quem chama). Devolve True em caso de sucesso."""
+        if self._location is None: return False
+        try:
+            with WEATHER_FETCH_SECONDS.time(): v = self.source.fetch(*self._location)
+        except Exception as e:
+            self.failures += 1; self.last_error = str(e); WEATHER_ERRORS.labels("fetch").inc()
+            self._next_attempt = time.time() + self._backoff()
+            return False
+        self.prefetch_icon(v.get("icon_url"))
+        self._value, self._updated = v, time.time()
+        self.failures, self.last_error, self._next_attempt = 0, None, 0
+        if self.on_update:
+            try: self.on_update(v)
+            except Exception: WEATHER_ERRORS.labels("on_update").inc(); traceback.print_exc()
+        return True
+
+    def prefetch_icon(self, url):
+        name = icon_name(url)
+        if not name: return
+        p = os.path.join(self.icons_dir, f"{name}.png")
+        if os.path.exists(p): return
+        try:
+            r = self.session.get(url, timeout=5)
+            if r.status_code == 200:
+                tmp = p + ".tmp"
+                with open(tmp, 'wb') as f: f.write(r.content)
+                os.replace(tmp, p)
+            else: WEATHER_ERRORS.labels("icon").inc()
+        except Exception: WEATHER_ERRORS.labels("icon").inc()